@@ -1,10 +1,18 @@
-from flask import Flask, jsonify, request, Response
+from typing import Dict, Tuple, Union
+import hmac
+import os
+import time
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
 import pandas as pd
 
+from app.utils import memory, metrics, profiling
+from app.utils.streams import streamCounters
 from app.utils.subgraph import KlerosBoardSubgraph
-from app.utils.utils import getHistoryFees, getTimeSerieActiveJurors, chain_names, getTimeSeriePNKStakedPercentage
+from app.utils.utils import getHistoryFees, getTimeSerieActiveJurors, chain_names, getTimeSeriePNKStakedPercentage, \
+    getJurorsLeaderboard, getTimeSerieCoherenceByCourt, getUSDThroughAll, getRollingCases, getRollingTransactions, getTimeSerieCases, \
+    getTimeSerieStakeConcentration, getTimeSerieStakeHistogram
 
 app = Flask(import_name=__name__)
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
@@ -17,12 +25,138 @@ swagger_ui_blueprint = get_swaggerui_blueprint(
 )
 app.register_blueprint(swagger_ui_blueprint, url_prefix=SWAGGER_URL)
 
+# modes of the profiled requests, enabled with the profile query param or the
+# X-Profile header and the X-Admin-Token header equal to the ADMIN_TOKEN env var
+PROFILE_MODES = ('tree', 'folded', 'cprofile')
+
+
+@app.before_request
+def start_timer() -> None:
+    request.start_time = time.perf_counter()
+
+
+@app.before_request
+def start_profile() -> Union[Response, None]:
+    mode: Union[str, None] = request.args.get('profile', request.headers.get('X-Profile'))
+    if mode is None:
+        return None
+    admin_token: str = os.getenv('ADMIN_TOKEN', '')
+    if admin_token == '' or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return 'Forbidden', 403
+    if mode not in PROFILE_MODES:
+        return f'profile must be one of {", ".join(PROFILE_MODES)}', 400
+    request.profile_mode = mode
+    request.profile_token = profiling.start(f'{request.method} {request.path}')
+    if mode == 'cprofile':
+        request.call_profile = profiling.CallProfile().__enter__()
+    return None
+
+
+@app.after_request
+def stop_profile(response: Response) -> Response:
+    profile: Union[profiling.Profile, None] = _stopProfile()
+    if profile is None:
+        return response
+    if request.profile_mode == 'cprofile':
+        return Response(request.call_profile.report(), mimetype='text/plain')
+    if request.profile_mode == 'folded':
+        return Response(profile.folded(), mimetype='text/plain')
+    return jsonify({"data": profile.toDict(), "status": response.status_code})
+
+
+@app.teardown_request
+def teardown_measures(error) -> None:
+    # the after_request hooks don't run if the view raised
+    _stopProfile()
+    measure = getattr(request, 'memory_measure', None)
+    if measure is not None:
+        memory.stop(measure)
+
+
+def _stopProfile() -> Union[profiling.Profile, None]:
+    token = getattr(request, 'profile_token', None)
+    if token is None:
+        return None
+    request.profile_token = None
+    if request.profile_mode == 'cprofile':
+        request.call_profile.__exit__(None, None, None)
+    return profiling.stop(token)
+
+
+WINDOW_ERROR = 'window must be a positive number of days'
+
+
+def parseWindow(window: Union[str, None]) -> Union[int, None]:
+    "days of the window param of the history routes, ValueError if it isn't a positive integer"
+    if window is None:
+        return None
+    if not window.isdigit() or int(window) < 1:
+        raise ValueError(WINDOW_ERROR)
+    return int(window)
+
+
+# routes that switch to a low memory path themselves when over MEMORY_BUDGET_MB,
+# instead of being rejected
+LOW_MEMORY_ROUTES = ('/history/transactions/<int:chainId>',)
+
+
+def _routeLabels() -> Tuple[str, str]:
+    "route rule and chain name of the current request, for the metrics"
+    route: str = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    chain: str = chain_names.get((request.view_args or {}).get('chainId'), '')
+    return route, chain
+
+
+@app.before_request
+def check_memory_budget() -> Union[Response, None]:
+    route, chain = _routeLabels()
+    if route not in LOW_MEMORY_ROUTES and not memory.fits(route, chain):
+        metrics.memory_budget_rejections.labels(route, chain, 'rejected').inc()
+        return 'Memory budget exceeded', 503
+    request.memory_measure = memory.start(route, chain)
+    return None
+
+
+@app.errorhandler(memory.MemoryBudgetExceeded)
+def memory_budget_exceeded(error) -> Tuple[str, int]:
+    # aborted while running, the next calls are rejected or use their low memory path
+    route, chain = _routeLabels()
+    metrics.memory_budget_rejections.labels(route, chain, 'aborted').inc()
+    return 'Memory budget exceeded', 503
+
+
+@app.after_request
+def observe_latency(response: Response) -> Response:
+    start = getattr(request, 'start_time', None)
+    if start is None:
+        return response
+    route, chain = _routeLabels()
+    metrics.request_latency.labels(route, chain, str(response.status_code)).observe(
+        time.perf_counter() - start)
+    return response
+
+
+@app.after_request
+def observe_memory(response: Response) -> Response:
+    measure = getattr(request, 'memory_measure', None)
+    if measure is not None:
+        request.memory_measure = None
+        route, chain = _routeLabels()
+        metrics.request_peak_memory.labels(route, chain).observe(memory.stop(measure))
+    return response
+
 
 @app.route("/status")
 def home() -> Response:
     return jsonify({"Message": "API up and running"})
 
 
+@app.route("/metrics")
+def get_metrics() -> Response:
+    exposition: Dict = metrics.exposition()
+    return Response(exposition['body'], content_type=exposition['content_type'])
+
+
 @app.route("/counters/<int:chainId>", methods=["GET"])
 def get_counters(chainId: int) -> Response:
     chain: str = chain_names.get(chainId, None)
@@ -33,6 +167,17 @@ def get_counters(chainId: int) -> Response:
     counters = kb.getKlerosCounters()
     return jsonify({"data": counters})
 
+
+@app.route("/stream/counters/<int:chainId>", methods=["GET"])
+def stream_counters(chainId: int) -> Response:
+    chain: str = chain_names.get(chainId, None)
+    if chain is None:
+        return 'Chain not found', 400
+
+    return Response(stream_with_context(streamCounters(chain)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route("/history/active-jurors/<int:chainId>", methods=["GET"])
 def get_history_active_jurors(chainId: int) -> Response:
     chain: str = chain_names.get(chainId, None)
@@ -63,10 +208,21 @@ def get_history_transactions(chainId: int) -> Response:
     if chain is None:
         return 'Chain not found', 400
     freq: str = request.args.get(key='freq', default='M')
+    try:
+        window: Union[int, None] = parseWindow(request.args.get('window'))
+    except ValueError:
+        return WINDOW_ERROR, 400
 
+    if window is not None:
+        return jsonify({"data": getRollingTransactions(chain, window, freq).to_json()})
     kb = KlerosBoardSubgraph(network=chain)
-    txs: pd.DataFrame = kb.getAllTransactions()
-    resampled_txs = txs.resample(freq, on='timestamp').count()
+    if memory.fits('getAllTransactions', chain):
+        txs: pd.DataFrame = kb.getAllTransactions()
+        resampled_txs = txs.resample(freq, on='timestamp').count()
+    else:
+        # the whole history didn't fit in MEMORY_BUDGET_MB last time, count it by pages
+        metrics.memory_budget_rejections.labels(request.url_rule.rule, chain, 'low_memory').inc()
+        resampled_txs = kb.getTransactionsCount(freq)
 
     return jsonify({"data": resampled_txs.to_json()})
 
@@ -76,9 +232,27 @@ def get_history_fees(chainId: int) -> Response:
     if chain is None:
         return 'Chain not found', 400
     freq: str = request.args.get(key='freq', default='M')
+    try:
+        window: Union[int, None] = parseWindow(request.args.get('window'))
+    except ValueError:
+        return WINDOW_ERROR, 400
 
-    df: pd.DataFrame = getHistoryFees(chain, freq)
-    return jsonify({"data": df.to_json()})
+    df: pd.DataFrame = getHistoryFees(chain, freq, window)
+    with profiling.span('serialize'):
+        return jsonify({"data": df.to_json()})
+
+
+@app.route("/history/fees/by-court/<int:chainId>", methods=["GET"])
+def get_history_fees_by_court(chainId: int) -> Response:
+    chain: str = chain_names.get(chainId, None)
+    if chain is None:
+        return 'Chain not found', 400
+    freq: str = request.args.get(key='freq', default='M')
+
+    usd_through: Dict[str, pd.DataFrame] = getUSDThroughAll(chain, by='subcourtID', freq=freq)
+    with profiling.span('serialize'):
+        return jsonify({"data": usd_through['serie'].to_json(),
+                        "totals": usd_through['totals'].to_json(orient='index')})
 
 
 @app.route("/history/cases/<int:chainId>", methods=["GET"])
@@ -87,14 +261,16 @@ def get_history_cases(chainId: int) -> Response:
     if chain is None:
         return 'Chain not found', 400
     freq: str = request.args.get(key='freq', default='M')
+    try:
+        window: Union[int, None] = parseWindow(request.args.get('window'))
+    except ValueError:
+        return WINDOW_ERROR, 400
 
-    kb = KlerosBoardSubgraph(network=chain)
-    df_disputes = pd.DataFrame(data=kb.getAllDisputes())
-    df_disputes['startTime'] = pd.to_datetime(df_disputes['startTime'], unit='s')
-    df_disputes.sort_values(by='startTime', ascending=True, inplace=True)
-    df_disputes: pd.DataFrame = df_disputes[['id', 'startTime']].resample(rule=freq, on='startTime').count()
-    df_disputes.rename(columns={'id': 'cases'}, inplace=True)
-    return jsonify({"data": df_disputes.to_json()})
+    if window is not None:
+        df_cases: pd.DataFrame = getRollingCases(chain, window, freq)
+    else:
+        df_cases = getTimeSerieCases(chain, freq)
+    return jsonify({"data": df_cases.to_json()})
 
 
 @app.route("/history/staked-percentage/<int:chainId>", methods=["GET"])
@@ -108,5 +284,51 @@ def get_history_staked_percentage(chainId: int) -> Response:
     return jsonify({"data": df.to_json()})
 
 
+@app.route("/history/coherence/<int:chainId>", methods=["GET"])
+def get_history_coherence(chainId: int) -> Response:
+    chain: str = chain_names.get(chainId, None)
+    if chain is None:
+        return 'Chain not found', 400
+    freq: str = request.args.get(key='freq', default='M')
+
+    df: pd.DataFrame = getTimeSerieCoherenceByCourt(chain, freq)
+    return jsonify({"data": df.to_json()})
+
+
+@app.route("/history/concentration/<int:chainId>", methods=["GET"])
+def get_history_concentration(chainId: int) -> Response:
+    chain: str = chain_names.get(chainId, None)
+    if chain is None:
+        return 'Chain not found', 400
+    freq: str = request.args.get(key='freq', default='M')
+    court: Union[int, None] = request.args.get(key='court', default=None, type=int)
+
+    df: pd.DataFrame = getTimeSerieStakeConcentration(chain, freq, court)
+    return jsonify({"data": df.to_json()})
+
+
+@app.route("/history/stake-distribution/<int:chainId>", methods=["GET"])
+def get_history_stake_distribution(chainId: int) -> Response:
+    chain: str = chain_names.get(chainId, None)
+    if chain is None:
+        return 'Chain not found', 400
+    freq: str = request.args.get(key='freq', default='M')
+
+    df: pd.DataFrame = getTimeSerieStakeHistogram(chain, freq)
+    # period x bin matrix, for a heatmap
+    return jsonify({"data": df.to_json(orient='split')})
+
+
+@app.route("/leaderboard/jurors/<int:chainId>", methods=["GET"])
+def get_leaderboard_jurors(chainId: int) -> Response:
+    chain: str = chain_names.get(chainId, None)
+    if chain is None:
+        return 'Chain not found', 400
+    limit: int = request.args.get(key='limit', default=100, type=int)
+
+    df: pd.DataFrame = getJurorsLeaderboard(chain)
+    return jsonify({"data": df.head(limit).to_json(orient='index')})
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8080)
@@ -0,0 +1,158 @@
+"""
+ASGI entry point of the API. The routes below are served async: they await
+the subgraph on the event loop, fetching the frames of a chain
+concurrently, and run the pandas computations in threads, so one worker
+serves many slow requests at once. The other routes, and the profiled
+requests, are served by the Flask app.
+
+    uvicorn app.asgi:app --port 8080
+    WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py app.asgi:app
+"""
+from typing import Awaitable, Callable, Dict, List, Pattern, Tuple, Union
+import asyncio
+import json
+import logging
+import re
+import time
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+import pandas as pd
+
+from app.app import WINDOW_ERROR, app as flask_app, parseWindow
+from app.utils import metrics
+from app.utils.async_subgraph import AsyncKlerosBoardSubgraph, closeClient
+from app.utils.dataset import getDataset
+from app.utils.utils import chain_names, getHistoryFees, getRollingCases, getTimeSerieActiveJurors, \
+    getTimeSerieCases, getTimeSeriePNKStakedPercentage
+
+# status, body and content type of a response
+Response = Tuple[int, bytes, str]
+Handler = Callable[[str, Dict[str, str]], Awaitable[Response]]
+
+
+def _json(data: Dict, status: int = 200) -> Response:
+    # the same compact format as flask.jsonify
+    return status, (json.dumps(data, separators=(',', ':')) + '\n').encode(), 'application/json'
+
+
+def _text(message: str, status: int) -> Response:
+    return status, message.encode(), 'text/html; charset=utf-8'
+
+
+async def get_counters(chain: str, args: Dict[str, str]) -> Response:
+    counters = await AsyncKlerosBoardSubgraph(chain).getKlerosCounters()
+    return _json({"data": counters})
+
+
+async def get_history_cases(chain: str, args: Dict[str, str]) -> Response:
+    freq: str = args.get('freq', 'M')
+    try:
+        window: Union[int, None] = parseWindow(args.get('window'))
+    except ValueError:
+        return _text(WINDOW_ERROR, 400)
+    await getDataset(chain).arefreshIfStale()
+
+    def cases() -> str:
+        if window is not None:
+            return getRollingCases(chain, window, freq).to_json()
+        return getTimeSerieCases(chain, freq).to_json()
+    return _json({"data": await asyncio.to_thread(cases)})
+
+
+def _seriesRoute(serie: Callable[..., pd.DataFrame], windowed: bool = False) -> Handler:
+    """async route of a series of the dataset of the chain, as the Flask one.
+    With windowed, the window param is passed to the series too."""
+    async def handler(chain: str, args: Dict[str, str]) -> Response:
+        freq: str = args.get('freq', 'M')
+        window_args: Dict[str, Union[int, None]] = {}
+        if windowed:
+            try:
+                window_args['window'] = parseWindow(args.get('window'))
+            except ValueError:
+                return _text(WINDOW_ERROR, 400)
+        # the frames are fetched here without blocking, the series is computed
+        # (or taken from the cache) and serialized in a thread.
+        await getDataset(chain).arefreshIfStale()
+        data: str = await asyncio.to_thread(lambda: serie(chain, freq, **window_args).to_json())
+        return _json({"data": data})
+    handler.__name__ = serie.__name__
+    return handler
+
+
+routes: List[Tuple[str, Handler]] = [
+    ('/counters/<int:chainId>', get_counters),
+    ('/history/active-jurors/<int:chainId>', _seriesRoute(getTimeSerieActiveJurors)),
+    ('/history/fees/<int:chainId>', _seriesRoute(getHistoryFees, windowed=True)),
+    ('/history/cases/<int:chainId>', get_history_cases),
+    ('/history/staked-percentage/<int:chainId>', _seriesRoute(getTimeSeriePNKStakedPercentage)),
+]
+
+
+class AsyncApp():
+    """
+    Raw ASGI app with the async routes, the other requests are passed to the
+    WSGI app (run in a thread by asgiref).
+    """
+
+    def __init__(self, wsgi_app, routes: List[Tuple[str, Handler]]) -> None:
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.wsgi = WsgiToAsgi(wsgi_app)
+        self.routes: List[Tuple[Pattern, str, Handler]] = [
+            (re.compile('^' + rule.replace('<int:chainId>', r'(?P<chainId>\d+)') + '$'), rule, handler)
+            for rule, handler in routes]
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET' and not self._profiled(scope):
+            for pattern, rule, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match is not None:
+                    return await self._serve(scope, send, rule, handler, int(match['chainId']))
+        await self.wsgi(scope, receive, send)
+
+    @staticmethod
+    def _profiled(scope) -> bool:
+        "the profiled requests go to the Flask app, where the profiling is"
+        return b'profile=' in scope['query_string'] or \
+            any(name == b'x-profile' for name, _ in scope['headers'])
+
+    async def _serve(self, scope, send, rule: str, handler: Handler, chainId: int) -> None:
+        start = time.perf_counter()
+        chain: str = chain_names.get(chainId, None)
+        args = {key: values[-1] for key, values in parse_qs(scope['query_string'].decode()).items()}
+        if chain is None:
+            status, body, content_type = _text('Chain not found', 400)
+        else:
+            try:
+                status, body, content_type = await handler(chain, args)
+            except asyncio.CancelledError:
+                # the client disconnected: nothing to send, the server is
+                # waiting for the cancellation to end the task
+                metrics.request_latency.labels(rule, chain, '499').observe(time.perf_counter() - start)
+                raise
+            except Exception:
+                self.logger.exception('Exception on %s', scope['path'])
+                status, body, content_type = _text('Internal Server Error', 500)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', content_type.encode()),
+                                (b'content-length', str(len(body)).encode()),
+                                (b'access-control-allow-origin', b'*')]})
+        await send({'type': 'http.response.body', 'body': body})
+        metrics.request_latency.labels(rule, chain or '', str(status)).observe(
+            time.perf_counter() - start)
+
+    @staticmethod
+    async def _lifespan(receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await closeClient()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncApp(flask_app, routes)
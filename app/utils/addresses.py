@@ -0,0 +1,115 @@
+from typing import Dict, Iterable, Literal, Union
+import threading
+import numpy as np
+import pandas as pd
+
+
+class AddressBook():
+    """
+    Interning table of the addresses of one chain. Every address gets a dense
+    int32 id, in order of appearance, shared by all the dataframes of the chain
+    so grouping, joins and set operations can run on integers.
+
+    The dictionary adopted from a columnar store stays the mapped array of
+    fixed-width bytes, and only the addresses of the ids asked are decoded.
+    Its index is built when an address is encoded, by the process that
+    parses the subgraph.
+    """
+
+    def __init__(self) -> None:
+        self._index: Union[pd.Index, None] = pd.Index([], dtype=object)
+        # the dictionary as bytes ('S'), adopted and not indexed yet
+        self._mapped: Union[np.ndarray, None] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._mapped) if self._mapped is not None else len(self._index)
+
+    def __getitem__(self, ids: Iterable[int]) -> np.ndarray:
+        "the addresses of the ids, as decode"
+        return self.decode(ids)
+
+    def _indexed(self) -> pd.Index:
+        # with the lock held
+        if self._mapped is not None:
+            self._index = pd.Index(self._mapped.astype(str), dtype=object)
+            self._mapped = None
+        return self._index
+
+    @property
+    def addresses(self) -> np.ndarray:
+        "the dictionary, the address of the id i is addresses[i]"
+        with self._lock:
+            return self._indexed().to_numpy()
+
+    def encode(self, addresses: Iterable[str]) -> np.ndarray:
+        "return the ids of the addresses, adding the unknown ones to the table"
+        values = pd.Index(addresses, dtype=object).str.lower()
+        with self._lock:
+            index = self._indexed()
+            ids = index.get_indexer(values)
+            missing = ids == -1
+            if missing.any():
+                new = values[missing].unique()
+                self._index = index.append(new)
+                ids[missing] = self._index.get_indexer(values[missing])
+        return ids.astype(np.int32)
+
+    def adopt(self, addresses: np.ndarray) -> bool:
+        """use the dictionary of another process, as bytes (a columnar store,
+        kept as is) or str (a snapshot). False if it doesn't extend this one,
+        the ids given before are then invalid."""
+        with self._lock:
+            known = self._mapped if self._mapped is not None else \
+                np.asarray(self._index.to_numpy(), dtype='S')
+            extends = len(addresses) >= len(known) and \
+                bool((known == np.asarray(addresses[:len(known)], dtype='S')).all())
+            if addresses.dtype.kind == 'S':
+                self._mapped, self._index = addresses, None
+            else:
+                self._mapped, self._index = None, pd.Index(addresses, dtype=object)
+        return extends
+
+    def decode(self, ids: Iterable[int]) -> np.ndarray:
+        "return the addresses of the ids"
+        ids = np.asarray(ids)
+        with self._lock:
+            if self._mapped is not None:
+                return self._mapped[ids].astype(str).astype(object)
+            return self._index.to_numpy()[ids]
+
+
+_address_books: Dict[str, AddressBook] = {}
+_address_books_lock = threading.Lock()
+
+
+def getAddressBook(network: Literal['mainnet', 'gnosis']) -> AddressBook:
+    "return the shared address book of the chain"
+    with _address_books_lock:
+        if network not in _address_books:
+            _address_books[network] = AddressBook()
+        return _address_books[network]
+
+
+def internAddresses(df: pd.DataFrame, network: Literal['mainnet', 'gnosis']) -> pd.DataFrame:
+    """replace the address column of the frame with the address_id column, the
+    ids of the address book of the network, and the network column (a single
+    category, one byte by row) that tells which book decodes them. A column
+    and not an attr, as concat and the other operations keep it"""
+    df['address_id'] = getAddressBook(network).encode(df['address'])
+    df['network'] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[network])
+    return df.drop(columns='address')
+
+
+def frameNetwork(df: pd.DataFrame) -> str:
+    "the network of the address book of the address_id column of the frame"
+    if 'network' not in df.columns:
+        # saved before the network column
+        return df.attrs['network']
+    column = df['network']
+    networks = column.cat.categories if isinstance(column.dtype, pd.CategoricalDtype) \
+        else column.dropna().unique()
+    if len(networks) != 1:
+        raise ValueError(f'The address ids of the frame are of {len(networks)} networks')
+    return str(networks[0])
@@ -0,0 +1,143 @@
+from typing import Deque, Dict, List, Literal, Union
+from collections import deque
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+import pandas as pd
+
+from app.utils import metrics, profiling
+from app.utils.singleflight import singleflight
+from app.utils.subgraph import KlerosBoardSubgraph, PageWalk, Pages, SubgraphError, prefetch_depth
+
+# size of the pool of connections to the subgraph shared by all the async
+# requests of the process
+max_connections: int = int(os.getenv('SUBGRAPH_MAX_CONNECTIONS', 20))
+timeout: float = float(os.getenv('SUBGRAPH_TIMEOUT', 60))
+
+_client: Union[httpx.AsyncClient, None] = None
+
+
+def getClient() -> httpx.AsyncClient:
+    "the http client of the process, created with the first request"
+    global _client
+    if _client is None:
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections)
+        _client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    return _client
+
+
+async def closeClient() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class AsyncKlerosBoardSubgraph():
+    """
+    Async counterpart of the KlerosBoardSubgraph methods used by the async
+    routes: the same queries and parsers, but the queries are awaited on the
+    shared connection pool, so a worker waits for many of them at once
+    instead of blocking a thread for each one.
+
+    The pages of a collection are pipelined (SUBGRAPH_PREFETCH) and the
+    collections are fetched concurrently, e.g. the disputes and the time
+    periods of the courts. The parsing runs in a thread, not to block the
+    event loop.
+    """
+
+    def __init__(self, network: Literal['mainnet', 'gnosis'] = 'mainnet') -> None:
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.network: Literal['mainnet', 'gnosis'] = network
+        self.kb: KlerosBoardSubgraph = KlerosBoardSubgraph(network=network)
+        self.subgraph_node: str = self.kb.subgraph_node
+
+    async def _post_query(self, query):
+        return self.kb._parseResponse(query, await self._postRaw(query))
+
+    async def _postRaw(self, query) -> Dict:
+        "the response of the query, with its data or its errors"
+        start = time.perf_counter()
+        with profiling.span('post_query'):
+            response: httpx.Response = await getClient().post(self.subgraph_node, json={'query': query})
+            data = response.json()
+        metrics.observeSubgraphQuery(self.network, time.perf_counter() - start,
+                                     len(response.content), 'data' not in data)
+        return data
+
+    async def _paginate(self, pages: Pages) -> List[Dict]:
+        """all the items of the collection, as Subgraph._paginate, with the
+        pages requested ahead posted in tasks"""
+        block = None
+        if prefetch_depth > 0:
+            block = await self.getBlockNumber()
+            if block is None:
+                raise SubgraphError('The block of the subgraph is unknown')
+        walk = PageWalk(pages, prefetch_depth, block)
+        items = []
+        inflight: Deque[asyncio.Task] = deque(asyncio.create_task(self._postRaw(query))
+                                              for query in walk.requests())
+        try:
+            while not walk.done:
+                items.extend(walk.receive(await inflight.popleft()))
+                inflight.extend(asyncio.create_task(self._postRaw(query)) for query in walk.requests())
+        finally:
+            for task in inflight:
+                task.cancel()
+            metrics.observePrefetchDiscarded(self.network, len(inflight))
+        return items
+
+    async def getBlockNumber(self) -> Union[int, None]:
+        "Return the last block indexed by the subgraph"
+        result = await self._post_query('{_meta{block{number}}}')
+        if result is None:
+            return None
+        return int(result['_meta']['block']['number'])
+
+    async def getKlerosCounters(self):
+        result = await self._post_query(self.kb.counters_query)
+        if result is not None:
+            return self.kb._parseKlerosCounters(result['klerosCounters'][0])
+        return result
+
+    async def getTimePeriodsAllCourts(self):
+        return self.kb._parseTimePeriods(await self._post_query(self.kb.time_periods_query))
+
+    @singleflight
+    @metrics.trackQueries
+    async def getAllDisputesFrame(self) -> pd.DataFrame:
+        disputes, courtTimePeriods = await asyncio.gather(
+            self._paginate(self.kb._disputesPages()), self.getTimePeriodsAllCourts())
+        return await asyncio.to_thread(self.kb._parseDisputesFrame, disputes, courtTimePeriods)
+
+    @singleflight
+    @metrics.trackQueries
+    async def getAllDrawsFrame(self, since: int = 0) -> pd.DataFrame:
+        draws = await self._paginate(self.kb._drawsPages(since))
+        return await asyncio.to_thread(self._intern, self.kb._parseDrawsFrame, draws)
+
+    @singleflight
+    @metrics.trackQueries
+    async def getAllStakeSetsFrame(self, since: int = 0) -> pd.DataFrame:
+        stakes = await self._paginate(self.kb._stakeSetsPages(since))
+        return await asyncio.to_thread(self._intern, self.kb._parseStakeSetsFrame, stakes)
+
+    @singleflight
+    @metrics.trackQueries
+    async def getAllTransfersFrame(self, since: int = 0) -> pd.DataFrame:
+        transfers = await self._paginate(self.kb._transfersPages(since))
+        return await asyncio.to_thread(self._intern, self.kb._parseTransfersFrame, transfers)
+
+    @singleflight
+    @metrics.trackQueries
+    async def getAllVotesFrame(self, since: int = 0) -> pd.DataFrame:
+        votes = await self._paginate(self.kb._votesPages(since))
+        return await asyncio.to_thread(self._intern, self.kb._parseVotesFrame, votes)
+
+    def _intern(self, parse, items: List[Dict]) -> pd.DataFrame:
+        "parse the items into a frame with the address ids, in a thread"
+        return self.kb._internAddresses(parse(items))
@@ -0,0 +1,448 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Literal, Tuple, Union
+import asyncio
+import fcntl
+import functools
+import importlib
+import inspect
+import logging
+import os
+import pickle
+import threading
+import time
+
+import pandas as pd
+
+from app.utils.addresses import getAddressBook
+from app.utils.singleflight import callKey, share
+from app.utils.store import ColumnarStore
+from app.utils.subgraph import KlerosBoardSubgraph, SubgraphError
+
+# seconds before the data of a chain is refreshed again, with a delta fetch
+ttl: float = float(os.getenv('DATASET_TTL', 60))
+# SNAPSHOT_PATH is the file where the datasets and the series are saved every
+# SNAPSHOT_INTERVAL seconds, by one process at a time, and loaded at boot.
+# Unset, or with STORE_DIR set (the store keeps its generations), nothing is
+# saved.
+snapshot_path: Union[str, None] = os.getenv('SNAPSHOT_PATH')
+snapshot_interval: float = float(os.getenv('SNAPSHOT_INTERVAL', 3600))
+# STORE_DIR is the directory of the memory-mapped columnar stores shared by
+# the workers, see ColumnarStore. Unset, every process keeps its own frames.
+store_dir: Union[str, None] = os.getenv('STORE_DIR')
+# SERIES_CACHE_SIZE is the number of series cached by chain, the least
+# recently used ones are dropped first.
+series_cache_size: int = int(os.getenv('SERIES_CACHE_SIZE', 256))
+
+
+class ChainDataset():
+    """
+    The columnar datasets of one chain (the frames of the getAll*Frame methods
+    of the subgraph) and the series computed from them.
+
+    The first refresh fetches the whole history, the next ones only the
+    entities with timestamp >= the newest one already loaded: stake sets,
+    transfers and draws are never modified, the votes are fetched again when
+    cast and the disputes, which change of period, are small and fetched whole.
+    The series are cached by the version of the data they were computed from,
+    which the refreshes that change the frames bump.
+
+    With STORE_DIR set, one process at a time (the one holding the updater
+    lock of the chain store) fetches the delta and publishes the frames in
+    the store, the others just map the last published generation.
+    """
+    # frame: column with the timestamp of the entities, None for the frames
+    # fetched whole at every refresh
+    frames: Dict[str, Union[str, None]] = {
+        'disputes': None,
+        'stake_sets': 'timestamp',
+        'votes': 'timestamp',
+        'transfers': 'timestamp',
+        'draws': 'timestamp'}
+
+    def __init__(self, network: Literal['mainnet', 'gnosis']) -> None:
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.network: Literal['mainnet', 'gnosis'] = network
+        self.block: Union[int, None] = None
+        # bumped by the refreshes that changed the frames
+        self.version: int = 0
+        self.refreshed_at: float = 0.
+        self._frames: Dict[str, pd.DataFrame] = {}
+        # key: (version, result, (module, name, args, kwargs) of the call),
+        # from the least to the most recently used
+        self._series: 'OrderedDict[str, Tuple[int, Any, Tuple]]' = OrderedDict()
+        self._series_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # the thread refreshing the frames while the requests use the current ones
+        self._refresher: Union[threading.Thread, None] = None
+        self._refresher_lock = threading.Lock()
+        self.store: Union[ColumnarStore, None] = \
+            ColumnarStore(store_dir, network) if store_dir is not None else None
+        self.generation: Union[str, None] = None
+        # the generation was read whole, with the strings decoded
+        self._full: bool = False
+        self._written_at: float = 0.
+
+    def __getstate__(self) -> Dict:
+        with self._series_lock:
+            series = OrderedDict(self._series)
+        # the address book that gave the address_id of the frames, to give
+        # the next ids of the deltas after the snapshot is loaded
+        return {'network': self.network, 'block': self.block, 'version': self.version,
+                'frames': self._frames, 'series': series,
+                'addresses': getAddressBook(self.network).addresses}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__init__(state['network'])
+        if 'addresses' not in state:
+            # saved without the address book, its address ids can't be
+            # extended: the data is fetched again instead
+            return
+        if not getAddressBook(self.network).adopt(state['addresses']):
+            self.logger.warning('The address book of %s was replaced by the one of the snapshot',
+                                self.network)
+        self.block, self.version = state['block'], state['version']
+        self._frames = state['frames']
+        self._series = OrderedDict(state['series'])
+
+    def _fetch(self, kb: KlerosBoardSubgraph, name: str, since: int) -> pd.DataFrame:
+        # kb may be an AsyncKlerosBoardSubgraph too, then it returns a coroutine
+        if name == 'disputes':
+            return kb.getAllDisputesFrame()
+        fetch = {'stake_sets': kb.getAllStakeSetsFrame,
+                 'votes': kb.getAllVotesFrame,
+                 'transfers': kb.getAllTransfersFrame,
+                 'draws': kb.getAllDrawsFrame}[name]
+        return fetch(since=since)
+
+    def stale(self) -> bool:
+        return time.time() - self.refreshed_at > ttl
+
+    def refresh(self, force: bool = True) -> None:
+        """fetch the entities newer than the loaded ones, the whole history the
+        first time. Not forced, only if still stale once the lock is taken:
+        the thread that waited for it has the data just refreshed"""
+        with self._refresh_lock:
+            if not force and not self.stale():
+                return
+            if self.store is None:
+                self._fetchDelta()
+            else:
+                self._refreshStore()
+            self.refreshed_at = time.time()
+
+    def _refreshInBackground(self) -> None:
+        "start the thread refreshing the frames, if it isn't running"
+        with self._refresher_lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._backgroundRefresh, daemon=True,
+                                               name=f'refresh-{self.network}')
+            self._refresher.start()
+
+    def _backgroundRefresh(self) -> None:
+        try:
+            self.refresh(force=False)
+        except Exception:
+            # the current data is kept, the refresh is tried again after DATASET_TTL
+            self.logger.exception('Error refreshing the %s dataset', self.network)
+            self.refreshed_at = time.time()
+            return
+        _saveSnapshotIfDue()
+
+    async def arefresh(self, force: bool = True) -> None:
+        """refresh for the async routes: the deltas of all the frames are
+        fetched concurrently, without blocking the event loop. With a store
+        the refresh runs in a thread, the updater lock is a file lock."""
+        if self.store is not None:
+            await asyncio.to_thread(self.refresh, force)
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            # another thread or task is refreshing, wait for it in a thread.
+            await asyncio.to_thread(self._waitRefresh)
+            return
+        try:
+            if not force and not self.stale():
+                return
+            await self._afetchDelta()
+            self.refreshed_at = time.time()
+        finally:
+            self._refresh_lock.release()
+
+    def _refreshStore(self) -> None:
+        # with nothing published yet, wait for the updater instead of
+        # fetching the whole history in every worker.
+        if not self.store.lock(blocking=self.store.current() is None):
+            self._open()
+            return
+        try:
+            self._open(full=True)
+            if self.generation is not None and \
+                    time.time() - self._written_at <= ttl:
+                # published by another process while this one was waiting
+                return
+            self._fetchDelta()
+            self.store.write(self._frames, getAddressBook(self.network).addresses,
+                             {'block': self.block, 'version': self.version})
+        finally:
+            # map the published frames instead of keeping them in the heap
+            self._open()
+            self.store.unlock()
+
+    def _open(self, full: bool = False) -> None:
+        """map the last generation published in the store, if it's a new one.
+        full for the updater, with the ids and the strings to merge the delta"""
+        generation = self.store.current()
+        if generation is None or (generation == self.generation and full == self._full):
+            return
+        frames, addresses, meta = self.store.read(generation, lazy=not full)
+        if not getAddressBook(self.network).adopt(addresses):
+            self.logger.warning('The address book of %s was replaced by the one of the store',
+                                self.network)
+        self._frames, self.block, self.version = frames, meta['block'], meta.get('version', 0)
+        self.generation, self._written_at = generation, meta['written_at']
+        self._full = full
+
+    def _fetchDelta(self) -> None:
+        """fetch the delta from the subgraph and merge it into the frames. If
+        a query fails it raises SubgraphError, and the frames, the block and
+        the version are the ones before"""
+        kb = KlerosBoardSubgraph(network=self.network)
+        # the block is read first, so the data is at least as new as it.
+        block = self._checkBlock(kb.getBlockNumber())
+        deltas = {name: self._fetch(kb, name, since) for name, since in self._sinces().items()}
+        self._merge(deltas, block)
+        self._observeLag(block)
+
+    @staticmethod
+    def _checkBlock(block: Union[int, None]) -> int:
+        if block is None:
+            raise SubgraphError('The block of the subgraph is unknown')
+        return block
+
+    def _waitRefresh(self) -> None:
+        self.refresh(force=False)
+
+    async def _afetchDelta(self) -> None:
+        "_fetchDelta with the frames fetched concurrently"
+        # imported here, httpx is only needed by the async routes
+        from app.utils.async_subgraph import AsyncKlerosBoardSubgraph
+
+        kb = AsyncKlerosBoardSubgraph(network=self.network)
+        block = self._checkBlock(await kb.getBlockNumber())
+        sinces = self._sinces()
+        tasks = [asyncio.ensure_future(self._fetch(kb, name, since)) for name, since in sinces.items()]
+        try:
+            fetched = await asyncio.gather(*tasks)
+        finally:
+            # the others are useless once one failed
+            for task in tasks:
+                task.cancel()
+        await asyncio.to_thread(self._merge, dict(zip(sinces, fetched)), block)
+        await asyncio.to_thread(self._observeLag, block)
+
+    def _observeLag(self, block: int) -> None:
+        "the lag of the subgraph, measured by the refreshes and not by the /metrics scrapes"
+        try:
+            KlerosBoardSubgraph(network=self.network).observeLag(block)
+        except Exception:
+            self.logger.warning('Error reading the head of the %s chain', self.network, exc_info=True)
+
+    def _sinces(self) -> Dict[str, int]:
+        "timestamp (unit s) from which to fetch each frame, 0 to fetch it whole"
+        sinces = {}
+        for name, timestamp in self.frames.items():
+            old = self._frames.get(name)
+            if old is None or timestamp is None or len(old) == 0:
+                sinces[name] = 0
+            else:
+                sinces[name] = int(old[timestamp].max().timestamp())
+        return sinces
+
+    def _merge(self, deltas: Dict[str, pd.DataFrame], block: int) -> None:
+        "merge the fetched deltas into the frames"
+        frames = {}
+        for name, timestamp in self.frames.items():
+            old, delta = self._frames.get(name), deltas[name]
+            if old is None or timestamp is None or len(old) == 0:
+                frames[name] = delta
+                continue
+            frame = pd.concat([old, delta], ignore_index=True)
+            frame = frame.drop_duplicates(subset='id', keep='last')
+            frame.attrs = old.attrs
+            frames[name] = frame.sort_values(by=timestamp, kind='stable', ignore_index=True)
+        self._updateVotes(frames)
+        # the deltas start at the newest entities already loaded, so they are
+        # never empty: the data changed if any frame isn't the same
+        changed = any(name not in self._frames or not frame.equals(self._frames[name])
+                      for name, frame in frames.items())
+        self._frames = frames
+        self.block = block
+        if changed:
+            self.version += 1
+
+    @staticmethod
+    def _updateVotes(frames: Dict[str, pd.DataFrame]) -> None:
+        "the ruling of the disputes of the old votes may have changed since they were fetched"
+        disputes = frames['disputes'].set_index('id')
+        votes = frames['votes']
+        for column in ['currentRulling', 'ruled']:
+            updated = votes['disputeID'].map(disputes[column])
+            votes[column] = updated.where(updated.notna(), votes[column]).astype(votes[column].dtype)
+
+    def refreshIfStale(self) -> None:
+        """refresh the frames older than DATASET_TTL in a thread, meanwhile the
+        current ones are used. Only the first load is waited for"""
+        if not self.stale():
+            return
+        if len(self._frames) > 0:
+            self._refreshInBackground()
+            return
+        self.refresh(force=False)
+
+    async def arefreshIfStale(self) -> None:
+        if not self.stale():
+            return
+        if len(self._frames) > 0:
+            self._refreshInBackground()
+            return
+        await self.arefresh(force=False)
+
+    def versionedFrames(self) -> Tuple[int, Dict[str, pd.DataFrame]]:
+        """the version and the frames, without refreshing them. The version
+        is read first, _merge bumps it after replacing the frames: the frames
+        are at least as new as it"""
+        version = self.version
+        return version, dict(self._frames)
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """the frame of the chain, refreshed if older than DATASET_TTL. A
+        shallow copy, so the callers can sort it or add columns"""
+        self.refreshIfStale()
+        return self._frames[name].copy(deep=False)
+
+    def cached(self, key: str, compute: Callable, call: Tuple) -> Any:
+        "result of compute(), computed again only if the data changed"
+        self.refreshIfStale()
+        version = self.version
+        with self._series_lock:
+            cached = self._series.get(key)
+            if cached is not None:
+                self._series.move_to_end(key)
+        if cached is not None and cached[0] == version:
+            return share(cached[1])
+        result = compute()
+        with self._series_lock:
+            self._series[key] = (version, share(result), call)
+            self._series.move_to_end(key)
+            while len(self._series) > series_cache_size:
+                self._series.popitem(last=False)
+        return result
+
+    def previous(self, key: str) -> Any:
+        "the last cached result of key, of any version, None if there is none"
+        with self._series_lock:
+            cached = self._series.get(key)
+        return share(cached[1]) if cached is not None else None
+
+    def staleCalls(self) -> List[Tuple[Callable, Tuple, Dict]]:
+        "the calls of the cached series of an older version, to compute them again"
+        with self._series_lock:
+            series = list(self._series.values())
+        return [(getattr(importlib.import_module(module), name), args, kwargs)
+                for version, _, (module, name, args, kwargs) in series
+                if version != self.version]
+
+
+_datasets: Dict[str, ChainDataset] = {}
+_datasets_lock = threading.Lock()
+
+
+def getDataset(network: Literal['mainnet', 'gnosis']) -> ChainDataset:
+    "return the dataset of the chain shared by the whole process"
+    with _datasets_lock:
+        if network not in _datasets:
+            _datasets[network] = ChainDataset(network)
+        return _datasets[network]
+
+
+def cachedSeries(fn: Callable) -> Callable:
+    """decorator of the series computed from the dataset of the chain param,
+    the result is cached until the data of the chain changes."""
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        dataset = getDataset(bound.arguments['chain'])
+        # the call is saved by name, to be made again by warmStart() after a snapshot
+        call = (fn.__module__, fn.__qualname__, args, kwargs)
+        return dataset.cached(callKey(fn, args, kwargs), functools.partial(fn, *args, **kwargs), call)
+    return wrapper
+
+
+def saveSnapshot(path: Union[str, None] = None) -> None:
+    "write the datasets and series of all the chains, atomically"
+    path = path or snapshot_path
+    if path is None:
+        return
+    with _datasets_lock:
+        datasets = {network: dataset for network, dataset in _datasets.items()
+                    if dataset.block is not None}
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as snapshot_file:
+        pickle.dump(datasets, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def _saveSnapshotIfDue() -> None:
+    """save the snapshot if older than SNAPSHOT_INTERVAL. The workers share
+    it: the first one to take its lock saves it, and its age is the one of
+    the file, so the others find it saved"""
+    if snapshot_path is None or store_dir is not None:
+        return
+    with open(f'{snapshot_path}.lock', 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        try:
+            if time.time() - os.path.getmtime(snapshot_path) <= snapshot_interval:
+                return
+        except FileNotFoundError:
+            pass
+        saveSnapshot()
+
+
+def loadSnapshot(path: Union[str, None] = None) -> bool:
+    "load the datasets and series saved by saveSnapshot, False if there is none"
+    path = path or snapshot_path
+    if path is None or not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as snapshot_file:
+        datasets: Dict[str, ChainDataset] = pickle.load(snapshot_file)
+    with _datasets_lock:
+        _datasets.update(datasets)
+    return True
+
+
+def warmStart(networks: Tuple[str, ...] = ('mainnet', 'gnosis')) -> None:
+    """load the snapshot, fetch the delta of every chain since it was saved and
+    compute again its series, in parallel. Called by gunicorn before forking
+    the workers (preload_app), so they start with the data in memory, shared
+    copy-on-write."""
+    # imported here, the executor depends on this module
+    from app.utils.executor import precompute
+
+    logger = logging.getLogger(__name__)
+    loadSnapshot()
+    calls = []
+    for network in networks:
+        dataset = getDataset(network)
+        try:
+            dataset.refresh()
+        except Exception:
+            logger.exception('Error refreshing the %s dataset', network)
+            continue
+        calls.extend(dataset.staleCalls())
+    precompute(calls)
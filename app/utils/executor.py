@@ -0,0 +1,152 @@
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+import atexit
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+
+from app.utils.addresses import getAddressBook
+from app.utils.dataset import ChainDataset, getDataset, store_dir
+from app.utils.store import ColumnarStore
+
+# COMPUTE_PROCESSES is the number of processes of the pool where the heavy
+# computations run, so they don't hold the GIL of the worker. 0 (the default)
+# runs them in the thread of the request.
+pool_size: int = int(os.getenv('COMPUTE_PROCESSES', 0))
+
+_pool: Union[concurrent.futures.ProcessPoolExecutor, None] = None
+_pool_lock = threading.Lock()
+# network: (version, root, generation) of the frames exported for the pool
+_exported: Dict[str, Tuple[int, str, str]] = {}
+_export_lock = threading.Lock()
+_export_root: Union[str, None] = None
+
+
+def _getPool() -> concurrent.futures.ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # not forked from the worker and its threads
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['app.utils.utils'])
+            _pool = concurrent.futures.ProcessPoolExecutor(max_workers=pool_size, mp_context=context)
+        return _pool
+
+
+def _published(dataset: ChainDataset) -> Tuple[str, str]:
+    """root and generation of a columnar store with the frames of the dataset,
+    for the processes of the pool to map them: the shared store if there is
+    one, else a private copy in shared memory (/dev/shm) made again only when
+    the data changed (ChainDataset.version), not at every refresh."""
+    global _export_root
+    dataset.refreshIfStale()
+    if dataset.generation is not None:
+        return store_dir, dataset.generation
+    with _export_lock:
+        version, frames = dataset.versionedFrames()
+        exported = _exported.get(dataset.network)
+        if exported is not None and exported[0] == version:
+            return exported[1], exported[2]
+        if _export_root is None:
+            shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            _export_root = tempfile.mkdtemp(prefix='kleros-stats-', dir=shm)
+            atexit.register(_removeExports, os.getpid(), _export_root)
+        generation = ColumnarStore(_export_root, dataset.network).write(
+            frames, getAddressBook(dataset.network).addresses,
+            {'block': dataset.block, 'version': version})
+        _exported[dataset.network] = (version, _export_root, generation)
+        return _export_root, generation
+
+
+def _removeExports(pid: int, root: str) -> None:
+    # only in the process that made them, not in the forked gunicorn workers
+    if os.getpid() == pid:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def shutdown() -> None:
+    """stop the pool and remove the exported frames, e.g. in the gunicorn
+    master after precomputing the series, before forking the workers"""
+    global _pool, _export_root
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+    with _export_lock:
+        if _export_root is not None:
+            shutil.rmtree(_export_root, ignore_errors=True)
+            _export_root = None
+        _exported.clear()
+
+
+def _afterFork() -> None:
+    # the pool of the parent (e.g. the gunicorn master) can't be used in a
+    # child, and its exports are removed at its exit: every process exports
+    # the frames in its own directory
+    global _pool, _pool_lock, _export_lock, _export_root, _exported
+    _pool, _pool_lock = None, threading.Lock()
+    _export_lock, _export_root, _exported = threading.Lock(), None, {}
+
+
+os.register_at_fork(after_in_child=_afterFork)
+
+
+@functools.lru_cache(maxsize=4)
+def _mapped(root: str, network: str, generation: str) -> Dict[str, pd.DataFrame]:
+    "frames of a generation, mapped once by each process of the pool"
+    frames, addresses, _ = ColumnarStore(root, network).read(generation, lazy=True)
+    getAddressBook(network).adopt(addresses)
+    return frames
+
+
+def _run(fn: Callable, root: str, network: str, generation: str,
+         frames: Dict[str, str], args: Tuple, kwargs: Dict) -> Any:
+    "runs in the pool"
+    mapped = _mapped(root, network, generation)
+    inputs = {param: mapped[name].copy(deep=False) for param, name in frames.items()}
+    return fn(*args, **inputs, **kwargs)
+
+
+def compute(fn: Callable, chain: str, frames: Dict[str, str], *args, **kwargs) -> Any:
+    """
+    Call fn with the frames of the dataset of the chain and the other args.
+    With COMPUTE_PROCESSES > 0 it runs in the process pool, where the frames
+    are mapped from a columnar store instead of pickled, only the other args
+    and the result are.
+    inputs:
+        fn: a function of the module level, e.g. getTimeSerieActiveJurorsFromStakes
+        frames: param of fn: name of the frame in the dataset, e.g. {'df': 'stake_sets'}
+    """
+    dataset = getDataset(chain)
+    if pool_size == 0:
+        inputs = {param: dataset.frame(name) for param, name in frames.items()}
+        return fn(*args, **inputs, **kwargs)
+    root, generation = _published(dataset)
+    future = _getPool().submit(_run, fn, root, chain, generation, frames, args, kwargs)
+    return future.result()
+
+
+def precompute(calls: Iterable[Tuple[Callable, Tuple, Dict]], max_workers: Union[int, None] = None) -> List[Any]:
+    """
+    Make the independent calls (e.g. every series of every chain) in
+    parallel, each one dispatching its computation to the pool. The results,
+    or the exceptions, are returned in order.
+    """
+    logger = logging.getLogger(__name__)
+    calls = list(calls)
+    workers = max_workers or max(pool_size, 1) * 2
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as threads:
+        futures = [threads.submit(fn, *args, **kwargs) for fn, args, kwargs in calls]
+    results = []
+    for (fn, args, kwargs), future in zip(calls, futures):
+        error = future.exception()
+        if error is not None:
+            logger.error('Error precomputing %s%s: %s', fn.__name__, args, error)
+        results.append(error if error is not None else future.result())
+    return results
@@ -0,0 +1,218 @@
+from typing import Dict, List, Tuple, Union
+import ctypes
+import fcntl
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# Set MEMORY_TRACKING=1 to record the peak allocation of the routes and the
+# computations (tracemalloc slows down the allocations), it is enabled too
+# when MEMORY_BUDGET_MB is set.
+# MEMORY_BUDGET_MB is the budget of a request: the heavy computations whose
+# last peak was above it switch to their low memory path, or the request is
+# rejected, instead of letting the worker be killed. The calls going over it
+# are aborted (MemoryBudgetExceeded), checked every MEMORY_BUDGET_CHECK seconds.
+budget: Union[int, None] = int(float(os.environ['MEMORY_BUDGET_MB']) * 2**20) \
+    if os.getenv('MEMORY_BUDGET_MB') else None
+# seconds after which a call over the budget is let through once, to measure
+# its peak again: the data, and so the peak, may have changed since.
+retry_interval: float = float(os.getenv('MEMORY_BUDGET_RETRY', 300))
+check_interval: float = float(os.getenv('MEMORY_BUDGET_CHECK', 0.1))
+# MEMORY_PEAKS_PATH is a json file where the peaks over the budget are kept,
+# shared by the workers and kept across their restarts, so a call that got a
+# worker killed isn't let in again by the next one. It can be written before
+# the boot to seed them. Unset, every process keeps its own.
+peaks_path: Union[str, None] = os.getenv('MEMORY_PEAKS_PATH')
+tracking: bool = os.getenv('MEMORY_TRACKING', '0') not in ('', '0') or budget is not None
+
+if tracking and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+class MemoryBudgetExceeded(Exception):
+    "raised in the thread of a call whose allocations went over MEMORY_BUDGET_MB"
+
+
+class _Measure():
+    def __init__(self, name: str, chain: str) -> None:
+        self.name: str = name
+        self.chain: str = chain
+        self.start: int = 0
+        self.max: int = 0
+        self.peak: Union[int, None] = None
+        self.thread: int = threading.get_ident()
+        # another thread measured at the same time
+        self.overlapped: bool = False
+        # MemoryBudgetExceeded was raised in its thread
+        self.aborted: bool = False
+
+
+# the measures in progress in all the threads. tracemalloc has a single peak
+# per process, so before it is reset the peak is folded into every measure in
+# progress. Under concurrency the peak of a measure includes the allocations
+# of the other threads, it is an upper bound: it's recorded only if it fits
+# the budget, which it proves, or if no other thread overlapped it. The
+# measures nested in the same thread (a computation in a route) don't count
+# as overlapping, their allocations are the ones of the outer call.
+_measures: List[_Measure] = []
+_lock = threading.Lock()
+# last peak of each (name, chain) and the time (unix) it was recorded, or retried
+_peaks: Dict[Tuple[str, str], Tuple[int, float]] = {}
+# modification time of MEMORY_PEAKS_PATH when it was last read
+_loaded_at: float = 0.
+_watchdog: Union[threading.Thread, None] = None
+
+
+def _foldPeak() -> int:
+    current, peak = tracemalloc.get_traced_memory()
+    for measure in _measures:
+        measure.max = max(measure.max, peak)
+    return current
+
+
+def start(name: str, chain: str = '') -> Union[_Measure, None]:
+    "start measuring the peak allocation of name, None if not tracking"
+    if not tracking:
+        return None
+    measure = _Measure(name, chain)
+    with _lock:
+        _foldPeak()
+        tracemalloc.reset_peak()
+        measure.start = measure.max = tracemalloc.get_traced_memory()[0]
+        for other in _measures:
+            if other.thread != measure.thread:
+                other.overlapped = measure.overlapped = True
+        _measures.append(measure)
+        if budget is not None:
+            _startWatchdog()
+    return measure
+
+
+def stop(measure: _Measure) -> int:
+    "return the peak allocation in bytes since start, over the allocated at start"
+    with _lock:
+        _foldPeak()
+        if measure in _measures:
+            _measures.remove(measure)
+        if measure.aborted and not any(other.aborted and other.thread == measure.thread
+                                       for other in _measures):
+            # the call ended before the exception was raised
+            _raiseIn(measure.thread, None)
+        measure.peak = measure.max - measure.start
+        if not measure.overlapped or budget is None or measure.peak <= budget:
+            _record(measure, measure.peak)
+    return measure.peak
+
+
+def _record(measure: _Measure, peak: int) -> None:
+    key = (measure.name, measure.chain)
+    last = _peaks.get(key)
+    _peaks[key] = (peak, time.time())
+    if budget is not None and (peak > budget or (last is not None and last[0] > budget)):
+        _save()
+
+
+def _startWatchdog() -> None:
+    # a thread of the parent isn't running in a forked worker
+    global _watchdog
+    if _watchdog is None or not _watchdog.is_alive():
+        _watchdog = threading.Thread(target=_watch, name='memory-budget', daemon=True)
+        _watchdog.start()
+
+
+def _watch() -> None:
+    while True:
+        time.sleep(check_interval)
+        with _lock:
+            if budget is not None:
+                _abortOverBudget()
+
+
+def _abortOverBudget() -> None:
+    """raise MemoryBudgetExceeded in the threads of the calls over the budget.
+    Under concurrency the allocations since the start of a call include the
+    ones of the other threads: it's aborted if they are over the budget times
+    the number of threads with calls in progress, then at least one of them
+    went over it."""
+    _foldPeak()
+    threads = {measure.thread for measure in _measures}
+    aborted = set()
+    for measure in _measures:
+        peak = measure.max - measure.start
+        if measure.aborted or peak <= budget * len(threads):
+            continue
+        measure.aborted = True
+        _record(measure, peak)
+        if measure.thread not in aborted:
+            aborted.add(measure.thread)
+            _raiseIn(measure.thread, MemoryBudgetExceeded)
+
+
+def _raiseIn(thread: int, exception: Union[type, None]) -> None:
+    "raise the exception in the thread at its next bytecode, None to cancel the pending one"
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread), ctypes.py_object(exception) if exception is not None else None)
+
+
+def _load() -> None:
+    "merge the peaks of MEMORY_PEAKS_PATH recorded by the other processes, if it changed"
+    global _loaded_at
+    if peaks_path is None:
+        return
+    try:
+        modified_at = os.stat(peaks_path).st_mtime
+        if modified_at == _loaded_at:
+            return
+        with open(peaks_path) as peaks_file:
+            records = json.load(peaks_file)
+    except (OSError, ValueError):
+        return
+    _loaded_at = modified_at
+    for name, chain, peak, recorded_at in records:
+        last = _peaks.get((name, chain))
+        if last is None or last[1] < recorded_at:
+            _peaks[(name, chain)] = (peak, recorded_at)
+
+
+def _save() -> None:
+    "write the peaks to MEMORY_PEAKS_PATH, merged with the ones of the other processes"
+    global _loaded_at
+    if peaks_path is None:
+        return
+    with open(f'{peaks_path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            _load()
+            tmp_path = f'{peaks_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as peaks_file:
+                json.dump([[name, chain, peak, recorded_at]
+                           for (name, chain), (peak, recorded_at) in _peaks.items()], peaks_file)
+            os.replace(tmp_path, peaks_path)
+            _loaded_at = os.stat(peaks_path).st_mtime
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def lastPeak(name: str, chain: str = '') -> Union[int, None]:
+    last = _peaks.get((name, chain))
+    return last[0] if last is not None else None
+
+
+def fits(name: str, chain: str = '') -> bool:
+    """False if the last peak of name was above the budget, except once every
+    retry_interval seconds, to measure it again"""
+    if budget is None:
+        return True
+    with _lock:
+        _load()
+        last = _peaks.get((name, chain))
+        if last is None or last[0] <= budget:
+            return True
+        if time.time() - last[1] < retry_interval:
+            return False
+        # this call measures it again, the next ones wait for the next interval
+        _peaks[(name, chain)] = (last[0], time.time())
+        _save()
+        return True
@@ -0,0 +1,185 @@
+from typing import Callable, Dict, Union
+import contextvars
+import functools
+import inspect
+import os
+import time
+
+import pandas as pd
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter,
+                               Gauge, Histogram, generate_latest, multiprocess)
+
+from app.utils import memory, profiling
+from app.utils.addresses import frameNetwork
+
+# With gunicorn, set PROMETHEUS_MULTIPROC_DIR to a directory shared by the
+# workers so /metrics aggregates all of them.
+
+request_latency = Histogram(
+    'kleros_stats_request_seconds', 'Latency of the API routes',
+    ['route', 'chain', 'status'])
+subgraph_queries = Counter(
+    'kleros_stats_subgraph_queries_total', 'Queries posted to the subgraph',
+    ['chain', 'method'])
+subgraph_errors = Counter(
+    'kleros_stats_subgraph_errors_total', 'Queries to the subgraph that returned errors',
+    ['chain', 'method'])
+subgraph_bytes = Counter(
+    'kleros_stats_subgraph_response_bytes_total', 'Bytes received from the subgraph',
+    ['chain', 'method'])
+subgraph_query_latency = Histogram(
+    'kleros_stats_subgraph_query_seconds', 'Latency of each query to the subgraph',
+    ['chain', 'method'])
+subgraph_pages = Histogram(
+    'kleros_stats_subgraph_pages', 'Pages queried by each call of a getAll* method',
+    ['chain', 'method'], buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000))
+subgraph_prefetch_discarded = Counter(
+    'kleros_stats_subgraph_prefetch_discarded_total', 'Pages requested ahead and discarded, after the last page',
+    ['chain'])
+# set by the refreshes of the datasets, the last one of any process
+subgraph_lag = Gauge(
+    'kleros_stats_subgraph_lag_blocks', 'Blocks between the chain head and the subgraph',
+    ['chain'], multiprocess_mode='mostrecent')
+coingecko_requests = Counter(
+    'kleros_stats_coingecko_requests_total', 'Requests to CoinGecko',
+    ['endpoint', 'status'])
+coingecko_rate_limited = Counter(
+    'kleros_stats_coingecko_rate_limited_total', 'Requests to CoinGecko rejected by rate limit',
+    ['endpoint'])
+compute_latency = Histogram(
+    'kleros_stats_compute_seconds', 'Time spent in the pandas computations of app.utils.utils',
+    ['function', 'chain'])
+_memory_buckets = tuple(2**20 * 4**i for i in range(7))
+request_peak_memory = Histogram(
+    'kleros_stats_request_peak_memory_bytes', 'Peak allocation of the API routes (MEMORY_TRACKING)',
+    ['route', 'chain'], buckets=_memory_buckets)
+compute_peak_memory = Histogram(
+    'kleros_stats_compute_peak_memory_bytes', 'Peak allocation of the timed computations (MEMORY_TRACKING)',
+    ['function', 'chain'], buckets=_memory_buckets)
+memory_budget_rejections = Counter(
+    'kleros_stats_memory_budget_rejections_total', 'Requests rejected, aborted or switched to a low memory path by MEMORY_BUDGET_MB',
+    ['route', 'chain', 'action'])
+cache_requests = Counter(
+    'kleros_stats_cache_requests_total', 'Lookups in the caches, by result (hit or miss)',
+    ['cache', 'result'])
+
+# the getAll* method running in the current context, to label the queries
+# posted by _postRaw.
+_subgraph_method: contextvars.ContextVar = contextvars.ContextVar('subgraph_method', default=None)
+
+
+class _MethodCall():
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.pages: int = 0
+
+
+def currentSubgraphMethod() -> str:
+    call = _subgraph_method.get()
+    return 'other' if call is None else call.name
+
+
+def observeSubgraphQuery(chain: str, seconds: float, size: int, error: bool) -> None:
+    "called by Subgraph._postRaw for each query posted"
+    call = _subgraph_method.get()
+    method = 'other' if call is None else call.name
+    if call is not None:
+        call.pages += 1
+    subgraph_queries.labels(chain, method).inc()
+    subgraph_bytes.labels(chain, method).inc(size)
+    subgraph_query_latency.labels(chain, method).observe(seconds)
+    if error:
+        subgraph_errors.labels(chain, method).inc()
+
+
+def trackQueries(fn: Callable) -> Callable:
+    """decorator of the subgraph methods, the queries posted inside are
+    labelled with the method name and the number of pages is observed.
+    The calls are recorded as spans too in the profiled requests.
+    The async methods are tracked the same way."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def asyncWrapper(self, *args, **kwargs):
+            with profiling.span(fn.__qualname__):
+                if _subgraph_method.get() is not None:
+                    return await fn(self, *args, **kwargs)
+                call = _MethodCall(fn.__name__)
+                token = _subgraph_method.set(call)
+                try:
+                    return await fn(self, *args, **kwargs)
+                finally:
+                    _subgraph_method.reset(token)
+                    subgraph_pages.labels(self.network, call.name).observe(call.pages)
+        return asyncWrapper
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with profiling.span(fn.__qualname__):
+            if _subgraph_method.get() is not None:
+                # nested in another tracked method, counted there.
+                return fn(self, *args, **kwargs)
+            call = _MethodCall(fn.__name__)
+            token = _subgraph_method.set(call)
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                _subgraph_method.reset(token)
+                subgraph_pages.labels(self.network, call.name).observe(call.pages)
+    return wrapper
+
+
+def _chainOf(bound: inspect.BoundArguments) -> str:
+    "chain of the call, from the chain param or from the network of a subgraph frame"
+    if 'chain' in bound.arguments:
+        return str(bound.arguments['chain'])
+    if 'self' in bound.arguments and hasattr(bound.arguments['self'], 'network'):
+        return bound.arguments['self'].network
+    for value in bound.arguments.values():
+        if isinstance(value, pd.DataFrame) and 'address_id' in value.columns:
+            return frameNetwork(value)
+    return ''
+
+
+def timed(fn: Callable) -> Callable:
+    """decorator to observe the compute time of the function, labelled by chain,
+    and its peak allocation if the memory is tracked.
+    The calls are recorded as spans too in the profiled requests."""
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        chain = _chainOf(signature.bind(*args, **kwargs))
+        measure = memory.start(fn.__name__, chain)
+        start = time.perf_counter()
+        try:
+            with profiling.span(fn.__qualname__):
+                return fn(*args, **kwargs)
+        finally:
+            compute_latency.labels(fn.__name__, chain).observe(time.perf_counter() - start)
+            if measure is not None:
+                compute_peak_memory.labels(fn.__name__, chain).observe(memory.stop(measure))
+    return wrapper
+
+
+def observePrefetchDiscarded(chain: str, pages: int) -> None:
+    if pages > 0:
+        subgraph_prefetch_discarded.labels(chain).inc(pages)
+
+
+def observeCoinGecko(endpoint: str, status: int) -> None:
+    coingecko_requests.labels(endpoint, str(status)).inc()
+    if status == 429:
+        coingecko_rate_limited.labels(endpoint).inc()
+
+
+def observeCache(cache: str, hit: bool) -> None:
+    cache_requests.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def exposition() -> Dict[str, Union[bytes, str]]:
+    "body and content type of the /metrics response"
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return {'body': generate_latest(registry), 'content_type': CONTENT_TYPE_LATEST}
+    return {'body': generate_latest(), 'content_type': CONTENT_TYPE_LATEST}
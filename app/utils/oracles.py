@@ -5,6 +5,8 @@ import os
 import json
 from datetime import datetime
 
+from app.utils import metrics, profiling
+
 
 class CMC():
     """
@@ -59,7 +61,14 @@ class CoinGecko():
     """
 
     def __init__(self) -> None:
-        self.api_url = "https://api.coingecko.com/api/v3/"
+        self.api_url = os.getenv('COINGECKO_API', "https://api.coingecko.com/api/v3/")
+
+    @staticmethod
+    def _get(url, headers, endpoint) -> requests.Response:
+        with profiling.span(f'coingecko.{endpoint}'):
+            response = requests.get(url, headers=headers)
+        metrics.observeCoinGecko(endpoint, response.status_code)
+        return response
 
     def _getCryptoHistoric(self, id="kleros", vs_currency='usd', days=360) -> Dict:
         parameters = {'localization': False,
@@ -70,7 +79,7 @@ class CoinGecko():
         }
         url = self.api_url + 'coins/{}/market_chart?'.format(id) \
             + urllib.parse.urlencode(parameters)
-        response = requests.get(url, headers=headers)
+        response = self._get(url, headers, 'market_chart')
         return response.json()
 
     def _getCryptoOldPrice(self, date, id="kleros", vs_currency='usd') -> float or None: # type: ignore
@@ -82,7 +91,7 @@ class CoinGecko():
         }
         url = self.api_url + 'coins/{}/history?'.format(id) \
             + urllib.parse.urlencode(parameters)
-        response = requests.get(url, headers=headers).json()
+        response = self._get(url, headers, 'history').json()
         if 'market_data' in response.keys():
             return response['market_data']['current_price']['usd']
         return None
@@ -98,7 +107,7 @@ class CoinGecko():
           'Accepts': 'application/json',
         }
         url = self.api_url + 'coins/{}?'.format(id) + urllib.parse.urlencode(parameters)
-        response = requests.get(url, headers=headers)
+        response = self._get(url, headers, 'coins')
         return response.json()
 
     def getPNKprice(self) -> float:
@@ -0,0 +1,101 @@
+from bisect import bisect_left
+from typing import List, Tuple
+
+
+class OrderStatistics():
+    """
+    Multiset of non-negative integers (e.g. the stakes of the jurors in gwei)
+    over a known set of values, in two Fenwick trees (counts and sums by rank
+    of value). Adding or removing a value is O(log n), and so are the order
+    statistics of the stake concentration: the sum of the k smallest or
+    largest values, the number of largest values holding over half of the
+    total, and the Gini numerator sum(i * x_(i)) (x ascending, i from 1),
+    kept up to date on every change. Sums are exact, in python ints.
+
+    inputs:
+        values: every value that will be added, sorted and unique
+    """
+
+    def __init__(self, values: List[int]) -> None:
+        self.values: List[int] = list(values)
+        self.size: int = len(self.values)
+        self._counts: List[int] = [0] * (self.size + 1)
+        self._sums: List[int] = [0] * (self.size + 1)
+        self._top_step: int = 1 << (self.size.bit_length() - 1) if self.size > 0 else 0
+        self.count: int = 0
+        self.total: int = 0
+        self.weighted: int = 0
+
+    def _update(self, rank: int, count: int, value: int) -> None:
+        while rank <= self.size:
+            self._counts[rank] += count
+            self._sums[rank] += value
+            rank += rank & -rank
+
+    def _prefix(self, rank: int) -> Tuple[int, int]:
+        "count and sum of the values of rank <= rank"
+        count = total = 0
+        while rank > 0:
+            count += self._counts[rank]
+            total += self._sums[rank]
+            rank -= rank & -rank
+        return count, total
+
+    def add(self, value: int) -> None:
+        # the new value goes after its equals, the larger ones move up one position
+        rank = bisect_left(self.values, value) + 1
+        below_count, below_sum = self._prefix(rank)
+        self.weighted += value * (below_count + 1) + self.total - below_sum
+        self._update(rank, 1, value)
+        self.count += 1
+        self.total += value
+
+    def remove(self, value: int) -> None:
+        rank = bisect_left(self.values, value) + 1
+        self._update(rank, -1, -value)
+        self.count -= 1
+        self.total -= value
+        below_count, below_sum = self._prefix(rank)
+        self.weighted -= value * (below_count + 1) + self.total - below_sum
+
+    def smallest(self, k: int) -> int:
+        "sum of the k smallest values"
+        k = min(max(k, 0), self.count)
+        rank = count = total = 0
+        step = self._top_step
+        while step > 0:
+            if rank + step <= self.size and count + self._counts[rank + step] <= k:
+                rank += step
+                count += self._counts[rank]
+                total += self._sums[rank]
+            step >>= 1
+        # the rest are equal to the next value
+        return total + (k - count) * self.values[rank] if k > count else total
+
+    def largest(self, k: int) -> int:
+        "sum of the k largest values"
+        return self.total - self.smallest(self.count - min(max(k, 0), self.count))
+
+    def nakamoto(self) -> int:
+        "minimum number of the largest values with more than half of the total"
+        if self.total == 0:
+            return 0
+        # the most values from the smallest with 2 * sum < total
+        rank = count = total = 0
+        step = self._top_step
+        while step > 0:
+            if rank + step <= self.size and 2 * (total + self._sums[rank + step]) < self.total:
+                rank += step
+                count += self._counts[rank]
+                total += self._sums[rank]
+            step >>= 1
+        value = self.values[rank] if rank < self.size else 0
+        if value > 0:
+            count += (self.total - 2 * total - 1) // (2 * value)
+        return self.count - count
+
+    def gini(self) -> float:
+        "Gini coefficient of the values, the same as utils.gini"
+        if self.count == 0 or self.total == 0:
+            return float('nan')
+        return (2 * self.weighted / self.total - (self.count + 1)) / self.count
@@ -0,0 +1,48 @@
+from typing import List
+import logging
+
+from app.utils.subgraph import Subgraph
+
+
+class PoHSubgraph(Subgraph):
+    def __init__(self) -> None:
+        super(PoHSubgraph,self).__init__(network='mainnet')
+        self.logger: logging.Logger = logging.getLogger(__name__)
+
+        # Node definitions
+        self.subgraph_name = '61738/proof-of-humanity-mainnet/version/latest'
+        self.subgraph_node += self.subgraph_name
+
+    @staticmethod
+    def _parseSubmission(submission) -> dict:
+        keys = submission.keys()
+        if 'registered' in keys:
+            submission['registered'] = True if submission['registered'] == 'true' else False
+        if 'submissionTime' in keys:
+            submission['submissionTime'] = int(submission['submissionTime'])
+        return submission
+
+    
+    def getAllSubmissions(self, initSubmissionTime: int = 1646282170) -> List[dict]:
+        submissions: List[dict] = []
+        while True:
+            query = (
+                '{submissions('
+                '    where: {status: None, submissionTime_gt: "'+ str(initSubmissionTime)+'", registered: true}'
+                '    first: 1000'
+                '    skip: 0'
+                ') {'
+                '    id'
+                '    registered'
+                '    status'
+                '    submissionTime'
+                '}}'
+            )
+            result = self._post_query(query)
+            if result is None:
+                break
+            else:
+                submissions.extend( result['submissions'])
+                initSubmissionTime = result['submissions'][-1]['submissionTime']
+        parse_submissions: List[dict] = [self._parseSubmission(submission) for submission in submissions]
+        return parse_submissions
@@ -0,0 +1,133 @@
+from typing import Callable, Dict, Iterator, List, Union
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import time
+
+
+class Span():
+    "a named interval of a profiled request and the spans opened inside it"
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.start: float = time.perf_counter()
+        self.end: Union[float, None] = None
+        self.children: List['Span'] = []
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def toDict(self) -> Dict:
+        return {'name': self.name,
+                'ms': round(self.duration * 1000, 3),
+                'children': [child.toDict() for child in self.children]}
+
+    def folded(self, prefix: str = '') -> Iterator[str]:
+        """lines 'root;child;grandchild microseconds' with the self time of
+        each span, the input format of flamegraph.pl and speedscope"""
+        path = f'{prefix};{self.name}' if prefix else self.name
+        self_time = self.duration - sum(child.duration for child in self.children)
+        yield f'{path} {max(int(self_time * 1e6), 0)}'
+        for child in self.children:
+            yield from child.folded(path)
+
+
+class Profile():
+    """
+    Spans of one profiled request. The spans are opened with span() anywhere
+    in the code and nested by the context: the call stack, and the asyncio
+    tasks started inside a span are nested in it. Outside of a profiled
+    request span() does nothing.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.root: Span = Span(name)
+
+    def open(self, name: str, parent: Union[Span, None] = None) -> Span:
+        span = Span(name)
+        (parent or self.root).children.append(span)
+        return span
+
+    def close(self, span: Span) -> None:
+        span.end = time.perf_counter()
+
+    def stop(self) -> None:
+        self.root.end = time.perf_counter()
+
+    def toDict(self) -> Dict:
+        return self.root.toDict()
+
+    def folded(self) -> str:
+        return '\n'.join(self.root.folded()) + '\n'
+
+
+_profile: contextvars.ContextVar = contextvars.ContextVar('profile', default=None)
+# the innermost span open in the current context
+_span: contextvars.ContextVar = contextvars.ContextVar('span', default=None)
+
+
+def currentProfile() -> Union[Profile, None]:
+    return _profile.get()
+
+
+def start(name: str) -> contextvars.Token:
+    "start profiling the spans of the current context"
+    return _profile.set(Profile(name))
+
+
+def stop(token: contextvars.Token) -> Profile:
+    profile = _profile.get()
+    _profile.reset(token)
+    profile.stop()
+    return profile
+
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[None]:
+    "record the block as a span of the profiled request, if any"
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    opened = profile.open(name, _span.get())
+    token = _span.set(opened)
+    try:
+        yield
+    finally:
+        _span.reset(token)
+        profile.close(opened)
+
+
+def spanned(fn: Callable) -> Callable:
+    "decorator to record the calls of fn as spans"
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(fn.__qualname__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class CallProfile():
+    "deterministic profile (cProfile) of a request, for when the spans aren't enough"
+
+    def __init__(self) -> None:
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self) -> 'CallProfile':
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.disable()
+
+    def report(self, limit: int = 50) -> str:
+        "the functions with most cumulative time"
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return output.getvalue()
@@ -0,0 +1,238 @@
+from typing import Any, Callable, Dict, Tuple, Union
+import asyncio
+import fcntl
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.utils import metrics, profiling
+
+
+class _Call():
+    "an in-flight call and the threads waiting for it"
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.waiters: int = 0
+        self.result: Any = None
+        self.error: Union[BaseException, None] = None
+
+
+class _LeaderCancelled(Exception):
+    "set on the future of an async call whose leader was cancelled, for a waiter to make it"
+
+
+class SingleFlight():
+    """
+    Coalesce concurrent identical calls: while a call with some key is running,
+    the other calls with the same key wait and get its result instead of
+    computing it again.
+
+    Within a process the waiters are threads. If store_dir is set, the
+    processes (gunicorn workers) are coalesced too: the leader of each process
+    takes a file lock on the key in store_dir, and a process that waited for
+    that lock reuses the result written by the process that had it, if it was
+    written after its own call started.
+
+    The async calls (doAsync) are coalesced by event loop, the waiters are
+    tasks and they aren't coalesced with other processes, the file lock
+    would block the loop.
+    """
+
+    def __init__(self, store_dir: Union[str, None] = None) -> None:
+        self.store_dir: Union[str, None] = store_dir
+        if self.store_dir is not None:
+            os.makedirs(self.store_dir, exist_ok=True)
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        # (loop, key): [future of the result, number of waiters]
+        self._async_calls: Dict[Tuple[int, str], list] = {}
+
+    async def doAsync(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        loop_key = (id(asyncio.get_running_loop()), key)
+        while True:
+            call = self._async_calls.get(loop_key)
+            metrics.observeCache('singleflight', hit=call is not None)
+            if call is None:
+                break
+            call[1] += 1
+            with profiling.span('singleflight.wait'):
+                try:
+                    # shielded, a cancelled waiter doesn't cancel the leader
+                    return share(await asyncio.shield(call[0]))
+                except _LeaderCancelled:
+                    # the first waiter to wake up makes the call again, the
+                    # others wait for it
+                    continue
+
+        future = asyncio.get_running_loop().create_future()
+        call = self._async_calls[loop_key] = [future, 0]
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as error:
+            # the cancellation of the leader (its client disconnected) is its
+            # own, not the one of the waiters
+            future.set_exception(_LeaderCancelled() if isinstance(error, asyncio.CancelledError) else error)
+            if call[1] == 0:
+                # retrieved, so asyncio doesn't log it as never retrieved
+                future.exception()
+            raise
+        else:
+            future.set_result(share(result) if call[1] > 0 else result)
+        finally:
+            del self._async_calls[loop_key]
+        return result
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        metrics.observeCache('singleflight', hit=not leader)
+        if not leader:
+            with profiling.span('singleflight.wait'):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return share(call.result)
+
+        try:
+            result = self._lead(key, fn, args, kwargs)
+        except BaseException as error:
+            with self._lock:
+                call.error = error
+                del self._calls[key]
+            call.done.set()
+            raise
+        with self._lock:
+            # keep an untouched copy for the waiters, the leader's caller may
+            # modify the result in place. No waiter can join once the call is
+            # removed, in the same lock.
+            call.result = share(result) if call.waiters > 0 else result
+            del self._calls[key]
+        call.done.set()
+        return result
+
+    def _lead(self, key: str, fn: Callable, args, kwargs) -> Any:
+        """
+        The call coalesced with the other processes. A process that finds the
+        lock taken leaves a mark (<digest>.<pid>.wait) before waiting for it,
+        and the one holding it writes the result only if there are marks. The
+        last process out removes the files of the key.
+        """
+        if self.store_dir is None:
+            return fn(*args, **kwargs)
+        started = time.time()
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        lock_path = os.path.join(self.store_dir, digest + '.lock')
+        result_path = os.path.join(self.store_dir, digest + '.pkl')
+        mark_path = os.path.join(self.store_dir, f'{digest}.{os.getpid()}.wait')
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                waited = False
+            except BlockingIOError:
+                open(mark_path, 'a').close()
+                waited = True
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if waited:
+                    os.remove(mark_path)
+                    if os.path.isfile(result_path) and os.path.getmtime(result_path) >= started:
+                        # another process computed it while this one was waiting.
+                        metrics.observeCache('singleflight_store', hit=True)
+                        with open(result_path, 'rb') as result_file:
+                            return pickle.load(result_file)
+                metrics.observeCache('singleflight_store', hit=False)
+                result = fn(*args, **kwargs)
+                if self._waiting(digest):
+                    tmp_path = f'{result_path}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'wb') as result_file:
+                        pickle.dump(result, result_file, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmp_path, result_path)
+                return result
+            finally:
+                if not self._waiting(digest):
+                    for path in (result_path, lock_path):
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _waiting(self, digest: str) -> bool:
+        "another live process waits for the call of the digest"
+        for name in os.listdir(self.store_dir):
+            if not (name.startswith(digest + '.') and name.endswith('.wait')):
+                continue
+            pid = int(name[len(digest) + 1:-len('.wait')])
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                # killed while waiting
+                os.remove(os.path.join(self.store_dir, name))
+                continue
+            except PermissionError:
+                pass
+            return True
+        return False
+
+
+def share(result: Any) -> Any:
+    """copy of the result for another caller: the pandas objects, the arrays
+    and the containers are copied, the other values are immutable"""
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return result.copy()
+    if isinstance(result, dict):
+        return {key: share(value) for key, value in result.items()}
+    if isinstance(result, tuple) and hasattr(result, '_make'):
+        return result._make(share(value) for value in result)
+    if isinstance(result, (list, tuple, set)):
+        return type(result)(share(value) for value in result)
+    return result
+
+
+def _keyPart(value: Any) -> str:
+    # the subgraph instances are identified by their class and network.
+    if hasattr(value, 'network') and hasattr(value, 'subgraph_node'):
+        return f'{type(value).__name__}({value.network})'
+    return repr(value)
+
+
+def callKey(fn: Callable, args, kwargs) -> str:
+    "key of a call, by function, chain and params (with the defaults applied)"
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+    parts = [f'{name}={_keyPart(value)}' for name, value in bound.arguments.items()]
+    return f"{fn.__module__}.{fn.__qualname__}({', '.join(parts)})"
+
+
+flights = SingleFlight(store_dir=os.getenv('SINGLEFLIGHT_DIR'))
+
+
+def singleflight(fn: Callable) -> Callable:
+    """decorator to coalesce the concurrent identical calls of fn, a function
+    or a coroutine function.
+    The params must have a meaningful repr, don't use it with dataframes."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def asyncWrapper(*args, **kwargs):
+            return await flights.doAsync(callKey(fn, args, kwargs), fn, *args, **kwargs)
+        return asyncWrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return flights.do(callKey(fn, args, kwargs), fn, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,155 @@
+from typing import Dict, List, Tuple, Union
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnarStore():
+    """
+    Memory-mapped columnar store of the frames of one chain, shared by the
+    gunicorn workers.
+
+    Every generation is a directory with one .npy file per column, written by
+    a single updater (the process holding the updater lock) and published by
+    replacing the `current` symlink, an atomic rename, so the readers never
+    see a half-written generation. The readers map the numeric, datetime and
+    boolean columns read-only and zero-copy: their pages are shared by all the
+    workers through the page cache. The string columns (ids, arbitrables) are
+    dictionary encoded, the readers map their codes as categoricals and leave
+    out the unique ones (the ids), only the updater decodes them to merge the
+    deltas. The addresses are kept as the ids of the address book, whose
+    dictionary is stored with the generation and mapped as fixed-width bytes.
+    """
+
+    def __init__(self, root: str, network: str) -> None:
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.network: str = network
+        self.path: str = os.path.join(root, network)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_file = None
+
+    def lock(self, blocking: bool = False) -> bool:
+        "take the updater lock, False if another process has it and not blocking"
+        lock_file = open(os.path.join(self.path, '.updater.lock'), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def unlock(self) -> None:
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def current(self) -> Union[str, None]:
+        "name of the published generation, None if there is none yet"
+        try:
+            return os.path.basename(os.readlink(os.path.join(self.path, 'current')))
+        except FileNotFoundError:
+            return None
+
+    def write(self, frames: Dict[str, pd.DataFrame], addresses: np.ndarray, meta: Dict) -> str:
+        "write a new generation and publish it, return its name"
+        generation = f'gen-{time.time_ns()}'
+        directory = os.path.join(self.path, generation)
+        os.makedirs(directory)
+        columns: Dict[str, List[Dict]] = {}
+        for name, frame in frames.items():
+            os.makedirs(os.path.join(directory, name))
+            columns[name] = [self._writeColumn(os.path.join(directory, name), column, frame[column])
+                             for column in frame.columns
+                             if not (column == 'address' and 'address_id' in frame.columns)]
+        np.save(os.path.join(directory, 'addresses.npy'), np.asarray(addresses, dtype='S'))
+        meta = dict(meta, columns=columns, attrs={name: frame.attrs for name, frame in frames.items()},
+                    written_at=time.time())
+        with open(os.path.join(directory, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        # publish it: the symlink is replaced with a rename, which is atomic
+        link = os.path.join(self.path, f'current.{os.getpid()}.tmp')
+        os.symlink(generation, link)
+        os.replace(link, os.path.join(self.path, 'current'))
+        self._removeOld(keep=generation)
+        return generation
+
+    def _removeOld(self, keep: str) -> None:
+        # the previous generation is kept for the readers that are opening it,
+        # the files already mapped stay readable after they are removed.
+        generations = sorted(name for name in os.listdir(self.path) if name.startswith('gen-'))
+        for name in generations[:-2]:
+            if name != keep:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    @staticmethod
+    def _writeColumn(directory: str, name: str, values: pd.Series) -> Dict:
+        dtype = values.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            np.save(os.path.join(directory, f'{name}.npy'), values.cat.codes.to_numpy())
+            return {'name': name, 'kind': 'category', 'ordered': bool(dtype.ordered),
+                    'categories': [str(category) for category in dtype.categories]}
+        if isinstance(dtype, (pd.Int64Dtype, pd.Int32Dtype, pd.BooleanDtype)):
+            array = values.array
+            np.save(os.path.join(directory, f'{name}.npy'), array._data)
+            np.save(os.path.join(directory, f'{name}.mask.npy'), array._mask)
+            return {'name': name, 'kind': 'masked', 'dtype': str(dtype)}
+        if dtype.kind in 'biufmM':
+            np.save(os.path.join(directory, f'{name}.npy'), values.to_numpy())
+            return {'name': name, 'kind': 'numpy'}
+        codes, strings = pd.factorize(values.fillna('').astype(str))
+        np.save(os.path.join(directory, f'{name}.npy'), codes.astype(np.int32))
+        np.save(os.path.join(directory, f'{name}.values.npy'), np.asarray(strings, dtype='S'))
+        return {'name': name, 'kind': 'dictionary', 'unique': len(strings) == len(codes)}
+
+    def read(self, generation: str, lazy: bool = False) -> Tuple[Dict[str, pd.DataFrame], np.ndarray, Dict]:
+        """
+        Open a generation: the frames over the mapped columns, the addresses
+        (as bytes) and the meta.
+        lazy, for the readers: the string columns are categoricals over their
+        mapped codes and the unique ones (the ids) are left out, else they
+        are decoded, as the updater needs them to merge the deltas.
+        """
+        directory = os.path.join(self.path, generation)
+        with open(os.path.join(directory, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+        frames = {}
+        for name, columns in meta['columns'].items():
+            data = {column['name']: self._readColumn(os.path.join(directory, name), column, lazy)
+                    for column in columns if not (lazy and column.get('unique', False))}
+            # copy=False keeps every column in its own mapped block
+            frame = pd.DataFrame(data, copy=False)
+            frame.attrs = meta['attrs'].get(name, {})
+            frames[name] = frame
+        addresses = np.load(os.path.join(directory, 'addresses.npy'), mmap_mode='r')
+        return frames, addresses, meta
+
+    @staticmethod
+    def _readColumn(directory: str, column: Dict, lazy: bool):
+        path = os.path.join(directory, f"{column['name']}.npy")
+        if column['kind'] == 'string':
+            # written before the dictionary encoding
+            return np.load(path).astype(str).astype(object)
+        values = np.load(path, mmap_mode='r')
+        if column['kind'] == 'dictionary':
+            strings = np.load(os.path.join(directory, f"{column['name']}.values.npy")).astype(str)
+            if lazy:
+                return pd.Categorical.from_codes(values, categories=pd.Index(strings, dtype=object))
+            return strings.astype(object)[values]
+        if column['kind'] == 'category':
+            dtype = pd.CategoricalDtype(column['categories'], ordered=column['ordered'])
+            return pd.Categorical.from_codes(values, dtype=dtype)
+        if column['kind'] == 'masked':
+            mask = np.load(os.path.join(directory, f"{column['name']}.mask.npy"), mmap_mode='r')
+            if column['dtype'] == 'boolean':
+                return pd.arrays.BooleanArray(values, mask)
+            return pd.arrays.IntegerArray(values, mask)
+        return values
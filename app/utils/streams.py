@@ -0,0 +1,130 @@
+from typing import Dict, Iterator, List, Literal, Union
+import json
+import logging
+import os
+import queue
+import threading
+
+from app.utils.subgraph import KlerosBoardSubgraph
+
+# seconds between polls of the subgraph, about the block time of each chain.
+poll_intervals: Dict[str, float] = {'mainnet': 12., 'gnosis': 5.}
+
+
+class CountersPoller():
+    """
+    Shared poller of the klerosCounters of one chain. It watches the block of
+    the subgraph and pushes to every subscriber only the counters that changed,
+    so the upstream cost is one query per poll no matter the number of clients.
+    The polling thread runs only while there are subscribers.
+    """
+
+    def __init__(self, network: Literal['mainnet', 'gnosis'], interval: Union[float, None] = None) -> None:
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.network: Literal['mainnet', 'gnosis'] = network
+        if interval is None:
+            interval = float(os.getenv('COUNTERS_POLL_INTERVAL', poll_intervals.get(network, 12.)))
+        self.interval: float = interval
+        self.block: Union[int, None] = None
+        self.counters: Union[Dict, None] = None
+        self._subscribers: List[queue.Queue] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+
+    def subscribe(self) -> queue.Queue:
+        "return the queue where the events for a new client are pushed"
+        subscriber: queue.Queue = queue.Queue(maxsize=100)
+        with self._lock:
+            if self.counters is not None:
+                subscriber.put(self._event('snapshot', self.counters))
+            self._subscribers.append(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name=f'counters-poller-{self.network}')
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+            if len(self._subscribers) == 0:
+                self._wake.set()
+
+    def _event(self, event: str, counters: Dict) -> Dict:
+        return {'event': event, 'block': self.block, 'data': counters}
+
+    def _broadcast(self, event: Dict) -> None:
+        with self._lock:
+            for subscriber in self._subscribers:
+                try:
+                    subscriber.put_nowait(event)
+                except queue.Full:
+                    # slow client, drop the pending diffs and resync it.
+                    while not subscriber.empty():
+                        subscriber.get_nowait()
+                    subscriber.put_nowait(self._event('snapshot', self.counters))
+
+    def poll(self) -> None:
+        "query the subgraph once and broadcast the diff if the block changed"
+        block, counters = KlerosBoardSubgraph(network=self.network).getKlerosCountersAndBlock()
+        if block is None or block == self.block:
+            return
+        if self.counters is None:
+            diff = counters
+        else:
+            diff = {key: value for key, value in counters.items()
+                    if self.counters.get(key) != value}
+        first = self.counters is None
+        with self._lock:
+            self.block, self.counters = block, counters
+        if len(diff) > 0:
+            self._broadcast(self._event('snapshot' if first else 'diff', diff))
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if len(self._subscribers) == 0:
+                    self._thread = None
+                    self._wake.clear()
+                    return
+            try:
+                self.poll()
+            except Exception:
+                self.logger.exception('Error polling the klerosCounters of %s', self.network)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+_pollers: Dict[str, CountersPoller] = {}
+_pollers_lock = threading.Lock()
+
+
+def getCountersPoller(network: Literal['mainnet', 'gnosis']) -> CountersPoller:
+    "return the poller of the chain shared by all the clients of this process"
+    with _pollers_lock:
+        if network not in _pollers:
+            _pollers[network] = CountersPoller(network)
+        return _pollers[network]
+
+
+def streamCounters(network: Literal['mainnet', 'gnosis'], heartbeat: float = 15.) -> Iterator[str]:
+    """Server-sent events with the klerosCounters of the chain. The first event
+    is a snapshot with all the counters, then a diff every time some counter
+    changes. A comment is sent every heartbeat seconds to keep the connection open.
+    """
+    poller = getCountersPoller(network)
+    subscriber = poller.subscribe()
+    try:
+        while True:
+            try:
+                event = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            yield (f"id: {event['block']}\n"
+                   f"event: {event['event']}\n"
+                   f"data: {json.dumps(event['data'])}\n\n")
+    finally:
+        poller.unsubscribe(subscriber)
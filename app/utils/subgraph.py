@@ -1,13 +1,22 @@
-from typing import Any, Dict, List, Literal, Union
+from typing import Any, Callable, Deque, Dict, Iterator, List, Literal, NamedTuple, Set, Union
 import requests
 import os
 import json
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, deque
+import numpy as np
 import pandas as pd
 
+from app.utils import metrics, profiling
+from app.utils.addresses import internAddresses
 from app.utils.oracles import CoinGecko
+from app.utils.singleflight import singleflight
+from app.utils.wei import parseWei
 from app.utils.web3_node import web3Node
 
 try:
@@ -16,16 +25,183 @@ except TypeError:
     ipfs_node = 'https://ipfs.kleros.io'
 
 
+# SUBGRAPH_PREFETCH is the number of pages requested ahead while the last
+# one received is decoded and processed, 0 to request them one by one.
+prefetch_depth: int = int(os.getenv('SUBGRAPH_PREFETCH', 2))
+# threads of the process posting the pages requested ahead
+prefetch_threads: int = int(os.getenv('SUBGRAPH_PREFETCH_THREADS', 16))
+# the subgraphs reject greater skips
+max_skip: int = 5000
+
+_prefetch_pool: Union[ThreadPoolExecutor, None] = None
+_prefetch_lock = threading.Lock()
+
+
+def _prefetchPool() -> ThreadPoolExecutor:
+    global _prefetch_pool
+    with _prefetch_lock:
+        if _prefetch_pool is None:
+            _prefetch_pool = ThreadPoolExecutor(max_workers=prefetch_threads,
+                                                thread_name_prefix='prefetch')
+        return _prefetch_pool
+
+
+def shutdownPrefetch() -> None:
+    "stop the threads posting the pages, e.g. in the gunicorn master before forking the workers"
+    global _prefetch_pool
+    with _prefetch_lock:
+        if _prefetch_pool is not None:
+            _prefetch_pool.shutdown()
+            _prefetch_pool = None
+
+
+def _afterFork() -> None:
+    # the threads of the parent (e.g. the gunicorn master) don't exist in a child
+    global _prefetch_pool, _prefetch_lock
+    _prefetch_pool, _prefetch_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_afterFork)
+
+
+def skipArg(skip: int) -> str:
+    "skip argument of a page query, empty if 0"
+    return f'skip:{skip},' if skip > 0 else ''
+
+
+def blockArg(block: Union[int, None]) -> str:
+    "block argument of a page query, empty for the last block indexed"
+    return f'block:{{number:{block}}},' if block is not None else ''
+
+
+class SubgraphError(Exception):
+    "a query of a walk over the pages of a collection failed"
+
+
+class Pages(NamedTuple):
+    "how to query all the pages of a collection, see Subgraph._iterPages"
+    entity: str
+    # query of the page after the cursor, skipping the first items, at the
+    # block (None for the last one)
+    query: Callable[[Any, int, Union[int, None]], str]
+    # cursor of the first page and cursor after a page
+    cursor: Any
+    next: Callable[[List[Dict]], Any]
+    # page size, a shorter page is the last one
+    first: int = 1000
+
+    @staticmethod
+    def newItems(page: List[Dict], previous: Set[str]) -> List[Dict]:
+        """the items of a page that aren't in the previous one, the ones of a
+        cursor that isn't unique"""
+        if len(previous) == 0:
+            return page
+        return [item for item in page if item['id'] not in previous]
+
+
+class PageWalk():
+    """
+    The state of a walk over the pages of a collection, shared by the sync
+    and the async clients, which post the queries of `requests` and pass
+    the responses to `receive` in the same order.
+
+    With depth 0 the pages are requested one by one, each with the cursor
+    of the last one. Otherwise up to depth pages are requested ahead while
+    the last one received is processed, pipelined: they are queried with
+    the same cursor (the anchor) and the skip of the pages before them, up
+    to max_skip, then the next ones with the cursor of the last page. The
+    skips are only consistent if the collection doesn't change meanwhile,
+    so every page is queried at the block given, read at the start of the
+    walk: the entities created after it are in the next walk.
+
+    inputs:
+        pages: the collection
+        depth: number of pages requested ahead, SUBGRAPH_PREFETCH
+        block: block of all the pages, None for the last one indexed
+    """
+
+    def __init__(self, pages: Pages, depth: int, block: Union[int, None] = None) -> None:
+        self.pages: Pages = pages
+        self.depth: int = depth
+        self.block: Union[int, None] = block
+        self.cursor: Any = pages.cursor
+        # cursor after the last page received
+        self._after: Any = pages.cursor
+        # pages requested with the current cursor, and not received yet
+        self.requested: int = 0
+        self.inflight: int = 0
+        self.received: int = 0
+        self.previous: Set[str] = set()
+        self.done: bool = False
+
+    def requests(self) -> List[str]:
+        "the queries of the next pages to request, none once the last page is received"
+        if self.done:
+            return []
+        first = self.pages.first
+        if self.inflight == 0 and (self.depth == 0 or self.requested * first > max_skip):
+            # the last page of the anchor was received, the next ones are after it
+            self.cursor, self.requested = self._after, 0
+        # only one page until the first one is known to be full
+        ahead = max(self.depth, 1) if self.received > 0 else 1
+        queries = []
+        while self.inflight < ahead and self.requested * first <= max_skip:
+            queries.append(self.pages.query(self.cursor, self.requested * first, self.block))
+            self.requested += 1
+            self.inflight += 1
+        return queries
+
+    def receive(self, response: Dict) -> List[Dict]:
+        """
+        The new items of the response of the next page requested.
+        Raise SubgraphError if the query failed, the collection would be
+        incomplete.
+        """
+        self.inflight -= 1
+        self.received += 1
+        data = response.get('data')
+        if data is None:
+            raise SubgraphError(f'A page of {self.pages.entity} failed: {response.get("errors")}')
+        page = data.get(self.pages.entity) or []
+        items = Pages.newItems(page, self.previous)
+        self.done = len(page) < self.pages.first or self._stalled(items)
+        if not self.done:
+            self._after = self.pages.next(page)
+            self.previous = {item['id'] for item in page}
+        return items
+
+    def _stalled(self, items: List[Dict]) -> bool:
+        "a full page with nothing new, more items with the same cursor than a page"
+        if len(items) > 0:
+            return False
+        logging.getLogger(__name__).error(
+            'More %s with the same cursor than a page, the rest are not fetched', self.pages.entity)
+        return True
+
+
 class Subgraph():
     def __init__(self, network: Literal['mainnet', 'gnosis']) -> None:
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.network: Literal['mainnet', 'gnosis'] = network
-        self.index_node = 'https://api.thegraph.com/index-node/graphql'
-        self.subgraph_node = 'https://api.studio.thegraph.com/query/'
+        # overridable e.g. to point to the local stand-in, see tools/standin
+        self.index_node = os.getenv('INDEX_NODE', 'https://api.thegraph.com/index-node/graphql')
+        self.subgraph_node = os.getenv('SUBGRAPH_NODE', 'https://api.studio.thegraph.com/query/')
 
     def _post_query(self, query):
-        response: requests.Response = requests.post(self.subgraph_node, json={'query': query}, headers={'Content-Type': 'application/json'})
-        data = response.json()
+        return self._parseResponse(query, self._postRaw(query))
+
+    def _postRaw(self, query) -> Dict:
+        "the response of the query, with its data or its errors"
+        start = time.perf_counter()
+        with profiling.span('post_query'):
+            response: requests.Response = requests.post(self.subgraph_node, json={'query': query}, headers={'Content-Type': 'application/json'})
+            data = response.json()
+        metrics.observeSubgraphQuery(self.network, time.perf_counter() - start,
+                                     len(response.content), 'data' not in data)
+        return data
+
+    def _parseResponse(self, query, data):
+        "the data of the response, None if it has errors or is empty"
         try:
             data = data['data']
         except KeyError:
@@ -44,9 +220,69 @@ class Subgraph():
         else:
             return None
 
+    def _iterPages(self, pages: Pages) -> Iterator[List[Dict]]:
+        """
+        Yield the pages of the collection until a short one, see PageWalk.
+        With SUBGRAPH_PREFETCH > 0 the pages requested ahead are posted in
+        threads, and the ones requested after the last page are discarded.
+        Raise SubgraphError if a page fails, instead of ending the walk with
+        a part of the collection.
+        """
+        walk = PageWalk(pages, prefetch_depth, self._walkBlock())
+        inflight: Deque[Future] = deque(self._post(query) for query in walk.requests())
+        try:
+            while not walk.done:
+                items = walk.receive(inflight.popleft().result())
+                inflight.extend(self._post(query) for query in walk.requests())
+                yield items
+        finally:
+            for future in inflight:
+                future.cancel()
+            metrics.observePrefetchDiscarded(self.network, len(inflight))
+
+    def _walkBlock(self) -> Union[int, None]:
+        "the block of the pages of a walk, None (the last one) if they aren't requested ahead"
+        if prefetch_depth == 0:
+            return None
+        block = self.getBlockNumber()
+        if block is None:
+            raise SubgraphError('The block of the subgraph is unknown')
+        return block
+
+    def _post(self, query) -> Future:
+        """post the query, in a thread if the pages are requested ahead, in
+        the context of the caller (metrics labels, spans)"""
+        if prefetch_depth == 0:
+            future: Future = Future()
+            future.set_result(self._postRaw(query))
+            return future
+        context = contextvars.copy_context()
+        return _prefetchPool().submit(context.run, self._postRaw, query)
+
+    def _paginate(self, pages: Pages) -> List[Dict]:
+        "all the items of the collection"
+        items = []
+        for page in self._iterPages(pages):
+            items.extend(page)
+        return items
+
+    def getBlockNumber(self) -> Union[int, None]:
+        "Return the last block indexed by the subgraph"
+        result = self._post_query('{_meta{block{number}}}')
+        if result is None:
+            return None
+        return int(result['_meta']['block']['number'])
+
+    def observeLag(self, block: int) -> int:
+        "blocks between the chain head and the block of the subgraph, set in the lag gauge"
+        lag = web3Node(self.network).web3.eth.blockNumber - block
+        metrics.subgraph_lag.labels(self.network).set(lag)
+        return lag
+
     @staticmethod
     def _wei2eth(gwei):
-        return float(gwei) * 10**-18
+        # int division is correctly rounded, unlike float(gwei) * 10**-18
+        return int(gwei) / 10**18
 
     def getStatus(self):
         """
@@ -70,8 +306,7 @@ class Subgraph():
             return {'status': 'Updated',
                     'last_block': subgraph_block_number,
                     'deployment': subgraph_id}
-        last_block_number = web3Node(self.network).web3.eth.blockNumber
-        if abs(last_block_number - subgraph_block_number) < 120:
+        if abs(self.observeLag(subgraph_block_number)) < 120:
             # ~ 30 min of delay allowed
             return {'status': 'Updated',
                     'last_block': subgraph_block_number,
@@ -83,6 +318,9 @@ class Subgraph():
 
 
 class KlerosBoardSubgraph(Subgraph):
+    # dispute periods, sorted as their number in the contract
+    periods: List[str] = ['evidence', 'commit', 'vote', 'appeal', 'execution']
+
     def __init__(self, network: Literal['mainnet', 'gnosis']='mainnet') -> None:
         super(KlerosBoardSubgraph, self).__init__(network=network)
         self.logger: logging.Logger = logging.getLogger(__name__)
@@ -140,7 +378,8 @@ class KlerosBoardSubgraph(Subgraph):
                                              'pnk_price'])
         df_price_pnk['timestamp'] /= 1000
         if 'gnosis' not in network:
-            eth_historic_price = CoinGecko().getETHhistoricPrice()
+            eth_historic_price = CoinGecko().getETHhistoricPrice(
+                days_to_oldest)
             df_price_eth = pd.DataFrame(eth_historic_price,
                                         columns=['timestamp',
                                                  'eth_price'])
@@ -367,6 +606,190 @@ class KlerosBoardSubgraph(Subgraph):
             dispute['unique_jurors'] = unique_jurors
         return dispute
 
+    @classmethod
+    @profiling.spanned
+    def _parseDisputesFrame(cls, disputes, courtTimePeriods=None) -> pd.DataFrame:
+        """
+        Vectorized version of _parseDispute for the disputes list returned
+        by the subgraph. The period end is looked up in a court x period
+        matrix of period lengths instead of row by row.
+
+        outputs:
+         - df: id, subcourtID, currentRulling, ruled, startTime, period,
+           lastPeriodChange, arbitrable and periodEnds (NaT if the dispute is
+           already executed or the court timePeriods are unknown).
+        """
+        columns = ['id', 'subcourtID', 'currentRulling', 'ruled', 'startTime',
+                   'period', 'lastPeriodChange', 'arbitrable', 'periodEnds']
+        if len(disputes) == 0:
+            return pd.DataFrame(columns=columns)
+        df = pd.json_normalize(disputes)
+        df.rename(columns={'subcourtID.id': 'subcourtID',
+                           'arbitrable.id': 'arbitrable'}, inplace=True)
+        df['id'] = df['id'].astype('int64')
+        df['subcourtID'] = df['subcourtID'].astype('int32')
+        df['currentRulling'] = pd.to_numeric(df['currentRulling']).astype('Int64')
+        df['ruled'] = df['ruled'].astype(bool)
+        df['startTime'] = pd.to_datetime(df['startTime'].astype('int64'), unit='s')
+        df['lastPeriodChange'] = pd.to_datetime(
+            df['lastPeriodChange'].astype('int64'), unit='s')
+        df['period'] = pd.Categorical(df['period'], categories=cls.periods,
+                                      ordered=True)
+
+        # court x period matrix with the length of each period in seconds.
+        # The execution period has no length, it's left as 0 and masked.
+        courtTimePeriods = courtTimePeriods or {}
+        max_court = max([int(court) for court in courtTimePeriods.keys()]
+                        + [int(df['subcourtID'].max())])
+        period_lengths = np.zeros((max_court + 1, len(cls.periods)),
+                                  dtype='int64')
+        known_courts = np.zeros(max_court + 1, dtype=bool)
+        for court, timePeriods in courtTimePeriods.items():
+            period_lengths[int(court), :len(timePeriods)] = [
+                int(period) for period in timePeriods]
+            known_courts[int(court)] = True
+
+        courts = df['subcourtID'].to_numpy()
+        period_codes = df['period'].cat.codes.to_numpy()
+        valid = known_courts[courts] & (period_codes >= 0) \
+            & (period_codes < cls._period2number('execution'))
+        lengths = period_lengths[courts, np.clip(period_codes, 0, None)]
+        period_ends = df['lastPeriodChange'] + pd.to_timedelta(lengths, unit='s')
+        df['periodEnds'] = period_ends.where(valid)
+        df.sort_values(by='id', inplace=True, ignore_index=True)
+        return df[columns]
+
+    @staticmethod
+    @profiling.spanned
+    def _parseVotesFrame(votes) -> pd.DataFrame:
+        """
+        Vectorized parsing of the votes list returned by the subgraph.
+
+        outputs:
+         - df: id, address, choice, voted, timestamp, roundNumber, disputeID,
+           subcourtID, currentRulling, ruled and startTime of the dispute and
+           the totalGasCost of the vote.
+        """
+        columns = ['id', 'address', 'choice', 'voted', 'timestamp', 'roundNumber',
+                   'disputeID', 'subcourtID', 'currentRulling', 'ruled',
+                   'startTime', 'totalGasCost']
+        if len(votes) == 0:
+            return pd.DataFrame(columns=columns)
+        df = pd.json_normalize(votes)
+        df.rename(columns={'address.id': 'address',
+                           'dispute.id': 'disputeID',
+                           'dispute.subcourtID.id': 'subcourtID',
+                           'dispute.currentRulling': 'currentRulling',
+                           'dispute.ruled': 'ruled',
+                           'dispute.startTime': 'startTime'}, inplace=True)
+        df['address'] = df['address'].str.lower()
+        df['choice'] = pd.to_numeric(df['choice']).astype('Int64')
+        df['voted'] = df['voted'].astype(bool)
+        df['timestamp'] = pd.to_datetime(pd.to_numeric(df['timestamp']),
+                                         unit='s')
+        df['roundNumber'] = df['round.id'].str.split('-').str[1].astype('int32')
+        df['disputeID'] = df['disputeID'].astype('int64')
+        df['subcourtID'] = df['subcourtID'].astype('int32')
+        df['currentRulling'] = pd.to_numeric(df['currentRulling']).astype('Int64')
+        df['ruled'] = df['ruled'].astype(bool)
+        df['startTime'] = pd.to_datetime(df['startTime'].astype('int64'),
+                                         unit='s')
+        df['totalGasCost'] = parseWei(df['totalGasCost']).toEth()
+        return df[columns]
+
+    @staticmethod
+    @profiling.spanned
+    def _parseTransfersFrame(transfers) -> pd.DataFrame:
+        """
+        Vectorized parsing of the tokenAndETHShifts list returned by the
+        subgraph.
+
+        outputs:
+         - df: id, address, disputeID, subcourtID, arbitrable, ETHAmount,
+           tokenAmount, blockNumber and timestamp.
+        """
+        columns = ['id', 'address', 'disputeID', 'subcourtID', 'arbitrable',
+                   'ETHAmount', 'tokenAmount', 'blockNumber', 'timestamp']
+        if len(transfers) == 0:
+            return pd.DataFrame(columns=columns)
+        df = pd.json_normalize(transfers)
+        df.rename(columns={'address.id': 'address',
+                           'disputeId.id': 'disputeID',
+                           'disputeId.subcourtID.id': 'subcourtID',
+                           'disputeId.arbitrable.id': 'arbitrable'},
+                  inplace=True)
+        df['address'] = df['address'].str.lower()
+        df['disputeID'] = df['disputeID'].astype('int64')
+        df['subcourtID'] = df['subcourtID'].astype('int32')
+        df['ETHAmount'] = parseWei(df['ETHAmount']).toEth()
+        df['tokenAmount'] = parseWei(df['tokenAmount']).toEth()
+        df['blockNumber'] = df['blockNumber'].astype('int64')
+        df['timestamp'] = pd.to_datetime(df['timestamp'].astype('int64'),
+                                         unit='s')
+        return df[columns]
+
+    @profiling.spanned
+    def _internAddresses(self, df) -> pd.DataFrame:
+        """
+        Replace the address column with the address_id column, the ids of the
+        address book of the network, so the frames don't keep a string per
+        row. The book itself is found with frameNetwork(df) and decodes the
+        ids when the responses are built.
+        """
+        return internAddresses(df, self.network)
+
+    @staticmethod
+    @profiling.spanned
+    def _parseDrawsFrame(draws) -> pd.DataFrame:
+        """
+        Vectorized parsing of the draws list returned by the subgraph.
+
+        outputs:
+         - df: id, address, disputeId, roundNumber, voteId and timestamp.
+        """
+        columns = ['id', 'address', 'disputeId', 'roundNumber', 'voteId',
+                   'timestamp']
+        if len(draws) == 0:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame(draws)
+        df['address'] = df['address'].str.lower()
+        df['disputeId'] = df['disputeId'].astype('int64')
+        df['roundNumber'] = df['roundNumber'].astype('int32')
+        df['voteId'] = df['voteId'].astype('int32')
+        df['timestamp'] = pd.to_datetime(df['timestamp'].astype('int64'),
+                                         unit='s')
+        return df[columns]
+
+    @staticmethod
+    @profiling.spanned
+    def _parseStakeSetsFrame(stake_sets) -> pd.DataFrame:
+        """
+        Vectorized parsing of the stakeSets list returned by the subgraph.
+
+        outputs:
+         - df: id, address, subcourtID, stake, newTotalStake and timestamp,
+           and the exact stake and newTotalStake as WeiArray columns.
+        """
+        columns = ['id', 'address', 'subcourtID', 'stake', 'newTotalStake',
+                   'timestamp', 'stake_hi', 'stake_lo', 'newTotalStake_hi',
+                   'newTotalStake_lo']
+        if len(stake_sets) == 0:
+            return pd.DataFrame(columns=columns)
+        df = pd.json_normalize(stake_sets)
+        df.rename(columns={'address.id': 'address'}, inplace=True)
+        df['address'] = df['address'].str.lower()
+        df['subcourtID'] = df['subcourtID'].astype('int32')
+        # keep the exact amounts along with the float ones, see WeiArray
+        stake = parseWei(df['stake'])
+        newTotalStake = parseWei(df['newTotalStake'])
+        df['stake'] = stake.toEth()
+        df['newTotalStake'] = newTotalStake.toEth()
+        stake.toColumns(df, 'stake')
+        newTotalStake.toColumns(df, 'newTotalStake')
+        df['timestamp'] = pd.to_datetime(df['timestamp'].astype('int64'),
+                                         unit='s')
+        return df[columns]
+
     def _parseKlerosCounters(self, kc) -> Dict:
         float_fields = ['tokenStaked', 'totalETHFees',
                         'totalTokenRedistributed']
@@ -623,6 +1046,8 @@ class KlerosBoardSubgraph(Subgraph):
             'inactiveJurors'])
         return newTotal - oldTotal
 
+    @singleflight
+    @metrics.trackQueries
     def getAllArbitrables(self) -> List[Dict]:
         initArbitrable = ""
         arbitrables = []
@@ -735,44 +1160,61 @@ class KlerosBoardSubgraph(Subgraph):
             parsed_disputes.append(self._parseDispute(dispute))
         return parsed_disputes
 
-    def getAllDraws(self) -> List[Dict]:
-        initTimestamp = 0
-        draws = []
-        while True:
-            query = ('{draws('
+    @staticmethod
+    def _drawsPages(since: int = 0) -> Pages:
+        def query(initTimestamp, skip, block) -> str:
+            return ('{draws(' + blockArg(block) + skipArg(skip) +
                     'first:1000, orderBy:timestamp, orderDirection:asc, where:{'
                     f'timestamp_gt:{initTimestamp}'
                     '}){'
                     'id,timestamp,address,disputeId,roundNumber,voteId'
                     '}}'
                     )
-            result = self._post_query(query)
-            if result is None:
-                break
-            draws.extend(result['draws'])
-            initTimestamp = result['draws'][-1]['timestamp']
-        return [self._parseDraw(draw) for draw in draws]
+        # the timestamps aren't unique, the next page starts a second before
+        # the last one and the repeated draws are dropped
+        return Pages('draws', query, cursor=max(since - 1, 0),
+                     next=lambda page: int(page[-1]['timestamp']) - 1)
 
-    def getAllDisputes(self) -> List[Dict]:
-        initDispute = -1
-        disputes = []
-        while True:
-            query = (
-                '{disputes(where:{disputeID_gt:' + str(initDispute) + '},'
+    def _getAllDrawsRaw(self, since: int = 0) -> List[Dict]:
+        return self._paginate(self._drawsPages(since))
+
+    @singleflight
+    @metrics.trackQueries
+    def getAllDraws(self) -> List[Dict]:
+        return [self._parseDraw(draw) for draw in self._getAllDrawsRaw()]
+
+    @singleflight
+    @metrics.trackQueries
+    def getAllDrawsFrame(self, since: int = 0) -> pd.DataFrame:
+        """
+        Same data as getAllDraws but parsed in bulk into a dataframe, with the
+        address id of the chain address book.
+        If since is given (unit s), only the ones with timestamp >= since.
+        """
+        df = self._parseDrawsFrame(self._getAllDrawsRaw(since))
+        return self._internAddresses(df)
+
+    @staticmethod
+    def _disputesPages() -> Pages:
+        def query(initDispute, skip, block) -> str:
+            return (
+                '{disputes(' + blockArg(block) + skipArg(skip) + 'where:{disputeID_gt:' + str(initDispute) + '},'
                 ' orderDirection:asc, orderBy:disputeID){'
                 'id,subcourtID{id},currentRulling,ruled,startTime,'
                 'period,lastPeriodChange,arbitrable{id}'
                 '}}'
             )
-            result = self._post_query(query)
-            if result is None:
-                break
-            else:
-                currentDisputes = result['disputes']
-                disputes.extend(currentDisputes)
-                initDispute = int(currentDisputes[-1]['id'])
-                if len(currentDisputes) < 100:
-                    break
+        # pages of the default size of the subgraph
+        return Pages('disputes', query, cursor=-1,
+                     next=lambda page: int(page[-1]['id']), first=100)
+
+    def _getAllDisputesRaw(self) -> List[Dict]:
+        return self._paginate(self._disputesPages())
+
+    @singleflight
+    @metrics.trackQueries
+    def getAllDisputes(self) -> List[Dict]:
+        disputes = self._getAllDisputesRaw()
         courtTimePeriods = self.getTimePeriodsAllCourts()
         parsed_disputes = []
         for dispute in disputes:
@@ -782,6 +1224,19 @@ class KlerosBoardSubgraph(Subgraph):
                                                           subcourtID]))
         return parsed_disputes
 
+    @singleflight
+    @metrics.trackQueries
+    def getAllDisputesFrame(self) -> pd.DataFrame:
+        """
+        Same data as getAllDisputes but parsed in bulk into a typed
+        dataframe, one row per dispute.
+        """
+        disputes = self._getAllDisputesRaw()
+        courtTimePeriods = self.getTimePeriodsAllCourts()
+        return self._parseDisputesFrame(disputes, courtTimePeriods)
+
+    @singleflight
+    @metrics.trackQueries
     def getAllOpenDisputes(self) -> List[Dict]:
         initDispute = -1
         disputes = []
@@ -812,28 +1267,41 @@ class KlerosBoardSubgraph(Subgraph):
                                                           subcourtID]))
         return parsed_disputes
 
-    def getAllStakeSets(self) -> List[Dict]:
-        initStakes = ""
-        stakes = []
-        while True:
-            query = (
-                '{stakeSets(where:{id_gt:"' + str(initStakes) + '"},'
+    @staticmethod
+    def _stakeSetsPages(since: int = 0) -> Pages:
+        def query(initStakes, skip, block) -> str:
+            return (
+                '{stakeSets(' + blockArg(block) + skipArg(skip) + 'where:{id_gt:"' + str(initStakes) + '"'
+                + (f',timestamp_gte:"{since}"' if since else '') + '},'
                 'orderBy:id, orderDirection:asc, first:1000){'
                 'id,address{id},subcourtID,stake,newTotalStake,timestamp'
                 '}}'
             )
-            result = self._post_query(query)
-            if result is None:
-                break
-            else:
-                currentStakes = result['stakeSets']
-                stakes.extend(currentStakes)
-                if len(currentStakes) < 1000:
-                    break
-                initStakes = currentStakes[-1]['id']
+        return Pages('stakeSets', query, cursor='',
+                     next=lambda page: page[-1]['id'])
+
+    def _getAllStakeSetsRaw(self, since: int = 0) -> List[Dict]:
+        return self._paginate(self._stakeSetsPages(since))
+
+    @singleflight
+    @metrics.trackQueries
+    def getAllStakeSets(self) -> List[Dict]:
         return [self._parseStakeSet(stake)
-                for stake in stakes]
+                for stake in self._getAllStakeSetsRaw()]
+
+    @singleflight
+    @metrics.trackQueries
+    def getAllStakeSetsFrame(self, since: int = 0) -> pd.DataFrame:
+        """
+        Same data as getAllStakeSets but parsed in bulk into a dataframe,
+        with the address id of the chain address book.
+        If since is given (unit s), only the ones with timestamp >= since.
+        """
+        df = self._parseStakeSetsFrame(self._getAllStakeSetsRaw(since))
+        return self._internAddresses(df)
 
+    @singleflight
+    @metrics.trackQueries
     def getAllTransfers(self) -> List[Dict]:
         initTimestamp = 0
         transfers = []
@@ -857,41 +1325,97 @@ class KlerosBoardSubgraph(Subgraph):
         return [self._parseTransfer(transfer)
                 for transfer in transfers]
 
-    def getAllVotes(self) -> List[Dict]:
-        initTimestamp = 0
-        votes = []
-        while True:
-            query = ('{votes('
+    @staticmethod
+    def _transfersPages(since: int = 0) -> Pages:
+        def query(initTransfer, skip, block) -> str:
+            return (
+                '{tokenAndETHShifts(' + blockArg(block) + skipArg(skip) + 'where:{id_gt:"' + str(initTransfer) + '"'
+                + (f',timestamp_gte:"{since}"' if since else '') + '},'
+                'orderBy:id, orderDirection:asc, first:1000){'
+                'id,address{id},disputeId{id,subcourtID{id},arbitrable{id}},'
+                'ETHAmount,tokenAmount,blockNumber,timestamp'
+                '}}'
+            )
+        return Pages('tokenAndETHShifts', query, cursor='',
+                     next=lambda page: page[-1]['id'])
+
+    def _getAllTransfersRaw(self, since: int = 0) -> List[Dict]:
+        return self._paginate(self._transfersPages(since))
+
+    @singleflight
+    @metrics.trackQueries
+    def getAllTransfersFrame(self, since: int = 0) -> pd.DataFrame:
+        """
+        All the token and ETH shifts, rewards and penalties, with the juror
+        and the dispute they belong to, parsed in bulk into a dataframe with
+        the address id of the chain address book.
+        If since is given (unit s), only the ones with timestamp >= since.
+        """
+        df = self._parseTransfersFrame(self._getAllTransfersRaw(since))
+        return self._internAddresses(df)
+
+    @staticmethod
+    def _votesPages(since: int = 0) -> Pages:
+        def query(initTimestamp, skip, block) -> str:
+            return ('{votes(' + blockArg(block) + skipArg(skip) +
                     'first:1000, orderBy:timestamp, orderDirection:asc, where:{'
                     f'timestamp_gt:{initTimestamp}'
                     '}){'
-                    'dispute{id,currentRulling,ruled,startTime,numberOfChoices},'
-                    'choice,voted,round{id},timestamp'
+                    'id,dispute{id,currentRulling,ruled,startTime,numberOfChoices,'
+                    'subcourtID{id}},'
+                    'address{id},choice,voted,round{id},timestamp,totalGasCost'
                     '}}'
                     )
-            result = self._post_query(query)
-            if result is None:
-                break
-            votes.extend(result['votes'])
-            initTimestamp = result['votes'][-1]['timestamp']
+        return Pages('votes', query, cursor=max(since - 1, 0),
+                     next=lambda page: int(page[-1]['timestamp']) - 1)
+
+    def _getAllVotesRaw(self, since: int = 0) -> List[Dict]:
+        return self._paginate(self._votesPages(since))
+
+    @singleflight
+    @metrics.trackQueries
+    def getAllVotes(self) -> List[Dict]:
+        votes = self._getAllVotesRaw()
         return [self._parseVote(vote, vote['dispute']['numberOfChoices'])
                 for vote in votes]
 
-    def getAllVotesFromJuror(self, address) -> List[Dict]:
-        query = ('{votes(where:{address:"'
-                 + str(address) + '"},first:1000){'
-                 'dispute{id,currentRulling,ruled,startTime,numberOfChoices},'
-                 'choice,voted,round{id}'
-                 '}}'
-                 )
-        result = self._post_query(query)
+    @singleflight
+    @metrics.trackQueries
+    def getAllVotesFrame(self, since: int = 0) -> pd.DataFrame:
+        """
+        Same data as getAllVotes but parsed in bulk into a flat dataframe,
+        one row per vote with the dispute fields as columns and the address id
+        of the chain address book.
+        If since is given (unit s), only the ones with timestamp >= since.
+        """
+        df = self._parseVotesFrame(self._getAllVotesRaw(since))
+        return self._internAddresses(df)
 
-        if result is None:
-            return []
-        votes = result['votes']
+    def getAllVotesFromJuror(self, address) -> List[Dict]:
+        initVote = ""
+        votes = []
+        while True:
+            query = ('{votes(where:{address:"' + str(address).lower()
+                     + '", id_gt:"' + str(initVote) + '"},'
+                     'orderBy:id, orderDirection:asc, first:1000){'
+                     'id,'
+                     'dispute{id,currentRulling,ruled,startTime,numberOfChoices},'
+                     'choice,voted,round{id}'
+                     '}}'
+                     )
+            result = self._post_query(query)
+            if result is None:
+                break
+            currentVotes = result['votes']
+            votes.extend(currentVotes)
+            if len(currentVotes) < 1000:
+                break
+            initVote = currentVotes[-1]['id']
         return [self._parseVote(vote, vote['dispute']['numberOfChoices'])
                 for vote in votes]
     
+    @singleflight
+    @metrics.trackQueries
     def getAllJurors(self) -> List[Dict]:
         skipJurors = 0
         profiles = []
@@ -1250,8 +1774,7 @@ class KlerosBoardSubgraph(Subgraph):
             dispute = result['disputes'][0]
             return self._parseDispute(dispute)
 
-    def getKlerosCounters(self):
-        query = '''{
+    counters_query: str = '''{
         klerosCounters {
             disputesCount
             openDisputes
@@ -1270,12 +1793,49 @@ class KlerosBoardSubgraph(Subgraph):
             totalUSDthroughContract
         }}
         '''
-        result = self._post_query(query)
+
+    def getKlerosCounters(self):
+        result = self._post_query(self.counters_query)
         if result is not None:
             return self._parseKlerosCounters(result['klerosCounters'][0])
         else:
             return result
 
+    def getKlerosCountersAndBlock(self):
+        """
+        Return the block number of the subgraph and the klerosCounters at that
+        block, in a single query.
+        """
+        query = '''{
+        _meta {
+            block {
+                number
+            }
+        }
+        klerosCounters {
+            disputesCount
+            openDisputes
+            closedDisputes
+            appealPhaseDisputes
+            votingPhaseDisputes
+            evidencePhaseDisputes
+            courtsCount
+            numberOfArbitrables
+            activeJurors
+            inactiveJurors
+            drawnJurors
+            tokenStaked
+            totalTokenRedistributed
+            totalETHFees
+            totalUSDthroughContract
+        }}
+        '''
+        result = self._post_query(query)
+        if result is None:
+            return None, None
+        block = int(result['_meta']['block']['number'])
+        return block, self._parseKlerosCounters(result['klerosCounters'][0])
+
     def getLastDisputeInfo(self):
         query = (
             '{'
@@ -1439,14 +1999,18 @@ class KlerosBoardSubgraph(Subgraph):
         else:
             return result['courts'][0]['timePeriods']
 
+    time_periods_query: str = (
+        '{'
+        'courts {'
+        '   id,timePeriods,'
+        '}}'
+    )
+
     def getTimePeriodsAllCourts(self):
-        query = (
-            '{'
-            'courts {'
-            '   id,timePeriods,'
-            '}}'
-        )
-        result = self._post_query(query)
+        return self._parseTimePeriods(self._post_query(self.time_periods_query))
+
+    @staticmethod
+    def _parseTimePeriods(result) -> Union[Dict, None]:
         if result is None:
             return result
         else:
@@ -1631,9 +2195,56 @@ class KlerosBoardSubgraph(Subgraph):
         else:
             return result['policyUpdates'][0]
 
+    @staticmethod
+    def _idPages(entity: str, fields: str, where: str = '', first: int = 1000) -> Pages:
+        """
+        The pages of all the entities ordered by id, to be processed with
+        _iterPages without keeping them all in memory.
+        inputs:
+            entity: name of the collection, e.g. 'stakeSets'
+            fields: fields to query besides the id
+            where: extra filters, e.g. 'ETHAmount_gt:0'
+        """
+        def query(lastId, skip, block) -> str:
+            filters = f'id_gt:"{lastId}"' + (f',{where}' if where else '')
+            return ('{' + entity + '(' + blockArg(block) + skipArg(skip) + 'where:{' + filters + '},'
+                    f'orderBy:id, orderDirection:asc, first:{first})'
+                    '{id,' + fields + '}}')
+        return Pages(entity, query, cursor='', next=lambda page: page[-1]['id'], first=first)
+
+    @singleflight
+    @metrics.trackQueries
+    def getTransactionsCount(self, freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
+        """
+        Number of transactions by period, the same as counting the result of
+        getAllTransactions but in low memory: the pages are counted as they
+        arrive and only the counts by period are kept.
+        """
+        # entity: (timestamp field, filters), the same entities of getAllTransactions
+        entities = {'stakeSets': ('timestamp', ''),
+                    'votes': ('timestamp', ''),
+                    'tokenAndETHShifts': ('timestamp', 'ETHAmount_gt:0'),
+                    'draws': ('timestamp', ''),
+                    'disputes': ('startTime', '')}
+        counts = pd.Series(dtype='int64')
+        for entity, (field, where) in entities.items():
+            for page in self._iterPages(self._idPages(entity, field, where)):
+                timestamps = pd.to_datetime(
+                    pd.Series([item[field] for item in page], dtype='float64'),
+                    unit='s').dropna()
+                page_counts = pd.Series(1, index=timestamps).resample(freq).sum()
+                counts = counts.add(page_counts, fill_value=0)
+        if len(counts) > 0:
+            counts = counts.resample(freq).sum()
+        counts.index.name = 'timestamp'
+        return counts.astype('int64').to_frame('tx')
+
+    @singleflight
+    @metrics.trackQueries
+    @metrics.timed
     def getAllTransactions(self) -> pd.DataFrame:
         votes = self.getAllVotes()
-        disputes = self.getAllDisputes()
+        disputes = self.getAllDisputesFrame()
         stakes = self.getAllStakeSets()
         transfers = self.getAllTransfers()
         draws = self.getAllDraws()
@@ -1642,9 +2253,9 @@ class KlerosBoardSubgraph(Subgraph):
         df_stakes['tx'] = 'SetStake'
         df_stakes['timestamp'] = pd.to_datetime(df_stakes['timestamp'], unit='s')
 
-        df_disputes = pd.DataFrame(disputes)
+        df_disputes = disputes
         df_disputes['tx'] = 'NewDispute'
-        df_disputes['timestamp'] = pd.to_datetime(df_disputes['startTime'], unit='s')
+        df_disputes['timestamp'] = df_disputes['startTime']
 
         df_votes = pd.DataFrame(votes)
         df_votes['tx'] = 'Vote'
@@ -1667,47 +2278,3 @@ class KlerosBoardSubgraph(Subgraph):
         ], ignore_index=True,join="inner")
         df.sort_values(by='timestamp', inplace=True)
         return df
-    
-class PoHSubgraph(Subgraph):
-    def __init__(self) -> None:
-        super(PoHSubgraph,self).__init__(network='mainnet')
-        self.logger: logging.Logger = logging.getLogger(__name__)
-
-        # Node definitions
-        self.subgraph_name = '61738/proof-of-humanity-mainnet/version/latest'
-        self.subgraph_node += self.subgraph_name
-
-    @staticmethod
-    def _parseSubmission(submission) -> dict:
-        keys = submission.keys()
-        if 'registered' in keys:
-            submission['registered'] = True if submission['registered'] == 'true' else False
-        if 'submissionTime' in keys:
-            submission['submissionTime'] = int(submission['submissionTime'])
-        return submission
-
-    
-    def getAllSubmissions(self, initSubmissionTime: int = 1646282170) -> List[dict]:
-        submissions: List[dict] = []
-        while True:
-            query = (
-                '{submissions('
-                '    where: {status: None, submissionTime_gt: "'+ str(initSubmissionTime)+'", registered: true}'
-                '    first: 1000'
-                '    skip: 0'
-                ') {'
-                '    id'
-                '    registered'
-                '    status'
-                '    submissionTime'
-                '}}'
-            )
-            result = self._post_query(query)
-            if result is None:
-                break
-            else:
-                submissions.extend( result['submissions'])
-                initSubmissionTime = result['submissions'][-1]['submissionTime']
-        parse_submissions: List[dict] = [self._parseSubmission(submission) for submission in submissions]
-        return parse_submissions
-        
\ No newline at end of file
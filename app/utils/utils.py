@@ -1,10 +1,18 @@
-from datetime import datetime, timedelta
-from typing import Union, List, Literal, Dict
+from datetime import date, datetime, timedelta
+from typing import Callable, Union, List, Literal, Dict, Tuple
+import functools
 import pandas as pd
 import numpy as np
+from app.utils import metrics, profiling
+from app.utils.addresses import AddressBook, frameNetwork, getAddressBook
+from app.utils.dataset import cachedSeries, getDataset
+from app.utils.executor import compute, precompute
 from app.utils.oracles import CoinGecko
+from app.utils.orderstats import OrderStatistics
+from app.utils.singleflight import callKey, singleflight
 
 from app.utils.subgraph import KlerosBoardSubgraph
+from app.utils.wei import WeiArray
 
 chain_names: Dict[int, str] = {1: "mainnet", 100: "gnosis"}
 
@@ -43,19 +51,77 @@ burning_events: List[Dict[str, Union[datetime, float]]] = [
     {'timestamp': datetime(year=2018, month=5, day=18, hour=18, minute=13, second=59), 'amount': -5_000_000},
 ]
 
-def getTotalSupplyTimeSerie(freq: Literal['D', 'W', 'M']) -> pd.DataFrame:
+def rollup(daily: Union[pd.DataFrame, pd.Series], freq: Literal['D', 'W', 'M'],
+           how: Literal['sum', 'last']) -> Union[pd.DataFrame, pd.Series]:
+    """a serie in frequency from its daily base serie: the sum of the days of
+    each period for the flows (fees, cases), the value of the last day of each
+    period for the stocks (active jurors, staked PNK, total supply).
+
+    inputs:
+     - daily: a serie by day, with every day for the stocks
+     - how: sum for the flows, last for the stocks
+    """
+    if freq == 'D' or len(daily) == 0:
+        return daily.copy()
+    if how == 'sum':
+        return daily.resample(freq).sum()
+    # the days of the serie are the ones of the other frequencies too
+    return daily.reindex(pd.date_range(start=daily.index.min(), end=daily.index.max(), freq=freq))
+
+
+def extendDaily(serie: Callable, chain: Literal['mainnet', 'gnosis'],
+                fromDay: Callable[[Union[pd.Timestamp, None]], pd.DataFrame]) -> pd.DataFrame:
+    """the daily base serie of the chain extended from the one cached before
+    the data changed: only its last day, which may have been partial, and the
+    next ones are computed, from the events since then. The whole serie if
+    there is none cached. Only for the series of events never modified after
+    they are fetched, so their days don't change.
+
+    inputs:
+     - serie: the cachedSeries of the daily serie, with the chain param only
+     - fromDay: the daily serie of the events since a day, of all if None
+    """
+    previous = getDataset(chain).previous(callKey(serie, (chain,), {}))
+    if previous is None or len(previous) == 0:
+        return fromDay(None)
+    last_day: pd.Timestamp = previous.index.max()
+    daily = pd.concat([previous.loc[previous.index < last_day], fromDay(last_day)])
+    return daily.reindex(pd.date_range(start=daily.index.min(), end=daily.index.max(), freq='D',
+                                       name=daily.index.name), fill_value=0)
+
+
+@functools.lru_cache(maxsize=1)
+def _dailyTotalSupply(today: date) -> pd.Series:
+    "total supply at the end of every day, from the first event until today"
     events: List[Dict[str, Union[datetime, float]]] = minting_events + burning_events
     df = pd.DataFrame(data=events)
     df.sort_values(by='timestamp', ascending=True, inplace=True)
     df['timestamp'] = pd.to_datetime(df['timestamp'])
     df['total_supply'] = df['amount'].cumsum()
-    resampled: pd.DataFrame = df.resample(rule=freq, on='timestamp')['total_supply'].last().fillna(method='ffill')
-    start_date = resampled.index.min()
-    end_date = datetime.now()
-    t_index = pd.DatetimeIndex(pd.date_range(start=start_date, end=end_date, freq=freq))
-    return resampled.reindex(t_index).fillna(method='ffill')
+    daily: pd.Series = df.resample(rule='D', on='timestamp')['total_supply'].last().ffill()
+    t_index = pd.DatetimeIndex(pd.date_range(start=daily.index.min(), end=today, freq='D'))
+    return daily.reindex(t_index).ffill()
+
+
+@metrics.timed
+def getTotalSupplyTimeSerie(freq: Literal['D', 'W', 'M']) -> pd.DataFrame:
+    """total supply of PNK at the end of each period until now, rolled up from
+    the daily serie built once a day"""
+    return rollup(_dailyTotalSupply(date.today()), freq, 'last')
 
 
+def _addressIds(df: pd.DataFrame) -> Tuple[np.ndarray, Union[np.ndarray, AddressBook]]:
+    """int ids of the address column of the dataframe and the dictionary to
+    decode them (addresses[ids]). The ids of the chain address book are used
+    if the dataframe comes from a subgraph.getAll*Frame(), which has no
+    address column, else they are factorized here."""
+    if "address_id" in df.columns:
+        return df["address_id"].to_numpy(), getAddressBook(frameNetwork(df))
+    ids, addresses = pd.factorize(df["address"])
+    return ids.astype(np.int32), np.asarray(addresses)
+
+
+@metrics.timed
 def getActiveJurorsFromStakes(df: pd.DataFrame) -> pd.DataFrame:
     """from the setSakes dataframe (subgraph.getAllStakeSets()) get the list of
     all the active jurors
@@ -66,62 +132,114 @@ def getActiveJurorsFromStakes(df: pd.DataFrame) -> pd.DataFrame:
      - df: with the address, newTotalStake, timestamp of the last stake
     """
     # Get the last SetStake from each juror.
-    active_jurors = df.groupby(by="address").last()
+    ids, addresses = _addressIds(df)
+    last = ~pd.Series(ids).duplicated(keep="last").to_numpy()
+    active_jurors = df.loc[last, ["newTotalStake", "subcourtID", "timestamp"]]
+    active_jurors.index = pd.Index(addresses[ids[last]], name="address")
     # Drop the jurors who unstake
-    active_jurors = active_jurors.loc[
-        active_jurors["newTotalStake"] > 0, ["newTotalStake", "subcourtID", "timestamp"]
-    ]
-    return active_jurors
+    active_jurors = active_jurors.loc[active_jurors["newTotalStake"] > 0]
+    return active_jurors.sort_index()
 
 
-def getTimeSerieActiveJurorsFromStakes(df: pd.DataFrame, freq:Literal['D', 'W', 'M']='M') -> pd.DataFrame:
-    """from the setSakes dataframe (subgraph.getAllStakeSets()) add a column
-    with the count of active jurors.
+def _stakesSweep(df: pd.DataFrame, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """sweep the setStakes in time order keeping, for every juror, the change
+    of his newTotalStake. The cumulative sum of those changes is the state
+    after each event, read at each date with a binary search.
 
-    inputs:
-     - df: AllStakeSets dataframe
     outputs:
-     - df: the iput dataframe with an extra column called activeJurors
+     - df: total_staked and active_jurors before each date
     """
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
+    ids, _ = _addressIds(df)
+    timestamps = df["timestamp"].to_numpy()
+    order = np.argsort(timestamps, kind="stable")
+    ids = ids[order]
+    if "newTotalStake_hi" in df.columns:
+        # exact sums over the wei amounts of subgraph.getAllStakeSetsFrame()
+        stakes = WeiArray.fromColumns(df, "newTotalStake")[order]
+        previous_limbs = pd.DataFrame({"hi": stakes.hi, "lo": stakes.lo}).groupby(ids).shift(fill_value=0)
+        previous = WeiArray(previous_limbs["hi"].to_numpy(), previous_limbs["lo"].to_numpy())
+        staked = (stakes - previous).cumsum()
+        staked_now, previous_staked = ~stakes.isZero(), ~previous.isZero()
+    else:
+        stakes = df["newTotalStake"].to_numpy(dtype=float)[order]
+        previous = pd.Series(stakes).groupby(ids).shift(fill_value=0.).to_numpy()
+        staked = np.cumsum(stakes - previous)
+        staked_now, previous_staked = stakes != 0, previous != 0
+    active = np.cumsum(staked_now.astype(np.int64) - previous_staked)
+    # index of the last event before each date, -1 if there is none.
+    last_event = np.searchsorted(timestamps[order], dates.to_numpy(), side="left") - 1
+    before = last_event >= 0
+    total_staked = staked[np.clip(last_event, 0, None)]
+    if isinstance(total_staked, WeiArray):
+        total_staked = total_staked.toEth()
+    return pd.DataFrame(
+        data={"total_staked": np.where(before, total_staked, 0.),
+              "active_jurors": np.where(before, active[np.clip(last_event, 0, None)], 0)},
+        index=dates)
+
+
+def _stakesDates(df: pd.DataFrame, freq: Literal["D", "W", "M"]) -> pd.DatetimeIndex:
+    "parse the timestamps of the setStakes and return the dates of the serie"
+    if not pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
     df.sort_values(by="timestamp", inplace=True)
     start_timestamp = df["timestamp"].min().replace(hour=0, second=0, minute=0)
     end_timestamp = df["timestamp"].max().replace(hour=0, second=0, minute=0)
 
-    dates: pd.DatetimeIndex = pd.date_range(
+    return pd.date_range(
         start=start_timestamp,
         end=end_timestamp,
         freq=freq,
     )
 
-    active_juros: List = []
-    for i, date in enumerate(dates):
-        # get the last newTotalStake by address and count only those who are > 0.
-        # print(date)
-        # print(df.loc[df["timestamp"] < date][['address', 'newTotalStake']])
-
-        active_juros.append(
-            df.loc[df["timestamp"] < date]
-            .groupby(by="address")["newTotalStake"]
-            .last()
-            .astype(bool)
-            .sum(axis=0)
-        )
-        # print(active_juros[-1])
-    return pd.DataFrame(data={"active_jurors": active_juros}, index=dates)
+
+@metrics.timed
+def getTimeSerieStakesFromStakes(df: pd.DataFrame, freq: Literal['D', 'W', 'M'] = 'D') -> pd.DataFrame:
+    """from the setSakes dataframe (subgraph.getAllStakeSets()) get the
+    total_staked and active_jurors series, from the same sweep.
+
+    inputs:
+     - df: AllStakeSets dataframe
+    outputs:
+     - df: total_staked and active_jurors by time in frequency
+    """
+    dates: pd.DatetimeIndex = _stakesDates(df, freq)
+    return _stakesSweep(df, dates)
+
+
+@cachedSeries
+@singleflight
+def getDailyStakes(chain: Literal["mainnet", "gnosis"] = "mainnet") -> pd.DataFrame:
+    """total_staked and active_jurors at the start of every day, the base
+    serie of the active jurors and the PNK staked in every frequency"""
+    return compute(getTimeSerieStakesFromStakes, chain, {"df": "stake_sets"}, freq="D")
+
+
+@metrics.timed
+def getTimeSerieActiveJurorsFromStakes(df: pd.DataFrame, freq:Literal['D', 'W', 'M']='M') -> pd.DataFrame:
+    """from the setSakes dataframe (subgraph.getAllStakeSets()) add a column
+    with the count of active jurors.
+
+    inputs:
+     - df: AllStakeSets dataframe
+    outputs:
+     - df: the iput dataframe with an extra column called activeJurors
+    """
+    dates: pd.DatetimeIndex = _stakesDates(df, freq)
+    return _stakesSweep(df, dates)[["active_jurors"]]
 
 
+@cachedSeries
+@singleflight
 def getTimeSerieActiveJurors(
     chain: Literal["mainnet", "gnosis"] = "mainnet", freq: Literal["D", "W", "M"] = "D"
 ) -> pd.DataFrame:
     """Get the time serie of active jurors count"""
-    kb = KlerosBoardSubgraph(network=chain)
-    stakes: List = kb.getAllStakeSets()
-    df_stakes = pd.DataFrame(stakes)
-    active_jurors: pd.DataFrame = getTimeSerieActiveJurorsFromStakes(df=df_stakes, freq=freq)
+    active_jurors: pd.DataFrame = rollup(getDailyStakes(chain)[["active_jurors"]], freq, "last")
     return active_jurors
 
 
+@metrics.timed
 def getTimeSeriePNKStakedFromStakes(df: pd.DataFrame, freq="M") -> pd.DataFrame:
     """from the setSakes dataframe (subgraph.getAllStakeSets()) generate
     a time serie with the total PNK staked.
@@ -131,30 +249,12 @@ def getTimeSeriePNKStakedFromStakes(df: pd.DataFrame, freq="M") -> pd.DataFrame:
     outputs:
      - df: a column of total_staked by time in frequency
     """
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
-    df.sort_values(by="timestamp", inplace=True)
-    start_timestamp = df["timestamp"].min().replace(hour=0, second=0, minute=0)
-    end_timestamp = df["timestamp"].max().replace(hour=0, second=0, minute=0)
-
-    dates: pd.DatetimeIndex = pd.date_range(
-        start=start_timestamp,
-        end=end_timestamp,
-        freq=freq,
-    )
-
-    total_pnk = []
-    for date in dates:
-        # get the last newTotalStake by address and sum them
-        total_pnk.append(
-            df.loc[df["timestamp"] < date]
-            .groupby(by="address")["newTotalStake"]
-            .last()
-            .sum()
-        )
-
-    return pd.DataFrame(data={"total_staked": total_pnk}, index=dates)
+    dates: pd.DatetimeIndex = _stakesDates(df, freq)
+    return _stakesSweep(df, dates)[["total_staked"]]
 
 
+@cachedSeries
+@singleflight
 def getTimeSeriePNKStaked(
     chain: Literal["mainnet", "gnosis"] = "mainnet", freq="M"
 ) -> pd.DataFrame:
@@ -165,11 +265,11 @@ def getTimeSeriePNKStaked(
     outputs:
      - df: a column of total_staked by time in frequency
     """
-    kb = KlerosBoardSubgraph(network=chain)
-    df = pd.DataFrame(data=kb.getAllStakeSets())
-    return getTimeSeriePNKStakedFromStakes(df=df, freq=freq)
+    return rollup(getDailyStakes(chain)[["total_staked"]], freq, "last")
 
 
+@cachedSeries
+@singleflight
 def getTimeSeriePNKStakedPercentage(
     chain: Literal["mainnet", "gnosis"] = "mainnet", freq="M"
 ) -> pd.DataFrame:
@@ -191,6 +291,148 @@ def getTimeSeriePNKStakedPercentage(
     return pnk_staked
 
 
+def _concentration(stakes: OrderStatistics) -> Dict[str, float]:
+    "concentration metrics of the stakes (in gwei) of the jurors"
+    if stakes.total == 0:
+        return {"jurors": 0, "total_staked": 0., "gini": np.nan, "nakamoto": 0,
+                "top10_share": np.nan, "top100_share": np.nan}
+    return {"jurors": stakes.count, "total_staked": stakes.total / 1e9, "gini": stakes.gini(),
+            "nakamoto": stakes.nakamoto(), "top10_share": stakes.largest(10) / stakes.total,
+            "top100_share": stakes.largest(100) / stakes.total}
+
+
+@metrics.timed
+def getStakeConcentrationFromStakes(df: pd.DataFrame, freq: Literal['D', 'W', 'M'] = 'D',
+                                    court: Union[int, None] = None) -> pd.DataFrame:
+    """from the setSakes dataframe (subgraph.getAllStakeSets()) get the
+    concentration of the stakes before each date: Gini, Nakamoto coefficient
+    (the fewest jurors with more than half of the stake) and share of the 10
+    and 100 largest stakes. The setStakes are swept in time order keeping the
+    stakes in an OrderStatistics, so each period costs O(changes * log n).
+
+    inputs:
+     - df: AllStakeSets dataframe
+     - court: subcourtID, to use the stakes set in that court instead of the
+       newTotalStake of the jurors
+    outputs:
+     - df: jurors, total_staked, gini, nakamoto, top10_share and top100_share
+       by time in frequency
+    """
+    dates: pd.DatetimeIndex = _stakesDates(df, freq)
+    column = "newTotalStake"
+    if court is not None:
+        df = df.loc[df["subcourtID"] == court]
+        column = "stake"
+    ids, _ = _addressIds(df)
+    timestamps = df["timestamp"].to_numpy()
+    order = np.argsort(timestamps, kind="stable")
+    # exact gwei amounts, from the WeiArray columns of subgraph.getAllStakeSetsFrame()
+    if f"{column}_hi" in df.columns:
+        gwei = df[f"{column}_hi"].to_numpy(dtype=np.int64)[order]
+    else:
+        gwei = np.rint(df[column].to_numpy(dtype=float) * 1e9).astype(np.int64)[order]
+    previous = pd.Series(gwei).groupby(ids[order]).shift(fill_value=0).to_numpy(dtype=np.int64)
+    last_events = np.searchsorted(timestamps[order], dates.to_numpy(), side="left")
+
+    stakes = OrderStatistics(np.unique(gwei[gwei > 0]).tolist())
+    rows: List[Dict[str, float]] = []
+    event = 0
+    for last_event in last_events:
+        for stake, previous_stake in zip(gwei[event:last_event].tolist(), previous[event:last_event].tolist()):
+            if previous_stake > 0:
+                stakes.remove(previous_stake)
+            if stake > 0:
+                stakes.add(stake)
+        event = last_event
+        rows.append(_concentration(stakes))
+    return pd.DataFrame(data=rows, index=dates,
+                        columns=["jurors", "total_staked", "gini", "nakamoto", "top10_share", "top100_share"])
+
+
+@cachedSeries
+@singleflight
+def getDailyStakeConcentration(chain: Literal["mainnet", "gnosis"] = "mainnet",
+                               court: Union[int, None] = None) -> pd.DataFrame:
+    """concentration of the stakes at the start of every day, the base serie
+    of the concentration in every frequency"""
+    return compute(getStakeConcentrationFromStakes, chain, {"df": "stake_sets"}, freq="D", court=court)
+
+
+@cachedSeries
+@singleflight
+def getTimeSerieStakeConcentration(chain: Literal["mainnet", "gnosis"] = "mainnet", freq: Literal["D", "W", "M"] = "M",
+                                   court: Union[int, None] = None) -> pd.DataFrame:
+    """a time serie with the concentration of the stakes of the jurors, of all
+    the courts or of one.
+
+    inputs:
+     - chain: string with mainnet or gnosis.
+     - freq: string with D, W or M.
+     - court: subcourtID, None for the total stakes of the jurors
+    outputs:
+     - df: jurors, total_staked, gini, nakamoto, top10_share and top100_share
+    """
+    return rollup(getDailyStakeConcentration(chain, court), freq, "last")
+
+
+# lower edges (PNK) of the bins of the stake histograms, one by decade
+stake_bins: np.ndarray = np.concatenate([[0], 10 ** np.arange(0, 10)])
+
+
+@metrics.timed
+def getStakeHistogramFromStakes(df: pd.DataFrame, freq: Literal['D', 'W', 'M'] = 'D') -> pd.DataFrame:
+    """from the setSakes dataframe (subgraph.getAllStakeSets()) get the count
+    of jurors by bin of newTotalStake (stake_bins) before each date. Each
+    setStake moves its juror from the bin of his previous stake to the one of
+    the new stake; those moves are added up by date and the cumulative sum is
+    the histogram, so it's never rebuilt from all the stakes.
+
+    inputs:
+     - df: AllStakeSets dataframe
+    outputs:
+     - df: a column of jurors by bin, named by its lower edge, by time in frequency
+    """
+    dates: pd.DatetimeIndex = _stakesDates(df, freq)
+    ids, _ = _addressIds(df)
+    timestamps = df["timestamp"].to_numpy()
+    order = np.argsort(timestamps, kind="stable")
+    stakes = df["newTotalStake"].to_numpy(dtype=float)[order]
+    previous = pd.Series(stakes).groupby(ids[order]).shift(fill_value=0.).to_numpy()
+    # the histogram of each date has the events before it
+    periods = np.searchsorted(dates.to_numpy(), timestamps[order], side="right")
+    moves = np.zeros((len(dates) + 1, len(stake_bins)), dtype=np.int64)
+    staked, previous_staked = stakes > 0, previous > 0
+    np.add.at(moves, (periods[staked], np.searchsorted(stake_bins, stakes[staked], side="right") - 1), 1)
+    np.add.at(moves, (periods[previous_staked],
+                      np.searchsorted(stake_bins, previous[previous_staked], side="right") - 1), -1)
+    return pd.DataFrame(data=np.cumsum(moves, axis=0)[:len(dates)], index=dates, columns=stake_bins)
+
+
+@cachedSeries
+@singleflight
+def getDailyStakeHistogram(chain: Literal["mainnet", "gnosis"] = "mainnet") -> pd.DataFrame:
+    """jurors by bin of stake at the start of every day, the base serie of the
+    histograms in every frequency"""
+    return compute(getStakeHistogramFromStakes, chain, {"df": "stake_sets"}, freq="D")
+
+
+@cachedSeries
+@singleflight
+def getTimeSerieStakeHistogram(chain: Literal["mainnet", "gnosis"] = "mainnet",
+                               freq: Literal["D", "W", "M"] = "M") -> pd.DataFrame:
+    """a time serie with the count of jurors by bin of total stake, log-spaced
+    (stake_bins), a period x bin matrix for a heatmap.
+
+    inputs:
+     - chain: string with mainnet or gnosis.
+     - freq: string with D, W or M.
+    outputs:
+     - df: a column of jurors by bin, named by its lower edge in PNK
+    """
+    return rollup(getDailyStakeHistogram(chain), freq, "last")
+
+
+@metrics.timed
 def gini(x, w=None) -> float:
     # The rest of the code requires numpy arrays.
     x = np.asarray(x)
@@ -213,28 +455,391 @@ def gini(x, w=None) -> float:
         return (n + 1 - 2 * np.sum(cumx) / cumx[-1]) / n
 
 
-def getHistoryFees(chain: Literal['mainnet', 'gnosis'], freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
-    # Get all paymens to jurors
-    kb = KlerosBoardSubgraph(network=chain)
-    transfers = pd.DataFrame(kb.getAllTransfers())
-    transfers['timestamp'] = pd.to_datetime(transfers.timestamp, unit='s')
-    transfers.sort_values('timestamp', inplace=True)
-    transfers = transfers.resample(rule='D', on='timestamp')['ETHAmount'].sum()
-    if chain == 'mainnet':
-        # get ETH price
-        days_before = (datetime.now() - transfers.index.min()).days
-        eth_price = CoinGecko().getETHhistoricPrice(days_before)
-        eth_price = pd.DataFrame(eth_price, columns=['timestamp', 'price'])
-        eth_price['timestamp'] = pd.to_datetime(eth_price['timestamp'], unit='ms')
-        transfers_eth_price = pd.merge_asof(
-            left=transfers, right=eth_price,
-            left_index=True, right_on='timestamp',
-            direction='forward', tolerance=timedelta(hours=23)
-        )
+def rollingSum(daily: pd.DataFrame, window: int) -> pd.DataFrame:
+    """sums over the last window days of a daily serie, in linear time for any
+    window with the prefix sums S of the serie: the sum of the days
+    i-window+1..i is S[i+1] - S[i+1-window].
+
+    inputs:
+     - daily: a serie with every day, e.g. from resample('D').sum()
+     - window: number of days
+    """
+    values = daily.to_numpy()
+    prefix = np.zeros((len(values) + 1,) + values.shape[1:], dtype=np.result_type(values.dtype, np.int64))
+    np.cumsum(values, axis=0, out=prefix[1:])
+    ends = np.arange(1, len(values) + 1)
+    sums = prefix[ends] - prefix[np.clip(ends - window, 0, None)]
+    return pd.DataFrame(sums, index=daily.index, columns=daily.columns)
+
+
+def rollingWindow(daily: pd.DataFrame, window: int, freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
+    "the sums over the last window days at the last day of each period of freq"
+    return rollingSum(daily, window).resample(freq).last()
+
+
+@metrics.timed
+def getCasesFromDisputes(df: pd.DataFrame, freq: Literal['D', 'W', 'M'] = 'M',
+                         since: Union[pd.Timestamp, None] = None) -> pd.DataFrame:
+    """from the disputes dataframe (subgraph.getAllDisputesFrame()) count the
+    cases raised.
+
+    inputs:
+     - since: if given, only the cases raised since then
+    outputs:
+     - df: a column of cases by time in frequency
+    """
+    if since is not None:
+        df = df.loc[df['startTime'] >= since]
+    cases = df[['id', 'startTime']].resample(rule=freq, on='startTime').count()
+    cases.rename(columns={'id': 'cases'}, inplace=True)
+    return cases
+
+
+@cachedSeries
+@singleflight
+def getDailyCases(chain: Literal['mainnet', 'gnosis']) -> pd.DataFrame:
+    """cases raised every day, the base serie of the cases in every frequency,
+    extended from the last day computed"""
+    return extendDaily(getDailyCases, chain, lambda since: compute(
+        getCasesFromDisputes, chain, {'df': 'disputes'}, freq='D', since=since))
+
+
+@cachedSeries
+@singleflight
+def getTimeSerieCases(chain: Literal['mainnet', 'gnosis'], freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
+    """Get the time serie of cases raised"""
+    return rollup(getDailyCases(chain), freq, 'sum')
+
+
+@cachedSeries
+@singleflight
+def getRollingCases(chain: Literal['mainnet', 'gnosis'], window: int,
+                    freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
+    """Get the time serie of cases raised in the last window days"""
+    return rollingWindow(getDailyCases(chain), window, freq)
+
+
+@metrics.timed
+def getTransactionsCountFromFrames(stake_sets: pd.DataFrame, votes: pd.DataFrame, transfers: pd.DataFrame,
+                                   draws: pd.DataFrame, disputes: pd.DataFrame,
+                                   freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
+    """count the same transactions as subgraph.getAllTransactions(): stake
+    sets, votes, transfers with ETH, draws and new disputes.
+
+    outputs:
+     - df: a column of tx by time in frequency
+    """
+    timestamps = pd.concat([stake_sets['timestamp'], votes['timestamp'],
+                            transfers.loc[transfers['ETHAmount'] > 0, 'timestamp'],
+                            draws['timestamp'], disputes['startTime']], ignore_index=True).dropna()
+    return pd.Series(1, index=pd.DatetimeIndex(timestamps)).resample(freq).sum().to_frame('tx')
+
+
+@cachedSeries
+@singleflight
+def getDailyTransactions(chain: Literal['mainnet', 'gnosis']) -> pd.DataFrame:
+    """transactions of every day, the base serie of the rolling windows"""
+    return compute(getTransactionsCountFromFrames, chain,
+                   {'stake_sets': 'stake_sets', 'votes': 'votes', 'transfers': 'transfers',
+                    'draws': 'draws', 'disputes': 'disputes'}, freq='D')
+
+
+@cachedSeries
+@singleflight
+def getRollingTransactions(chain: Literal['mainnet', 'gnosis'], window: int,
+                           freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
+    """Get the time serie of transactions in the last window days"""
+    return rollingWindow(getDailyTransactions(chain), window, freq)
+
+
+@metrics.timed
+def getHistoryFeesFromTransfers(transfers: pd.DataFrame, eth_price: Union[pd.DataFrame, None],
+                                freq: Literal['D', 'W', 'M'] = 'M',
+                                window: Union[int, None] = None,
+                                since: Union[pd.Timestamp, None] = None) -> pd.DataFrame:
+    """fees paid to the jurors in ETH and USD from all the transfers
+    (subgraph.getAllTransfersFrame()) and the eth prices of CoinGecko.
+
+    inputs:
+     - eth_price: timestamp and price of ETH, None if the fees are in xDAI.
+     - window: if given, the fees of the last window days instead of the
+       ones of each period.
+     - since: if given, only the fees of the transfers since then
+    outputs:
+     - df: ETHAmount_usd and ETHAmount by time in frequency.
+    """
+    if since is not None:
+        transfers = transfers.loc[transfers['timestamp'] >= since]
+    with profiling.span('resample'):
+        transfers = transfers.resample(rule='D', on='timestamp')['ETHAmount'].sum()
+    if eth_price is not None:
+        with profiling.span('merge_asof'):
+            transfers_eth_price = pd.merge_asof(
+                left=transfers, right=eth_price,
+                left_index=True, right_on='timestamp',
+                direction='forward', tolerance=timedelta(hours=23)
+            )
         transfers_eth_price['ETHAmount_usd'] = transfers_eth_price['ETHAmount'] * transfers_eth_price['price']
-    elif chain == 'gnosis':
+    else:
         # xDAI is already in USD.
         transfers_eth_price = pd.DataFrame(transfers)
         transfers_eth_price['ETHAmount_usd'] = transfers_eth_price['ETHAmount']
-    transfers_eth_price = transfers_eth_price.resample(rule=freq)['ETHAmount_usd', 'ETHAmount'].sum()
-    return transfers_eth_price
\ No newline at end of file
+    with profiling.span('resample'):
+        if window is None:
+            transfers_eth_price = transfers_eth_price.resample(rule=freq)[['ETHAmount_usd', 'ETHAmount']].sum()
+        else:
+            # the days without price count as 0, as in the sums by period
+            transfers_eth_price = rollingWindow(
+                transfers_eth_price[['ETHAmount_usd', 'ETHAmount']].fillna(0.), window, freq)
+    return transfers_eth_price
+
+
+@cachedSeries
+@singleflight
+def getDailyFees(chain: Literal['mainnet', 'gnosis']) -> pd.DataFrame:
+    """fees of every day in ETH and USD, the base serie of the fees in every
+    frequency, extended from the last day computed with the prices since then"""
+    def feesSince(since: Union[pd.Timestamp, None]) -> pd.DataFrame:
+        eth_price = None
+        if chain == 'mainnet':
+            # get ETH price
+            first_day = since if since is not None else \
+                getDataset(chain).frame('transfers')['timestamp'].min().normalize()
+            # over 90 days CoinGecko gives daily prices, as for the whole history
+            days_before = max((datetime.now() - first_day).days + 1, 91)
+            eth_price = CoinGecko().getETHhistoricPrice(days_before)
+            eth_price = pd.DataFrame(eth_price, columns=['timestamp', 'price'])
+            eth_price['timestamp'] = pd.to_datetime(eth_price['timestamp'], unit='ms')
+        return compute(getHistoryFeesFromTransfers, chain, {'transfers': 'transfers'},
+                       eth_price=eth_price, freq='D', since=since)
+    return extendDaily(getDailyFees, chain, feesSince)
+
+
+@cachedSeries
+@singleflight
+def getHistoryFees(chain: Literal['mainnet', 'gnosis'], freq: Literal['D', 'W', 'M'] = 'M',
+                   window: Union[int, None] = None) -> pd.DataFrame:
+    """fees paid to the jurors in ETH and USD by time in frequency, or over
+    the last window days at the end of each period"""
+    if window is not None:
+        return rollingWindow(getDailyFees(chain), window, freq)
+    return rollup(getDailyFees(chain), freq, 'sum')
+
+@metrics.timed
+def getJurorsCoherenceFromVotes(df: pd.DataFrame) -> pd.DataFrame:
+    """from the votes dataframe (subgraph.getAllVotesFrame()) compute the
+    coherence of every juror at once.
+
+    inputs:
+     - df: AllVotes dataframe
+    outputs:
+     - df: indexed by address with the votes, ruled_cases, coherent_votes
+           and coherency of each juror.
+    """
+    ids, addresses = _addressIds(df)
+    coherent = df['ruled'] & (df['choice'] == df['currentRulling']).fillna(False).astype(bool)
+    jurors = pd.DataFrame({
+        'votes': np.ones(len(df), dtype=np.int64),
+        'ruled_cases': df['ruled'].to_numpy(dtype=np.int64),
+        'coherent_votes': coherent.to_numpy(dtype=np.int64),
+    }).groupby(by=ids).sum()
+    jurors.index = pd.Index(addresses[jurors.index], name='address')
+    jurors['coherency'] = jurors['coherent_votes'] / jurors['ruled_cases'].where(
+        jurors['ruled_cases'] > 0)
+    return jurors
+
+
+@metrics.timed
+def getJurorsVotesByCourtFromVotes(df: pd.DataFrame) -> pd.DataFrame:
+    """from the votes dataframe (subgraph.getAllVotesFrame()) count the votes
+    of every juror in each court.
+
+    inputs:
+     - df: AllVotes dataframe
+    outputs:
+     - df: indexed by address with one column per court.
+    """
+    ids, addresses = _addressIds(df)
+    by_court = pd.crosstab(index=ids, columns=df['subcourtID'].to_numpy())
+    by_court.index = pd.Index(addresses[by_court.index], name='address')
+    by_court.columns.name = 'subcourtID'
+    return by_court
+
+
+@metrics.timed
+def getTimeSerieCoherenceByCourtFromVotes(df: pd.DataFrame, freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
+    """from the votes dataframe (subgraph.getAllVotesFrame()) get the coherence
+    rate of the votes in ruled disputes, by court and by vote time.
+
+    inputs:
+     - df: AllVotes dataframe
+    outputs:
+     - df: indexed by time in frequency with one column per court.
+    """
+    ruled = df.loc[df['ruled'], ['timestamp', 'subcourtID', 'choice', 'currentRulling']]
+    ruled = ruled.assign(coherent=(ruled['choice'] == ruled['currentRulling']).fillna(False).astype(bool))
+    grouped = ruled.groupby(by=[pd.Grouper(key='timestamp', freq=freq), 'subcourtID'])['coherent']
+    return grouped.mean().unstack('subcourtID')
+
+
+@cachedSeries
+@singleflight
+def getJurorsLeaderboard(chain: Literal['mainnet', 'gnosis'] = 'mainnet') -> pd.DataFrame:
+    """coherence and votes by court of every juror from a single pull of votes,
+    sorted by the number of ruled cases."""
+    votes: pd.DataFrame = getDataset(chain).frame('votes')
+    jurors: pd.DataFrame = getJurorsCoherenceFromVotes(votes)
+    by_court: pd.DataFrame = getJurorsVotesByCourtFromVotes(votes).add_prefix('votes_court_')
+    jurors = jurors.join(by_court)
+    return jurors.sort_values(by=['ruled_cases', 'coherency'], ascending=False)
+
+
+@metrics.timed
+def getCoherentVotesByCourtFromVotes(df: pd.DataFrame, freq: Literal['D', 'W', 'M'] = 'D') -> pd.DataFrame:
+    """from the votes dataframe (subgraph.getAllVotesFrame()) count the votes
+    in ruled disputes and the coherent ones, by court and by vote time, to
+    roll them up and divide them in any frequency.
+
+    outputs:
+     - df: indexed by time in frequency with the coherent and votes columns
+           of each court.
+    """
+    ruled = df.loc[df['ruled'], ['timestamp', 'subcourtID', 'choice', 'currentRulling']]
+    ruled = ruled.assign(coherent=(ruled['choice'] == ruled['currentRulling']).fillna(False).astype(np.int64))
+    grouped = ruled.groupby(by=[pd.Grouper(key='timestamp', freq=freq), 'subcourtID'])['coherent']
+    counts = grouped.agg(['sum', 'count']).rename(columns={'sum': 'coherent', 'count': 'votes'})
+    return counts.unstack('subcourtID', fill_value=0)
+
+
+@cachedSeries
+@singleflight
+def getDailyCoherentVotesByCourt(chain: Literal['mainnet', 'gnosis'] = 'mainnet') -> pd.DataFrame:
+    """votes in ruled disputes and coherent ones of every day by court, the
+    base serie of the coherence in every frequency"""
+    return getCoherentVotesByCourtFromVotes(getDataset(chain).frame('votes'), 'D')
+
+
+@cachedSeries
+@singleflight
+def getTimeSerieCoherenceByCourt(chain: Literal['mainnet', 'gnosis'] = 'mainnet', freq: Literal['D', 'W', 'M'] = 'M') -> pd.DataFrame:
+    """Get the time serie of coherence rate by court"""
+    counts: pd.DataFrame = rollup(getDailyCoherentVotesByCourt(chain), freq, 'sum')
+    coherence = counts['coherent'] / counts['votes'].where(counts['votes'] > 0)
+    # the periods without ruled votes, as the ones without groups of the mean
+    return coherence.dropna(how='all')
+
+
+def getDailyPrices(chain: Literal['mainnet', 'gnosis'], timestamp_from: float) -> pd.DataFrame:
+    """daily eth_price and pnk_price in USD since timestamp_from (unit s),
+    indexed by day. In gnosis the reward currency is xDAI, so eth_price is 1.
+    """
+    prices: pd.DataFrame = KlerosBoardSubgraph._getHistoricPrices(timestamp_from, network=chain)
+    prices = prices[['eth_price', 'pnk_price']]
+    prices.index = pd.to_datetime(prices.index)
+    return prices
+
+
+def _pricesAt(prices: pd.DataFrame, timestamps: pd.Series) -> pd.DataFrame:
+    "prices of the day of each timestamp, aligned with the timestamps"
+    aligned = prices.reindex(timestamps.dt.normalize(), method='nearest')
+    aligned.index = timestamps.index
+    return aligned
+
+
+def _transfersUSD(transfers: pd.DataFrame, prices: pd.DataFrame) -> pd.Series:
+    "USD value of the ETH and token amount of each transfer at the price of its day"
+    transfer_prices = _pricesAt(prices, transfers['timestamp'])
+    return transfers['ETHAmount'] * transfer_prices['eth_price'] \
+        + transfers['tokenAmount'] * transfer_prices['pnk_price']
+
+
+@metrics.timed
+def getJurorsNetRewardFromFrames(transfers: pd.DataFrame, votes: pd.DataFrame, prices: pd.DataFrame) -> pd.DataFrame:
+    """net reward of every juror from all the transfers (subgraph.getAllTransfersFrame())
+    and votes (subgraph.getAllVotesFrame()), valued with a daily price serie (getDailyPrices).
+
+    outputs:
+     - df: indexed by address with the ETHRewards, tokenRewards, rewards_usd,
+           gas_cost (in ETH), gas_cost_usd and net_usd of each juror.
+    """
+    transfer_ids, addresses = _addressIds(transfers)
+    transfers = transfers.assign(rewards_usd=_transfersUSD(transfers, prices))
+    rewards = transfers.groupby(by=transfer_ids)[['ETHAmount', 'tokenAmount', 'rewards_usd']].sum()
+    rewards.index = pd.Index(addresses[rewards.index], name='address')
+    rewards.rename(columns={'ETHAmount': 'ETHRewards', 'tokenAmount': 'tokenRewards'}, inplace=True)
+
+    vote_ids, addresses = _addressIds(votes)
+    vote_prices = _pricesAt(prices, votes['timestamp'])
+    votes = votes.assign(gas_cost_usd=votes['totalGasCost'] * vote_prices['eth_price'])
+    gas = votes.groupby(by=vote_ids)[['totalGasCost', 'gas_cost_usd']].sum()
+    gas.index = pd.Index(addresses[gas.index], name='address')
+    gas.rename(columns={'totalGasCost': 'gas_cost'}, inplace=True)
+
+    jurors = rewards.join(gas, how='outer').fillna(0.)
+    jurors['net_usd'] = jurors['rewards_usd'] - jurors['gas_cost_usd']
+    return jurors
+
+
+@cachedSeries
+@singleflight
+def getJurorsNetReward(chain: Literal['mainnet', 'gnosis'] = 'mainnet') -> pd.DataFrame:
+    """net reward in USD of every juror, computed with a single pull of transfers,
+    votes and prices instead of one getNetRewardProfile per juror."""
+    dataset = getDataset(chain)
+    transfers: pd.DataFrame = dataset.frame('transfers')
+    votes: pd.DataFrame = dataset.frame('votes')
+    oldest = min(transfers['timestamp'].min(), votes['timestamp'].min())
+    prices: pd.DataFrame = getDailyPrices(chain, oldest.timestamp())
+    jurors = getJurorsNetRewardFromFrames(transfers, votes, prices)
+    return jurors.sort_values(by='net_usd', ascending=False)
+
+
+@metrics.timed
+def getUSDThroughFromTransfers(transfers: pd.DataFrame, prices: pd.DataFrame,
+                               by: Literal['subcourtID', 'arbitrable'] = 'subcourtID',
+                               freq: Union[Literal['D', 'W', 'M'], None] = None) -> pd.DataFrame:
+    """USD through every court or arbitrable from all the transfers
+    (subgraph.getAllTransfersFrame()) valued with a daily price serie (getDailyPrices).
+
+    inputs:
+     - by: subcourtID or arbitrable.
+     - freq: if None, the totals by entity. Else, a time serie in frequency.
+    outputs:
+     - df: indexed by entity with the ETHAmount, tokenAmount and usd_amount
+           totals, or indexed by time with the usd_amount of each entity as columns.
+    """
+    transfers = transfers.assign(usd_amount=_transfersUSD(transfers, prices))
+    if freq is None:
+        return transfers.groupby(by=by, observed=True)[['ETHAmount', 'tokenAmount', 'usd_amount']].sum()
+    # observed, the arbitrables mapped from a store are categoricals
+    grouped = transfers.groupby(by=[pd.Grouper(key='timestamp', freq=freq), by], observed=True)['usd_amount']
+    return grouped.sum().unstack(by, fill_value=0.)
+
+
+@cachedSeries
+@singleflight
+def getUSDThroughAll(chain: Literal['mainnet', 'gnosis'] = 'mainnet',
+                     by: Literal['subcourtID', 'arbitrable'] = 'subcourtID',
+                     freq: Literal['D', 'W', 'M'] = 'M') -> Dict[str, pd.DataFrame]:
+    """totals and time serie of the USD through every court or arbitrable,
+    with a single pull of transfers and prices instead of one getUSDThroughCourt
+    or getUSDThroughArbitrable per entity."""
+    transfers: pd.DataFrame = getDataset(chain).frame('transfers')
+    prices: pd.DataFrame = getDailyPrices(chain, transfers['timestamp'].min().timestamp())
+    return {'totals': getUSDThroughFromTransfers(transfers, prices, by=by),
+            'serie': getUSDThroughFromTransfers(transfers, prices, by=by, freq=freq)}
+
+
+def precomputeSeries(chains: Tuple[str, ...] = ('mainnet', 'gnosis'), freq: Literal['D', 'W', 'M'] = 'M') -> None:
+    """compute the series of the API of every chain in parallel, to have them
+    cached before the first requests"""
+    calls = []
+    for chain in chains:
+        calls.extend([(getTimeSerieActiveJurors, (chain, freq), {}),
+                      (getTimeSeriePNKStakedPercentage, (chain, freq), {}),
+                      (getHistoryFees, (chain, freq), {}),
+                      (getTimeSerieCases, (chain, freq), {}),
+                      (getTimeSerieCoherenceByCourt, (chain, freq), {}),
+                      (getJurorsLeaderboard, (chain,), {}),
+                      (getUSDThroughAll, (chain, 'subcourtID', freq), {})])
+    precompute(calls)
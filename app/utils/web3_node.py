@@ -1,10 +1,12 @@
 from typing import Dict, Literal
 
-from web3 import Web3
-
 
 class web3Node():
     def __init__(self, network:Literal['mainnet', 'gnosis']='mainnet') -> None:
+        # web3 is slow to import and only needed here, so it's imported at the
+        # first connection instead of at the startup of every worker.
+        from web3 import Web3
+
         self.network: Literal['mainnet', 'gnosis'] = network
         if self.network == 'gnosis':
             rpc_url = 'https://rpc.ankr.com/gnosis'
@@ -0,0 +1,115 @@
+from typing import Iterable, List, Union
+import numpy as np
+import pandas as pd
+
+# the wei amounts are kept as two int64 limbs in base 10**9:
+# wei = hi * 10**9 + lo, with 0 <= lo < 10**9, so hi is the (floor) gwei amount.
+LIMB = 10**9
+_LIMB_DIGITS = 9
+
+
+class WeiArray():
+    """
+    Exact fixed-point array of wei amounts. Sums and cumulative sums are exact,
+    the conversion to float is done only at presentation time with toEth().
+    """
+
+    def __init__(self, hi: np.ndarray, lo: np.ndarray) -> None:
+        self.hi: np.ndarray = np.asarray(hi, dtype=np.int64)
+        self.lo: np.ndarray = np.asarray(lo, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.hi)
+
+    def __getitem__(self, key) -> 'WeiArray':
+        return WeiArray(self.hi[key], self.lo[key])
+
+    def __repr__(self) -> str:
+        return f'WeiArray({self.toInts()!r})'
+
+    def __neg__(self) -> 'WeiArray':
+        borrow = self.lo > 0
+        return WeiArray(-self.hi - borrow, np.where(borrow, LIMB - self.lo, 0))
+
+    def __add__(self, other: 'WeiArray') -> 'WeiArray':
+        return self._normalize(self.hi + other.hi, self.lo + other.lo)
+
+    def __sub__(self, other: 'WeiArray') -> 'WeiArray':
+        return self._normalize(self.hi - other.hi, self.lo - other.lo)
+
+    @staticmethod
+    def _normalize(hi: np.ndarray, lo: np.ndarray) -> 'WeiArray':
+        carry, lo = np.divmod(lo, LIMB)
+        return WeiArray(hi + carry, lo)
+
+    @classmethod
+    def zeros(cls, n: int) -> 'WeiArray':
+        return cls(np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64))
+
+    @classmethod
+    def fromColumns(cls, df: pd.DataFrame, name: str) -> 'WeiArray':
+        "read the array stored with toColumns"
+        return cls(df[f'{name}_hi'].to_numpy(), df[f'{name}_lo'].to_numpy())
+
+    def toColumns(self, df: pd.DataFrame, name: str) -> pd.DataFrame:
+        "store the limbs in the columns name_hi and name_lo of the dataframe"
+        df[f'{name}_hi'] = self.hi
+        df[f'{name}_lo'] = self.lo
+        return df
+
+    def isZero(self) -> np.ndarray:
+        return (self.hi == 0) & (self.lo == 0)
+
+    def sum(self) -> int:
+        "exact total, as a python int in wei"
+        # the gwei part is split again so its sum can't overflow int64
+        hi_hi, hi_lo = np.divmod(self.hi, LIMB)
+        return (int(hi_hi.sum()) * LIMB + int(hi_lo.sum())) * LIMB \
+            + int(self.lo.sum())
+
+    def cumsum(self) -> 'WeiArray':
+        "exact while the partial sums are below ~9.2e9 ETH (int64 gwei)"
+        return self._normalize(np.cumsum(self.hi), np.cumsum(self.lo))
+
+    def toEth(self) -> np.ndarray:
+        "float amounts in ETH (or PNK), only for presentation"
+        # convert the magnitude to avoid the cancellation of the limbs
+        negative = self.hi < 0
+        magnitude = -self
+        hi = np.where(negative, magnitude.hi, self.hi)
+        lo = np.where(negative, magnitude.lo, self.lo)
+        eth = hi * 10**-9 + lo * 10**-18
+        return np.where(negative, -eth, eth)
+
+    def toInts(self) -> List[int]:
+        "exact amounts in wei, as python ints"
+        return [int(hi) * LIMB + int(lo) for hi, lo in zip(self.hi, self.lo)]
+
+
+def parseWei(values: Union[Iterable[str], pd.Series]) -> WeiArray:
+    """
+    Parse the decimal strings of wei amounts (BigInt fields of the subgraph)
+    into a WeiArray. The whole page is parsed at once, split in two fixed
+    width columns of digits. None values are parsed as 0.
+    """
+    strings = pd.Series(values, dtype=object).fillna('0').to_numpy(dtype='S')
+    n = len(strings)
+    if n == 0:
+        return WeiArray.zeros(0)
+    width = max(strings.dtype.itemsize, _LIMB_DIGITS + 1)
+    # right align with leading zeros, the sign stays in the first char.
+    chars = np.char.zfill(strings, width).view(np.uint8).reshape(n, width).copy()
+    negative = chars[:, 0] == ord('-')
+    chars[negative, 0] = ord('0')
+    # numpy parses the fixed width columns of digits to int64 in C
+    lo = np.ascontiguousarray(chars[:, -_LIMB_DIGITS:]).view(
+        f'S{_LIMB_DIGITS}').ravel().astype(np.int64)
+    hi = np.ascontiguousarray(chars[:, :-_LIMB_DIGITS]).view(
+        f'S{width - _LIMB_DIGITS}').ravel().astype(np.int64)
+
+    wei = WeiArray(hi, lo)
+    if negative.any():
+        negated = -wei
+        wei = WeiArray(np.where(negative, negated.hi, wei.hi),
+                       np.where(negative, negated.lo, wei.lo))
+    return wei
@@ -0,0 +1,307 @@
+"""
+Benchmarks of the series of app/utils/utils.py and of the parsing of the
+subgraph responses, on synthetic datasets (tools/synthetic) of several sizes,
+fully offline: the raw responses are answered in process by the fixtures of
+the stand-in (tools/standin).
+
+    python benchmarks/functions.py --sizes 10000 30000 100000 --freqs D W M --output after.json
+    python benchmarks/functions.py --compare before.json after.json --threshold 0.2
+
+For every benchmark, frequency and size it reports the wall time (best of
+--repeat runs), the peak of the memory allocated during a run (tracemalloc,
+in a run of its own) and, over the sizes, the scaling exponents k of
+time ~ n^k and peak ~ n^k (least squares in log-log), n being the rows of the
+input. With --compare it prints the ratios of two reports and exits with 1 if
+a time or a peak grew more than --threshold.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app.utils import utils  # noqa: E402
+from app.utils.subgraph import KlerosBoardSubgraph  # noqa: E402
+from tools.standin.entities import SubgraphFixture  # noqa: E402
+from tools.synthetic import Config, generate  # noqa: E402
+from tools.synthetic.writers import frames, writeFixtures  # noqa: E402
+
+FREQS: List[str] = ['D', 'W', 'M']
+# the raw collections and the methods that fetch them
+RAW: Dict[str, str] = {'disputes': '_getAllDisputesRaw', 'stake_sets': '_getAllStakeSetsRaw',
+                       'votes': '_getAllVotesRaw', 'transfers': '_getAllTransfersRaw',
+                       'draws': '_getAllDrawsRaw'}
+
+
+class OfflineSubgraph(KlerosBoardSubgraph):
+    "the subgraph answered in process by a fixture of the stand-in"
+
+    def __init__(self, fixture: SubgraphFixture, network: str = 'mainnet') -> None:
+        super(OfflineSubgraph, self).__init__(network=network)
+        self.fixture: SubgraphFixture = fixture
+
+    def _postRaw(self, query) -> Dict:
+        return self.fixture.execute(query)
+
+
+class Inputs():
+    """
+    The inputs of the benchmarks of one size: the frames of the dataset, the
+    raw responses of the subgraph (as json, every run parses its own copy
+    because the item parsers modify them) and the lists of getAll* methods.
+    """
+
+    def __init__(self, events: int, seed: int, network: str) -> None:
+        dataset = generate(Config(events=events, seed=seed, network=network))
+        self.events: int = events
+        self.frames: Dict[str, pd.DataFrame] = frames(dataset)
+        with tempfile.TemporaryDirectory() as fixtures_dir:
+            path = writeFixtures(dataset, fixtures_dir)[0]
+            self.subgraph: OfflineSubgraph = OfflineSubgraph(SubgraphFixture(path), network)
+            self.raw: Dict[str, str] = {name: json.dumps(getattr(self.subgraph, method)())
+                                        for name, method in RAW.items()}
+            self.time_periods: Dict = self.subgraph.getTimePeriodsAllCourts()
+            self.lists: Dict[str, Any] = {
+                'getAllVotes': self.subgraph.getAllVotes(),
+                'getAllDisputesFrame': self.subgraph.getAllDisputesFrame(),
+                'getAllStakeSets': self.subgraph.getAllStakeSets(),
+                'getAllTransfers': self.subgraph.getAllTransfers(),
+                'getAllDraws': self.subgraph.getAllDraws()}
+        self.eth_price: Union[pd.DataFrame, None] = None
+        if network == 'mainnet':
+            self.eth_price = pd.DataFrame({'timestamp': pd.to_datetime(dataset.prices['timestamp'], unit='ms'),
+                                           'price': dataset.prices['eth']})
+
+    def rawItems(self, name: str) -> List[Dict]:
+        return json.loads(self.raw[name])
+
+
+# a benchmark prepares (untimed) the call to time and the rows of its input
+Prepared = Tuple[Callable[[], Any], Union[int, None]]
+
+
+def _stakesSerie(function: Callable) -> Callable[[Inputs, str], Prepared]:
+    def prepare(inputs: Inputs, freq: str) -> Prepared:
+        # the series sort the frame in place
+        df = inputs.frames['stake_sets'].copy()
+        return (lambda: function(df, freq=freq)), len(df)
+    return prepare
+
+
+def _totalSupply(inputs: Inputs, freq: str) -> Prepared:
+    "it has no input, the size of the serie only depends on the frequency"
+    return (lambda: utils.getTotalSupplyTimeSerie(freq=freq)), None
+
+
+def _historyFees(inputs: Inputs, freq: str) -> Prepared:
+    "getHistoryFees without the dataset and CoinGecko, the prices are the synthetic ones"
+    transfers = inputs.frames['transfers']
+    return (lambda: utils.getHistoryFeesFromTransfers(transfers, inputs.eth_price, freq=freq)), len(transfers)
+
+
+def _gini(inputs: Inputs, freq: None) -> Prepared:
+    stakes = inputs.frames['stake_sets']['newTotalStake'].to_numpy()
+    return (lambda: utils.gini(stakes)), len(stakes)
+
+
+def _allTransactions(inputs: Inputs, freq: None) -> Prepared:
+    "the assembly of getAllTransactions from the lists of the getAll* methods"
+    subgraph = OfflineSubgraph(inputs.subgraph.fixture, inputs.subgraph.network)
+    for method, items in inputs.lists.items():
+        # the disputes frame gets the tx and timestamp columns
+        items = items.copy() if isinstance(items, pd.DataFrame) else items
+        setattr(subgraph, method, lambda items=items: items)
+    return subgraph.getAllTransactions, sum(len(items) for items in inputs.lists.values())
+
+
+def _parseFrame(name: str, method: str) -> Callable[[Inputs, None], Prepared]:
+    def prepare(inputs: Inputs, freq: None) -> Prepared:
+        items = inputs.rawItems(name)
+        parse = getattr(KlerosBoardSubgraph, method)
+        if name == 'disputes':
+            return (lambda: parse(items, inputs.time_periods)), len(items)
+        return (lambda: parse(items)), len(items)
+    return prepare
+
+
+def _parseItems(name: str, method: str) -> Callable[[Inputs, None], Prepared]:
+    def prepare(inputs: Inputs, freq: None) -> Prepared:
+        items = inputs.rawItems(name)
+        parse = getattr(inputs.subgraph, method)
+        if name == 'votes':
+            return (lambda: [parse(item, item['dispute']['numberOfChoices']) for item in items]), len(items)
+        return (lambda: [parse(item) for item in items]), len(items)
+    return prepare
+
+
+# name: (prepare, by frequency)
+BENCHMARKS: Dict[str, Tuple[Callable[..., Prepared], bool]] = {
+    'getTimeSerieActiveJurorsFromStakes': (_stakesSerie(utils.getTimeSerieActiveJurorsFromStakes), True),
+    'getTimeSeriePNKStakedFromStakes': (_stakesSerie(utils.getTimeSeriePNKStakedFromStakes), True),
+    'getTotalSupplyTimeSerie': (_totalSupply, True),
+    'getHistoryFees': (_historyFees, True),
+    'gini': (_gini, False),
+    'getAllTransactions': (_allTransactions, False),
+    '_parseDisputesFrame': (_parseFrame('disputes', '_parseDisputesFrame'), False),
+    '_parseStakeSetsFrame': (_parseFrame('stake_sets', '_parseStakeSetsFrame'), False),
+    '_parseVotesFrame': (_parseFrame('votes', '_parseVotesFrame'), False),
+    '_parseTransfersFrame': (_parseFrame('transfers', '_parseTransfersFrame'), False),
+    '_parseDrawsFrame': (_parseFrame('draws', '_parseDrawsFrame'), False),
+    '_parseStakeSet': (_parseItems('stake_sets', '_parseStakeSet'), False),
+    '_parseVote': (_parseItems('votes', '_parseVote'), False),
+    '_parseTransfer': (_parseItems('transfers', '_parseTransfer'), False),
+    '_parseDraw': (_parseItems('draws', '_parseDraw'), False),
+}
+
+
+def measure(prepare: Callable[..., Prepared], inputs: Inputs, freq: Union[str, None], repeat: int) -> Dict:
+    "best wall time of the runs and peak allocated in one more, each run on a fresh input"
+    times = []
+    for _ in range(repeat):
+        call, n = prepare(inputs, freq)
+        gc.collect()
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    call, n = prepare(inputs, freq)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'n': n, 'time_s': min(times), 'peak_bytes': peak}
+
+
+def exponent(sizes: List[float], values: List[float]) -> Union[float, None]:
+    "slope of the least squares line of log(values) over log(sizes)"
+    points = [(size, value) for size, value in zip(sizes, values) if size and value and value > 0]
+    if len(set(size for size, _ in points)) < 2:
+        return None
+    x, y = np.log([size for size, _ in points]), np.log([value for _, value in points])
+    return float(np.polyfit(x, y, 1)[0])
+
+
+def run(names: List[str], sizes: List[int], freqs: List[str], repeat: int, seed: int, network: str) -> Dict:
+    results = []
+    for events in sizes:
+        inputs = Inputs(events, seed, network)
+        for name in names:
+            prepare, by_freq = BENCHMARKS[name]
+            for freq in freqs if by_freq else [None]:
+                if name == 'getTotalSupplyTimeSerie' and events != sizes[0]:
+                    # the same at every size
+                    continue
+                result = {'benchmark': name, 'freq': freq, 'events': events}
+                try:
+                    result.update(measure(prepare, inputs, freq, repeat))
+                except Exception as error:
+                    result['error'] = f'{type(error).__name__}: {error}'
+                results.append(result)
+                print(_line(result), file=sys.stderr)
+        del inputs
+    return {'meta': {'python': platform.python_version(), 'pandas': pd.__version__,
+                     'numpy': np.__version__, 'machine': platform.machine(),
+                     'processor': platform.processor(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'sizes': sizes, 'freqs': freqs, 'repeat': repeat, 'seed': seed, 'network': network},
+            'results': results, 'scaling': scaling(results)}
+
+
+def _groups(results: List[Dict]) -> Iterator[Tuple[Tuple[str, Union[str, None]], List[Dict]]]:
+    groups: Dict[Tuple[str, Union[str, None]], List[Dict]] = {}
+    for result in results:
+        groups.setdefault((result['benchmark'], result['freq']), []).append(result)
+    return iter(groups.items())
+
+
+def scaling(results: List[Dict]) -> List[Dict]:
+    "the scaling exponents of each benchmark and frequency"
+    exponents = []
+    for (name, freq), group in _groups(results):
+        group = [result for result in group if 'error' not in result]
+        sizes = [result['n'] for result in group]
+        exponents.append({'benchmark': name, 'freq': freq,
+                          'time_exponent': exponent(sizes, [result['time_s'] for result in group]),
+                          'peak_exponent': exponent(sizes, [result['peak_bytes'] for result in group])})
+    return exponents
+
+
+def _line(result: Dict) -> str:
+    head = f"{result['benchmark']:<38} {result['freq'] or '-':<2} {result['events']:>10}"
+    if 'error' in result:
+        return f"{head}  error: {result['error']}"
+    n = result['n'] if result['n'] is not None else '-'
+    return f"{head} {n:>10} {result['time_s'] * 1000:>11.2f} ms {result['peak_bytes'] / 2**20:>9.1f} MB"
+
+
+def compare(before: Dict, after: Dict, threshold: float) -> Tuple[List[Dict], bool]:
+    "the ratios after / before of the results in both reports, and if any grew over the threshold"
+    def key(result: Dict) -> Tuple:
+        return result['benchmark'], result['freq'], result['events']
+    previous = {key(result): result for result in before['results'] if 'error' not in result}
+    ratios, regression = [], False
+    for result in after['results']:
+        old = previous.get(key(result))
+        if old is None or 'error' in result:
+            continue
+        ratio = {'benchmark': result['benchmark'], 'freq': result['freq'], 'events': result['events'],
+                 'time_ratio': result['time_s'] / old['time_s'] if old['time_s'] else None,
+                 'peak_ratio': result['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] else None}
+        ratio['regression'] = any(value is not None and value > 1 + threshold
+                                  for value in (ratio['time_ratio'], ratio['peak_ratio']))
+        regression = regression or ratio['regression']
+        ratios.append(ratio)
+    return ratios, regression
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 30000, 100000],
+                        help='events of the synthetic datasets')
+    parser.add_argument('--freqs', nargs='+', choices=FREQS, default=FREQS)
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--network', choices=['mainnet', 'gnosis'], default='mainnet')
+    parser.add_argument('--output', help='json file of the report')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='json reports to compare')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative growth of a time or a peak considered a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as report_file:
+                reports.append(json.load(report_file))
+        ratios, regression = compare(reports[0], reports[1], args.threshold)
+        for ratio in ratios:
+            print(f"{ratio['benchmark']:<38} {ratio['freq'] or '-':<2} {ratio['events']:>10} "
+                  f"time x{ratio['time_ratio'] or float('nan'):.2f} "
+                  f"peak x{ratio['peak_ratio'] or float('nan'):.2f}"
+                  + ('  REGRESSION' if ratio['regression'] else ''))
+        return 1 if regression else 0
+
+    report = run(args.benchmarks, sorted(args.sizes), args.freqs, args.repeat, args.seed, args.network)
+    for exponents in report['scaling']:
+        print(json.dumps(exponents))
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
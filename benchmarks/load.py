@@ -0,0 +1,283 @@
+"""
+Load test of the API: boots it with gunicorn against the local stand-in of the
+subgraphs and CoinGecko (tools/standin), serving a synthetic dataset
+(tools/synthetic) or the fixtures of --fixtures, and replays a mix of requests
+at a target rate and concurrency, once for every worker class and count.
+
+    python benchmarks/load.py --worker-class sync gthread uvicorn --workers 2 4 --rate 50 --concurrency 32 --duration 60
+
+The mix is a list of PATH:WEIGHT, each path is requested with a probability
+proportional to its weight. The requests are scheduled at --rate per second
+(open loop) and sent by up to --concurrency clients; the latency is measured
+from the scheduled time, so the waits for a free client count too, and the
+requests still waiting when the test ends are reported as not sent. With
+--rate 0 every client sends the next request as soon as it gets the response
+(closed loop). The first --warmup seconds aren't reported.
+
+Prints a JSON report with the throughput, the p50, p95 and p99 latency and the
+error rate of every path and of all of them, for every worker class and count.
+"""
+from typing import Dict, List, Tuple, Union
+import argparse
+import json
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# worker class: gunicorn worker class and app
+WORKER_CLASSES: Dict[str, Tuple[str, str]] = {
+    'sync': ('sync', 'app.app:app'),
+    'gthread': ('gthread', 'app.app:app'),
+    'uvicorn': ('uvicorn.workers.UvicornWorker', 'app.asgi:app'),
+}
+
+MIX: List[str] = [
+    '/counters/1:4', '/counters/100:2',
+    '/history/active-jurors/1?freq=M:2', '/history/active-jurors/100?freq=W:1',
+    '/history/cases/1?freq=M:2', '/history/fees/1?freq=M:2', '/history/fees/100?freq=D:1',
+    '/history/staked-percentage/1?freq=M:1', '/history/transactions/1?freq=M:1',
+    '/history/coherence/1?freq=M:1', '/status:1',
+]
+
+# path, scheduled time, latency and status (or the name of the exception)
+Record = Tuple[str, float, float, Union[int, str]]
+
+
+def parseMix(entries: List[str]) -> Tuple[List[str], List[float]]:
+    "paths and weights of PATH:WEIGHT entries, the weight is 1 if missing"
+    paths, weights = [], []
+    for entry in entries:
+        path, _, weight = entry.rpartition(':')
+        if path == '' or not weight.replace('.', '', 1).isdigit():
+            path, weight = entry, '1'
+        paths.append(path)
+        weights.append(float(weight))
+    return paths, weights
+
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def waitReady(url: str, process: subprocess.Popen, timeout: float) -> None:
+    "wait until the url answers, or raise if the process exits or the timeout passes"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{" ".join(process.args)} exited with {process.returncode}')
+        try:
+            requests.get(url, timeout=max(deadline - time.monotonic(), 0.1))
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise TimeoutError(f'{url} not ready after {timeout}s')
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def writeSynthetic(directory: str, events: int, seed: int) -> None:
+    "fixtures of a synthetic dataset of each chain"
+    sys.path.insert(0, ROOT)
+    from tools.synthetic import Config, generate, writeFixtures
+
+    # the CoinGecko fixture is the one of mainnet, written last
+    for network in ('gnosis', 'mainnet'):
+        writeFixtures(generate(Config(events=events, seed=seed, network=network)), directory)
+
+
+def startStandIn(fixtures_dir: str, latency: float, jitter: float, log) -> Tuple[subprocess.Popen, str]:
+    port = freePort()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'tools.standin', '--fixtures', fixtures_dir, '--port', str(port),
+         '--latency', str(latency), '--jitter', str(jitter)],
+        cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    waitReady(f'{url}/api/v3/coins/ethereum', process, timeout=60)
+    return process, url
+
+
+def startApi(worker_class: str, workers: int, threads: int, standin_url: str,
+             boot_timeout: float, log) -> Tuple[subprocess.Popen, str]:
+    "gunicorn with gunicorn.conf.py, pointed to the stand-in"
+    port = freePort()
+    gunicorn_class, app = WORKER_CLASSES[worker_class]
+    env = dict(os.environ, BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers),
+               WORKER_CLASS=gunicorn_class, THREADS=str(threads),
+               SUBGRAPH_NODE=f'{standin_url}/query/', INDEX_NODE=f'{standin_url}/index-node/graphql',
+               COINGECKO_API=f'{standin_url}/api/v3/')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', app],
+                               cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    # the master loads the data before forking the workers
+    waitReady(f'{url}/status', process, timeout=boot_timeout)
+    return process, url
+
+
+def _send(session: requests.Session, url: str, path: str, scheduled: float, timeout: float) -> Record:
+    try:
+        status: Union[int, str] = session.get(url + path, timeout=timeout).status_code
+    except requests.RequestException as error:
+        status = type(error).__name__
+    return path, scheduled, time.perf_counter() - scheduled, status
+
+
+def replay(url: str, paths: List[str], weights: List[float], rate: float, concurrency: int,
+           duration: float, timeout: float, seed: int) -> Tuple[List[Record], int, float]:
+    """
+    send the mix for duration seconds, return the records, the requests not
+    sent and the start
+    """
+    start = time.perf_counter()
+    end = start + duration
+    records: List[Record] = []
+    not_sent = [0]
+    lock = threading.Lock()
+    scheduled: 'queue.Queue[Union[Tuple[float, str], None]]' = queue.Queue()
+
+    def client(number: int) -> None:
+        session = requests.Session()
+        draw = random.Random(seed + number)
+        sent: List[Record] = []
+        while True:
+            if rate > 0:
+                item = scheduled.get()
+                if item is None:
+                    break
+                at, path = item
+                if time.perf_counter() > end:
+                    with lock:
+                        not_sent[0] += 1
+                    continue
+            else:
+                at, path = time.perf_counter(), draw.choices(paths, weights)[0]
+                if at > end:
+                    break
+            sent.append(_send(session, url, path, at, timeout))
+        with lock:
+            records.extend(sent)
+
+    clients = [threading.Thread(target=client, args=(number,), daemon=True) for number in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    if rate > 0:
+        draw = random.Random(seed)
+        for number in range(int(duration * rate)):
+            at = start + number / rate
+            time.sleep(max(at - time.perf_counter(), 0))
+            scheduled.put((at, draw.choices(paths, weights)[0]))
+        time.sleep(max(end - time.perf_counter(), 0))
+        for _ in clients:
+            scheduled.put(None)
+    for thread in clients:
+        thread.join()
+    return records, not_sent[0], start
+
+
+def summary(records: List[Record], duration: float) -> Dict:
+    "throughput, latency percentiles and errors of the records"
+    if len(records) == 0:
+        return {'requests': 0}
+    latencies = np.array([latency for _, _, latency, _ in records]) * 1000
+    statuses: Dict[str, int] = {}
+    for _, _, _, status in records:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(1 for _, _, _, status in records if not isinstance(status, int) or status >= 400)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'requests': len(records), 'throughput_rps': len(records) / duration,
+            'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'max_ms': float(latencies.max()), 'error_rate': errors / len(records), 'statuses': statuses}
+
+
+def report(records: List[Record], not_sent: int, start: float, warmup: float, duration: float) -> Dict:
+    measured = [record for record in records if record[1] >= start + warmup]
+    window = duration - warmup
+    by_path: Dict[str, List[Record]] = {}
+    for record in measured:
+        by_path.setdefault(record[0], []).append(record)
+    return {'total': dict(summary(measured, window), not_sent=not_sent),
+            'paths': {path: summary(by_path[path], window) for path in sorted(by_path)}}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker-class', nargs='+', choices=list(WORKER_CLASSES), default=['gthread'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[2])
+    parser.add_argument('--threads', type=int, default=8, help='threads of the gthread workers')
+    parser.add_argument('--mix', nargs='+', default=MIX, metavar='PATH:WEIGHT')
+    parser.add_argument('--rate', type=float, default=20., help='requests per second, 0 for a closed loop')
+    parser.add_argument('--concurrency', type=int, default=16, help='clients sending the requests')
+    parser.add_argument('--duration', type=float, default=60., help='seconds of each run, with the warmup')
+    parser.add_argument('--warmup', type=float, default=10., help='seconds not reported')
+    parser.add_argument('--timeout', type=float, default=30., help='seconds of a request')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--fixtures', help='directory of the stand-in fixtures, a synthetic dataset if missing')
+    parser.add_argument('--events', type=int, default=100000, help='events of the synthetic dataset')
+    parser.add_argument('--latency', type=float, default=0., help='seconds of latency of the stand-in')
+    parser.add_argument('--jitter', type=float, default=0., help='random seconds added to the latency, up to')
+    parser.add_argument('--boot-timeout', type=float, default=300., help='seconds to load the data and boot')
+    parser.add_argument('--log', default=os.devnull, help='file of the output of the stand-in and gunicorn')
+    parser.add_argument('--output', help='json file of the report')
+    args = parser.parse_args()
+    if args.warmup >= args.duration:
+        parser.error('--warmup must be shorter than --duration')
+
+    paths, weights = parseMix(args.mix)
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp_dir, open(args.log, 'a') as log:
+        fixtures_dir = args.fixtures
+        if fixtures_dir is None:
+            fixtures_dir = os.path.join(tmp_dir, 'fixtures')
+            writeSynthetic(fixtures_dir, args.events, args.seed)
+        standin, standin_url = startStandIn(fixtures_dir, args.latency, args.jitter, log)
+        try:
+            for worker_class in args.worker_class:
+                for workers in args.workers:
+                    api, url = startApi(worker_class, workers, args.threads, standin_url, args.boot_timeout, log)
+                    try:
+                        records, not_sent, start = replay(url, paths, weights, args.rate, args.concurrency,
+                                                          args.duration, args.timeout, args.seed)
+                    finally:
+                        stop(api)
+                    run = {'worker_class': worker_class, 'workers': workers,
+                           'threads': args.threads if worker_class == 'gthread' else None}
+                    run.update(report(records, not_sent, start, args.warmup, args.duration))
+                    runs.append(run)
+                    print(f"{worker_class} x{workers}: {run['total'].get('throughput_rps', 0):.1f} req/s, "
+                          f"p99 {run['total'].get('p99_ms', float('nan')):.0f} ms, "
+                          f"errors {run['total'].get('error_rate', 0):.1%}", file=sys.stderr)
+        finally:
+            stop(standin)
+
+    result = {'mix': dict(zip(paths, weights)), 'rate': args.rate, 'concurrency': args.concurrency,
+              'duration': args.duration, 'warmup': args.warmup,
+              'dataset': args.fixtures or {'events': args.events, 'seed': args.seed},
+              'standin_latency': args.latency, 'runs': runs}
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            json.dump(result, report_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
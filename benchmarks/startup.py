@@ -0,0 +1,86 @@
+"""
+Startup benchmark of the API: cold import time of app.app and time to the
+first response (GET /status), each run in a fresh interpreter.
+
+    python benchmarks/startup.py --runs 5 --budget-import 1.5 --budget-first-response 2.0
+
+Prints a JSON report with the median of the runs and the modules with the
+most import time, and exits with 1 if a median is over its budget or if web3
+was imported at startup.
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUN = '''
+import json, sys, time
+start = time.perf_counter()
+import app.app
+imported = time.perf_counter()
+from werkzeug.test import Client
+response = Client(app.app.app).get('/status')
+responded = time.perf_counter()
+print(json.dumps({'import': imported - start,
+                  'first_response': responded - start,
+                  'status': response.status_code,
+                  'web3_loaded': 'web3' in sys.modules,
+                  'modules': len(sys.modules)}))
+'''
+
+
+def run(importtime: bool = False) -> Dict:
+    "one run in a fresh interpreter, with the -X importtime log if asked"
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', RUN]
+    process = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    if importtime:
+        result['slowest_modules'] = slowestModules(process.stderr)
+    return result
+
+
+def slowestModules(log: str, top: int = 10) -> List[Dict]:
+    "modules with the most self import time, from the -X importtime log"
+    modules = []
+    for line in log.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(),
+                        'self_ms': int(self_us) / 1000,
+                        'cumulative_ms': int(cumulative_us) / 1000})
+    return sorted(modules, key=lambda module: module['self_ms'], reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-import', type=float, default=1.5, help='seconds')
+    parser.add_argument('--budget-first-response', type=float, default=2.0, help='seconds')
+    args = parser.parse_args()
+
+    runs = [run() for _ in range(args.runs)]
+    report = {
+        'runs': args.runs,
+        'import_s': statistics.median(r['import'] for r in runs),
+        'first_response_s': statistics.median(r['first_response'] for r in runs),
+        'status': runs[-1]['status'],
+        'web3_loaded': any(r['web3_loaded'] for r in runs),
+        'modules': runs[-1]['modules'],
+        'budget_import_s': args.budget_import,
+        'budget_first_response_s': args.budget_first_response,
+        'slowest_modules': run(importtime=True)['slowest_modules'],
+    }
+    report['over_budget'] = (report['import_s'] > args.budget_import
+                             or report['first_response_s'] > args.budget_first_response)
+    print(json.dumps(report, indent=2))
+    return 1 if report['over_budget'] or report['web3_loaded'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
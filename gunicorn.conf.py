@@ -0,0 +1,31 @@
+# gunicorn -c gunicorn.conf.py app.app:app
+import os
+
+from prometheus_client import multiprocess
+
+from app.utils import dataset, executor, subgraph, utils
+
+bind = os.getenv('BIND', '0.0.0.0:8080')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+# uvicorn.workers.UvicornWorker to serve app.asgi:app, with the async routes
+worker_class = os.getenv('WORKER_CLASS', 'gthread')
+threads = int(os.getenv('THREADS', 8))
+# the app and the datasets are loaded once in the master and shared by the
+# workers copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    # runs in the master after loading the app, before forking the workers
+    server.log.info('Loading the snapshot and fetching the data since it')
+    dataset.warmStart()
+    utils.precomputeSeries()
+    # no threads nor pool processes of the master in the workers
+    executor.shutdown()
+    subgraph.shutdownPrefetch()
+
+
+def child_exit(server, worker):
+    # runs in the master: the live gauges of the dead worker aren't aggregated anymore
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
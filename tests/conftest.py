@@ -0,0 +1,52 @@
+from typing import Dict, List
+
+import pandas as pd
+import pytest
+
+from app.utils import addresses, dataset
+from app.utils.subgraph import KlerosBoardSubgraph, SubgraphError
+
+DAY = 24 * 3600
+
+
+def stakeSet(number: int, address: str, stake: int, day: int) -> Dict:
+    "a stakeSet as returned by the subgraph, stake in PNK"
+    wei = str(stake * 10**18)
+    return {'id': f'0x{number:x}-0', 'address': {'id': address}, 'subcourtID': '0',
+            'stake': wei, 'newTotalStake': wei, 'timestamp': str(1_600_000_000 + day * DAY)}
+
+
+class OfflineSubgraph(KlerosBoardSubgraph):
+    "the subgraph with the stake sets of the list, and nothing else"
+    stake_sets: List[Dict] = []
+    failing: bool = False
+
+    def getBlockNumber(self) -> int:
+        return len(self.stake_sets)
+
+    def getAllDisputesFrame(self) -> pd.DataFrame:
+        return self._parseDisputesFrame([])
+
+    def _getAllStakeSetsRaw(self, since: int = 0) -> List[Dict]:
+        if self.failing:
+            raise SubgraphError('A page of stakeSets failed')
+        return [stake_set for stake_set in self.stake_sets if int(stake_set['timestamp']) >= since]
+
+    def _getAllVotesRaw(self, since: int = 0) -> List[Dict]:
+        return []
+
+    def _getAllTransfersRaw(self, since: int = 0) -> List[Dict]:
+        return []
+
+    def _getAllDrawsRaw(self, since: int = 0) -> List[Dict]:
+        return []
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    monkeypatch.setattr(dataset, 'KlerosBoardSubgraph', OfflineSubgraph)
+    monkeypatch.setattr(dataset, 'store_dir', None)
+    monkeypatch.setattr(addresses, '_address_books', {})
+    monkeypatch.setattr(OfflineSubgraph, 'stake_sets', [])
+    monkeypatch.setattr(OfflineSubgraph, 'failing', False)
+    return OfflineSubgraph
@@ -0,0 +1,146 @@
+import pickle
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from app.utils import addresses, dataset, metrics, subgraph
+from app.utils.subgraph import SubgraphError
+from app.utils.utils import getActiveJurorsFromStakes, getTimeSerieStakesFromStakes
+from conftest import stakeSet
+
+
+def test_snapshot_then_delta_keeps_the_address_ids(offline):
+    offline.stake_sets = [stakeSet(1, '0xaa', 100, day=0), stakeSet(2, '0xbb', 200, day=1)]
+    chain_dataset = dataset.ChainDataset('mainnet')
+    chain_dataset.refresh()
+    snapshot = pickle.dumps(chain_dataset)
+
+    # a fresh process: the address book is empty until the snapshot is loaded
+    addresses._address_books.clear()
+    chain_dataset = pickle.loads(snapshot)
+    offline.stake_sets = offline.stake_sets + [stakeSet(3, '0xcc', 300, day=2),
+                                               stakeSet(4, '0xaa', 100, day=3)]
+    chain_dataset.refresh()
+
+    stake_sets = chain_dataset.frame('stake_sets')
+    assert stake_sets.groupby('address_id').ngroups == 3
+    active_jurors = getActiveJurorsFromStakes(stake_sets.copy())
+    assert sorted(active_jurors.index) == ['0xaa', '0xbb', '0xcc']
+    assert active_jurors['newTotalStake'].sum() == pytest.approx(600)
+    # the state before the last day, after the stake of 0xcc
+    stakes = getTimeSerieStakesFromStakes(stake_sets.copy(), 'D')
+    assert stakes['total_staked'].iloc[-1] == pytest.approx(600)
+    assert stakes['active_jurors'].iloc[-1] == 3
+
+
+def test_series_are_cached_until_the_data_changes(offline, monkeypatch):
+    offline.stake_sets = [stakeSet(1, '0xaa', 100, day=0)]
+    chain_dataset = dataset.ChainDataset('mainnet')
+    monkeypatch.setattr(dataset, '_datasets', {'mainnet': chain_dataset})
+    calls = []
+
+    @dataset.cachedSeries
+    def serie(chain: str, freq: str = 'M') -> int:
+        calls.append(freq)
+        return len(calls)
+
+    assert serie('mainnet') == serie('mainnet', freq='M') == 1
+    # a refresh without new entities keeps the series
+    version = chain_dataset.version
+    chain_dataset.refresh()
+    assert chain_dataset.version == version
+    assert serie('mainnet') == 1
+    offline.stake_sets = offline.stake_sets + [stakeSet(2, '0xbb', 200, day=1)]
+    chain_dataset.refresh()
+    assert chain_dataset.version == version + 1
+    assert serie('mainnet') == 2
+
+
+def test_series_cache_drops_the_least_recently_used(offline, monkeypatch):
+    chain_dataset = dataset.ChainDataset('mainnet')
+    chain_dataset.refresh()
+    monkeypatch.setattr(dataset, 'series_cache_size', 2)
+    for key in ('a', 'b', 'a', 'c'):
+        chain_dataset.cached(key, lambda: key, ('module', 'name', (), {}))
+    assert list(chain_dataset._series) == ['a', 'c']
+
+
+def test_a_failed_refresh_keeps_the_data(offline):
+    offline.stake_sets = [stakeSet(1, '0xaa', 100, day=0)]
+    chain_dataset = dataset.ChainDataset('mainnet')
+    chain_dataset.refresh()
+    frames, block, version = dict(chain_dataset._frames), chain_dataset.block, chain_dataset.version
+    offline.stake_sets = offline.stake_sets + [stakeSet(2, '0xbb', 200, day=1)]
+    offline.failing = True
+    with pytest.raises(SubgraphError):
+        chain_dataset.refresh()
+    assert chain_dataset._frames == frames
+    assert (chain_dataset.block, chain_dataset.version) == (block, version)
+
+
+def test_the_refresh_sets_the_lag_of_the_subgraph(offline, monkeypatch):
+    class Head():
+        def __init__(self, network: str) -> None:
+            self.web3 = SimpleNamespace(eth=SimpleNamespace(blockNumber=110))
+
+    monkeypatch.setattr(subgraph, 'web3Node', Head)
+    offline.stake_sets = [stakeSet(1, '0xaa', 100, day=0)]
+    chain_dataset = dataset.ChainDataset('gnosis')
+    chain_dataset.refresh()
+    assert metrics.subgraph_lag.labels('gnosis')._value.get() == 110 - chain_dataset.block
+
+
+def test_a_stale_dataset_is_refreshed_in_a_thread(offline, monkeypatch):
+    offline.stake_sets = [stakeSet(1, '0xaa', 100, day=0)]
+    chain_dataset = dataset.ChainDataset('mainnet')
+    chain_dataset.refresh()
+    offline.stake_sets = offline.stake_sets + [stakeSet(2, '0xbb', 200, day=1)]
+    monkeypatch.setattr(dataset, 'ttl', 0)
+    # the request gets the current data, the refresh runs meanwhile
+    assert len(chain_dataset.frame('stake_sets')) == 1
+    chain_dataset._refresher.join()
+    monkeypatch.setattr(dataset, 'ttl', 60)
+    assert len(chain_dataset.frame('stake_sets')) == 2
+
+
+def test_a_refresh_waiting_for_the_lock_is_not_made_again(offline, monkeypatch):
+    chain_dataset = dataset.ChainDataset('mainnet')
+    chain_dataset.refresh()
+    fetches = []
+    monkeypatch.setattr(chain_dataset, '_fetchDelta', lambda: fetches.append(1))
+    chain_dataset.refreshed_at = 0.
+    with chain_dataset._refresh_lock:
+        waiting = threading.Thread(target=chain_dataset.refresh, kwargs={'force': False})
+        waiting.start()
+        chain_dataset.refreshed_at = time.time()
+    waiting.join()
+    assert fetches == []
+
+
+def test_the_snapshot_is_saved_once_by_interval(offline, monkeypatch, tmp_path):
+    path = tmp_path / 'snapshot.pkl'
+    monkeypatch.setattr(dataset, 'snapshot_path', str(path))
+    monkeypatch.setattr(dataset, '_datasets', {})
+    dataset.getDataset('mainnet').refresh()
+    dataset._saveSnapshotIfDue()
+    saved = path.stat().st_mtime_ns
+    dataset._saveSnapshotIfDue()
+    assert path.stat().st_mtime_ns == saved
+    monkeypatch.setattr(dataset, 'snapshot_interval', -1)
+    dataset._saveSnapshotIfDue()
+    assert path.stat().st_mtime_ns > saved
+
+
+def test_the_address_book_is_found_after_a_concat(offline):
+    offline.stake_sets = [stakeSet(1, '0xaa', 100, day=0), stakeSet(2, '0xbb', 200, day=1)]
+    chain_dataset = dataset.ChainDataset('gnosis')
+    chain_dataset.refresh()
+    stake_sets = chain_dataset.frame('stake_sets')
+    # concat drops the attrs that aren't the same in all the frames
+    old, delta = stake_sets.iloc[:1], stake_sets.iloc[1:]
+    delta.attrs = {}
+    both = pd.concat([old, delta], ignore_index=True)
+    assert sorted(getActiveJurorsFromStakes(both).index) == ['0xaa', '0xbb']
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from app.utils import dataset, executor
+from conftest import stakeSet
+
+
+@pytest.fixture
+def exports(monkeypatch):
+    monkeypatch.setattr(executor, '_exported', {})
+    monkeypatch.setattr(executor, '_export_root', None)
+    yield
+    executor.shutdown()
+
+
+def test_the_frames_are_exported_again_only_when_they_change(offline, exports):
+    offline.stake_sets = [stakeSet(1, '0xaa', 100, day=0)]
+    chain_dataset = dataset.ChainDataset('mainnet')
+    chain_dataset.refresh()
+    published = executor._published(chain_dataset)
+    chain_dataset.refresh()
+    assert executor._published(chain_dataset) == published
+    offline.stake_sets = offline.stake_sets + [stakeSet(2, '0xbb', 200, day=1)]
+    chain_dataset.refresh()
+    root, generation = executor._published(chain_dataset)
+    assert (root, generation) != published
+    frames, _, meta = executor.ColumnarStore(root, 'mainnet').read(generation)
+    assert len(frames['stake_sets']) == 2
+    assert meta['version'] == chain_dataset.version
+
+
+def test_a_forked_process_exports_in_its_own_directory(offline, exports):
+    chain_dataset = dataset.ChainDataset('mainnet')
+    chain_dataset.refresh()
+    root, _ = executor._published(chain_dataset)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        child_root = ''
+        try:
+            child_root, _ = executor._published(chain_dataset)
+        finally:
+            os.write(write, child_root.encode())
+            os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    child_root = os.read(read, 4096).decode()
+    os.close(read)
+    assert child_root not in ('', root)
+    assert os.path.isdir(root)
+    executor._removeExports(os.getpid(), child_root)
@@ -0,0 +1,61 @@
+import time
+import tracemalloc
+
+import pytest
+
+from app.utils import memory
+
+MB = 2**20
+
+
+@pytest.fixture
+def budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(memory, 'budget', MB)
+    monkeypatch.setattr(memory, 'tracking', True)
+    monkeypatch.setattr(memory, 'check_interval', 0.01)
+    monkeypatch.setattr(memory, 'peaks_path', str(tmp_path / 'peaks.json'))
+    monkeypatch.setattr(memory, '_peaks', {})
+    monkeypatch.setattr(memory, '_loaded_at', 0.)
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    yield
+    if not tracing:
+        tracemalloc.stop()
+
+
+def test_a_call_over_the_budget_is_aborted(budget):
+    measure = memory.start('route', 'mainnet')
+    blocks = []
+    try:
+        with pytest.raises(memory.MemoryBudgetExceeded):
+            for _ in range(2000):
+                blocks.append(bytearray(100_000))
+                time.sleep(0.001)
+    finally:
+        memory.stop(measure)
+    assert len(blocks) < 2000
+    assert memory.lastPeak('route', 'mainnet') > MB
+    assert not memory.fits('route', 'mainnet')
+
+
+def test_a_call_within_the_budget_runs(budget):
+    measure = memory.start('route', 'mainnet')
+    blocks = [bytearray(1000) for _ in range(100)]
+    time.sleep(0.05)
+    assert memory.stop(measure) < MB
+    assert len(blocks) == 100
+    assert memory.fits('route', 'mainnet')
+
+
+def test_the_peaks_over_the_budget_are_shared(budget, monkeypatch):
+    measure = memory.start('route', 'mainnet')
+    measure.max = measure.start + 2 * MB
+    memory.stop(measure)
+    # another worker, or the next one after a restart
+    monkeypatch.setattr(memory, '_peaks', {})
+    monkeypatch.setattr(memory, '_loaded_at', 0.)
+    assert not memory.fits('route', 'mainnet')
+    assert memory.fits('other', 'mainnet')
+    monkeypatch.setattr(memory, 'retry_interval', 0)
+    assert memory.fits('route', 'mainnet')
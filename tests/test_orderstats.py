@@ -0,0 +1,50 @@
+import random
+from typing import List
+
+import pytest
+
+from app.utils.orderstats import OrderStatistics
+from app.utils.utils import gini
+
+
+def nakamoto(values: List[int]) -> int:
+    held = 0
+    for count, value in enumerate(sorted(values, reverse=True), start=1):
+        held += value
+        if 2 * held > sum(values):
+            return count
+    return 0
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_the_statistics_are_the_ones_of_the_sorted_values(seed):
+    rng = random.Random(seed)
+    # few distinct values, so many are equal, and zeros
+    universe = sorted({rng.randrange(0, 10**12) for _ in range(12)} | {0})
+    stats = OrderStatistics(universe)
+    values: List[int] = []
+    for _ in range(300):
+        if values and rng.random() < 0.4:
+            value = values.pop(rng.randrange(len(values)))
+            stats.remove(value)
+        else:
+            value = rng.choice(universe)
+            values.append(value)
+            stats.add(value)
+        ordered = sorted(values)
+        k = rng.randrange(len(values) + 2)
+        assert (stats.count, stats.total) == (len(values), sum(values))
+        assert stats.smallest(k) == sum(ordered[:k])
+        assert stats.largest(k) == sum(ordered[len(ordered) - min(k, len(ordered)):])
+        assert stats.nakamoto() == nakamoto(values)
+        if sum(values) > 0:
+            assert stats.gini() == pytest.approx(gini(ordered))
+
+
+def test_an_empty_multiset():
+    stats = OrderStatistics([1, 2])
+    assert (stats.smallest(3), stats.largest(3), stats.nakamoto()) == (0, 0, 0)
+    stats.add(2)
+    stats.remove(2)
+    assert stats.weighted == 0
+    assert stats.gini() != stats.gini()
@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from app.utils.singleflight import SingleFlight, share
+
+
+def test_the_concurrent_calls_are_coalesced():
+    flights = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow() -> list:
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return [{'juror': '0xaa', 'stakes': [1, 2]}]
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('key', slow)))
+    leader.start()
+    started.wait()
+    waiters = [threading.Thread(target=lambda: results.append(flights.do('key', slow))) for _ in range(4)]
+    for thread in waiters:
+        thread.start()
+    for thread in [leader] + waiters:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 5
+    # every caller gets its own copy, down to the nested lists
+    results[0][0]['stakes'].append(3)
+    assert all(result == [{'juror': '0xaa', 'stakes': [1, 2]}] for result in results[1:])
+    assert flights._calls == {}
+
+
+def test_the_error_of_the_leader_is_raised_to_the_waiters():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError('subgraph down')
+
+    try:
+        flights.do('key', fail)
+    except ValueError:
+        pass
+    assert flights._calls == {}
+
+
+def test_share_copies_the_containers():
+    frame = pd.DataFrame({'a': [1]})
+    result = {'frames': [frame], 'counts': {1, 2}}
+    shared = share(result)
+    shared['frames'][0].loc[0, 'a'] = 2
+    shared['counts'].add(3)
+    assert frame.loc[0, 'a'] == 1 and result['counts'] == {1, 2}
+
+
+def _computeOnce(store_dir: str, delay: float, results) -> None:
+    def compute() -> int:
+        time.sleep(delay)
+        return os.getpid()
+    results.put(SingleFlight(store_dir).do('key', compute))
+
+
+def test_the_processes_are_coalesced_and_the_files_removed(tmp_path):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    leader = context.Process(target=_computeOnce, args=(str(tmp_path), 0.5, results))
+    leader.start()
+    time.sleep(0.2)
+    waiter = context.Process(target=_computeOnce, args=(str(tmp_path), 0., results))
+    waiter.start()
+    leader.join()
+    waiter.join()
+    assert results.get() == results.get() == leader.pid
+    assert os.listdir(tmp_path) == []
+
+
+def test_a_call_without_waiters_leaves_no_files(tmp_path):
+    assert SingleFlight(str(tmp_path)).do('key', lambda: 1) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_a_waiter_makes_the_call_of_a_cancelled_leader():
+    flights = SingleFlight()
+    calls = []
+
+    async def slow() -> list:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [len(calls)]
+
+    async def main():
+        leader = asyncio.ensure_future(flights.doAsync('key', slow))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(flights.doAsync('key', slow)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(main()) == [[2]] * 3
+    assert len(calls) == 2
+    assert flights._async_calls == {}
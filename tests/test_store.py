@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.utils import addresses, dataset
+from app.utils.addresses import AddressBook
+from app.utils.store import ColumnarStore
+from conftest import stakeSet
+
+
+def transfers() -> pd.DataFrame:
+    return pd.DataFrame({'id': ['0x1-0', '0x2-0', '0x3-0'],
+                         'arbitrable': ['0xa', '0xb', '0xa'],
+                         'address_id': np.array([0, 1, 0], dtype=np.int32),
+                         'ETHAmount': [1., 2., 3.]})
+
+
+def test_the_readers_map_the_strings_and_leave_the_ids_out(tmp_path):
+    store = ColumnarStore(str(tmp_path), 'mainnet')
+    generation = store.write({'transfers': transfers()}, np.array(['0xaa', '0xbb'], dtype=object), {})
+    frames, book, _ = store.read(generation, lazy=True)
+    frame = frames['transfers']
+    assert list(frame.columns) == ['arbitrable', 'address_id', 'ETHAmount']
+    assert isinstance(frame['arbitrable'].dtype, pd.CategoricalDtype)
+    assert list(frame['arbitrable'].astype(str)) == ['0xa', '0xb', '0xa']
+    assert book.dtype.kind == 'S'
+    frames, _, _ = store.read(generation)
+    assert list(frames['transfers']['id'].astype(str)) == ['0x1-0', '0x2-0', '0x3-0']
+    assert list(frames['transfers']['arbitrable'].astype(str)) == ['0xa', '0xb', '0xa']
+
+
+def test_a_new_generation_replaces_the_one_before_last(tmp_path):
+    store = ColumnarStore(str(tmp_path), 'mainnet')
+    generations = [store.write({'transfers': transfers().iloc[:size]}, np.array([], dtype=object), {'size': size})
+                   for size in (1, 2, 3)]
+    assert store.current() == generations[-1]
+    assert sorted(name for name in os.listdir(store.path) if name.startswith('gen-')) == generations[1:]
+    assert store.read(store.current())[2]['size'] == 3
+
+
+def test_an_adopted_book_decodes_only_the_ids_asked():
+    book = AddressBook()
+    book.encode(['0xAA'])
+    assert book.adopt(np.array([b'0xaa', b'0xbb']))
+    assert list(book[[1, 0]]) == ['0xbb', '0xaa']
+    assert book._mapped is not None
+    # parsing a delta indexes it
+    assert list(book.encode(['0xcc', '0xbb'])) == [2, 1]
+    assert not book.adopt(np.array([b'0xbb']))
+
+
+def test_the_updater_merges_the_deltas_into_the_store(offline, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset, 'store_dir', str(tmp_path))
+    offline.stake_sets = [stakeSet(1, '0xaa', 100, day=0), stakeSet(2, '0xbb', 200, day=1)]
+    updater = dataset.ChainDataset('mainnet')
+    updater.refresh()
+    assert 'id' not in updater.frame('stake_sets').columns
+    offline.stake_sets = offline.stake_sets + [stakeSet(3, '0xcc', 300, day=1)]
+    monkeypatch.setattr(dataset, 'ttl', 0)
+    updater.refresh()
+    monkeypatch.setattr(dataset, 'ttl', 60)
+
+    addresses._address_books.clear()
+    reader = dataset.ChainDataset('mainnet')
+    reader.refresh()
+    stake_sets = reader.frame('stake_sets')
+    assert (reader.version, len(stake_sets)) == (updater.version, 3)
+    assert list(addresses.getAddressBook('mainnet')[stake_sets['address_id']]) == ['0xaa', '0xbb', '0xcc']
@@ -0,0 +1,117 @@
+import asyncio
+import json
+from typing import Dict, List
+
+import pytest
+
+from app.utils import async_subgraph, subgraph
+from app.utils.async_subgraph import AsyncKlerosBoardSubgraph
+from app.utils.subgraph import KlerosBoardSubgraph
+from tools.standin.entities import SubgraphFixture
+
+
+def stakeSets(count: int) -> List[Dict]:
+    return [{'id': f'0x{number:04x}-0', 'address': {'id': '0xaa'}, 'subcourtID': '0',
+             'stake': '0', 'newTotalStake': '0', 'timestamp': str(1_600_000_000 + number)}
+            for number in range(count)]
+
+
+class StandInSubgraph(KlerosBoardSubgraph):
+    "the subgraph answered in process by a fixture of the stand-in"
+
+    def __init__(self, fixture: SubgraphFixture) -> None:
+        super(StandInSubgraph, self).__init__(network='mainnet')
+        self.fixture: SubgraphFixture = fixture
+        self.queries: List[str] = []
+        # number of the query that fails, from 1
+        self.failing: int = 0
+        # number of the query before which the entities are created, from 1
+        self.inserting: int = 0
+        self.inserted: List[Dict] = []
+
+    def _postRaw(self, query) -> Dict:
+        self.queries.append(query)
+        if len(self.queries) == self.failing:
+            return {'errors': [{'message': 'indexer unavailable'}]}
+        if len(self.queries) == self.inserting:
+            self.insert(self.inserted)
+        return self.fixture.execute(query)
+
+    def insert(self, records: List[Dict]) -> None:
+        "create the entities in a new block"
+        block = self.fixture.block + 1
+        with self.fixture._lock:
+            self.fixture._load('stakeSets', [dict(record, _block=block) for record in records])
+            self.fixture._ordered_cache.clear()
+            self.fixture.meta['block'] = {'number': block}
+
+
+class AsyncStandInSubgraph(AsyncKlerosBoardSubgraph):
+    def __init__(self, fixture: SubgraphFixture) -> None:
+        super(AsyncStandInSubgraph, self).__init__(network='mainnet')
+        self.fixture: SubgraphFixture = fixture
+
+    async def _postRaw(self, query) -> Dict:
+        return self.fixture.execute(query)
+
+
+@pytest.fixture
+def fixture(tmp_path, monkeypatch):
+    "95 stake sets, walked in pages of 10 with anchors of 3 pages"
+    path = tmp_path / 'kleros.json'
+    path.write_text(json.dumps({'_meta': {'block': {'number': 100}, 'deployment': 'Qm'},
+                                'entities': {'stakeSets': stakeSets(95)}}))
+    monkeypatch.setattr(subgraph, 'max_skip', 20)
+    return SubgraphFixture(str(path))
+
+
+def pages() -> subgraph.Pages:
+    return KlerosBoardSubgraph._idPages('stakeSets', 'timestamp', first=10)
+
+
+@pytest.mark.parametrize('depth', [0, 1, 2, 4])
+def test_all_the_pages_are_walked_once(fixture, monkeypatch, depth):
+    monkeypatch.setattr(subgraph, 'prefetch_depth', depth)
+    kb = StandInSubgraph(fixture)
+    items = kb._paginate(pages())
+    assert [item['id'] for item in items] == [item['id'] for item in stakeSets(95)]
+    if depth == 0:
+        assert not any('skip' in query for query in kb.queries)
+
+
+@pytest.mark.parametrize('depth', [0, 2])
+def test_the_async_walk_is_the_same(fixture, monkeypatch, depth):
+    monkeypatch.setattr(subgraph, 'prefetch_depth', depth)
+    monkeypatch.setattr(async_subgraph, 'prefetch_depth', depth)
+    items = asyncio.run(AsyncStandInSubgraph(fixture)._paginate(pages()))
+    assert items == StandInSubgraph(fixture)._paginate(pages())
+
+
+def test_the_walk_stops_at_a_short_page(fixture, monkeypatch):
+    monkeypatch.setattr(subgraph, 'prefetch_depth', 2)
+    kb = StandInSubgraph(fixture)
+    walk = kb._iterPages(subgraph.KlerosBoardSubgraph._idPages('stakeSets', 'timestamp', first=100))
+    assert [len(page) for page in walk] == [95]
+    assert len([query for query in kb.queries if 'stakeSets' in query]) == 1
+
+
+@pytest.mark.parametrize('depth', [0, 2])
+def test_a_failed_page_raises(fixture, monkeypatch, depth):
+    monkeypatch.setattr(subgraph, 'prefetch_depth', depth)
+    kb = StandInSubgraph(fixture)
+    kb.failing = 5
+    with pytest.raises(subgraph.SubgraphError):
+        kb._paginate(pages())
+
+
+def test_the_entities_created_during_a_walk_are_in_the_next_one(fixture, monkeypatch):
+    monkeypatch.setattr(subgraph, 'prefetch_depth', 2)
+    kb = StandInSubgraph(fixture)
+    # ids between the ones of the first pages, after the first page was
+    # requested: they would shift the pages requested with a skip
+    kb.inserted = [dict(item, id=item['id'][:-1] + '1') for item in stakeSets(20)[::2]]
+    kb.inserting = 3
+    items = kb._paginate(pages())
+    assert [item['id'] for item in items] == [item['id'] for item in stakeSets(95)]
+    assert all('block:{number:100}' in query for query in kb.queries[1:])
+    assert len(kb._paginate(pages())) == 105
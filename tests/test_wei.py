@@ -0,0 +1,49 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils.wei import LIMB, WeiArray, parseWei
+
+
+def amounts(seed: int, n: int = 200):
+    rng = random.Random(seed)
+    # from a few wei to 10**7 ETH, of both signs: the partial sums stay in
+    # the int64 gwei of cumsum
+    return [rng.choice([-1, 1]) * rng.randrange(0, 10**rng.randrange(1, 26)) for _ in range(n)]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_the_parsed_amounts_are_exact(seed):
+    values = amounts(seed)
+    wei = parseWei([str(value) for value in values])
+    assert wei.toInts() == values
+    assert ((wei.lo >= 0) & (wei.lo < LIMB)).all()
+    assert wei.sum() == sum(values)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_the_arithmetic_is_exact(seed):
+    values, others = amounts(seed), amounts(seed + 10)
+    wei, other = parseWei(map(str, values)), parseWei(map(str, others))
+    assert (wei + other).toInts() == [a + b for a, b in zip(values, others)]
+    assert (wei - other).toInts() == [a - b for a, b in zip(values, others)]
+    assert (-wei).toInts() == [-value for value in values]
+    assert wei.cumsum().toInts() == list(np.cumsum(np.array(values, dtype=object)))
+    assert wei[::2].sum() == sum(values[::2])
+
+
+def test_the_sign_is_kept_in_eth():
+    wei = parseWei(['-1', '-1500000000000000000', '2500000000000000000', '0', None])
+    assert wei.toInts() == [-1, -1500000000000000000, 2500000000000000000, 0, 0]
+    assert list(wei.toEth()) == pytest.approx([-1e-18, -1.5, 2.5, 0., 0.])
+    assert list(np.sign(wei.toEth())) == [-1, -1, 1, 0, 0]
+    assert list(wei.isZero()) == [False, False, False, True, True]
+
+
+def test_the_columns_give_the_same_array():
+    wei = parseWei(['123456789012345678901', '-5'])
+    df = wei.toColumns(pd.DataFrame(index=range(2)), 'stake')
+    assert WeiArray.fromColumns(df, 'stake').toInts() == wei.toInts()
+    assert parseWei([]).sum() == 0
@@ -0,0 +1,17 @@
+"""
+Local stand-in of the subgraphs (KlerosBoard, PoH), the index node and the
+CoinGecko API, serving the queries of app/utils from fixture files, so the
+app, the benchmarks and the load tests run without the live endpoints:
+
+    python -m tools.standin --fixtures fixtures --port 8000
+    SUBGRAPH_NODE=http://localhost:8000/query/ \
+    INDEX_NODE=http://localhost:8000/index-node/graphql \
+    COINGECKO_API=http://localhost:8000/api/v3/ flask run
+
+With --record the requests are proxied to the real endpoints and the
+responses saved into the fixtures, see StandIn. --latency, --jitter,
+--error-rate and --errors inject delays and failures, see Faults.
+"""
+from tools.standin.coingecko import CoinGeckoFixture
+from tools.standin.entities import SubgraphFixture
+from tools.standin.server import Faults, StandIn, StandInServer
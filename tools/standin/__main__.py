@@ -0,0 +1,55 @@
+import argparse
+import logging
+import signal
+import threading
+
+from tools.standin.server import ERRORS, Faults, StandIn, StandInServer
+
+parser = argparse.ArgumentParser(prog='python -m tools.standin',
+                                 description='Local stand-in of the subgraphs and CoinGecko')
+parser.add_argument('--fixtures', default='fixtures', help='directory of the fixtures')
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8000)
+parser.add_argument('--record', action='store_true',
+                    help='proxy to the upstream endpoints and save the responses into the fixtures')
+parser.add_argument('--upstream-subgraph', default='https://api.studio.thegraph.com')
+parser.add_argument('--upstream-index-node', default='https://api.thegraph.com')
+parser.add_argument('--upstream-coingecko', default='https://api.coingecko.com')
+parser.add_argument('--save-interval', type=float, default=30.,
+                    help='seconds between the saves of the recorded fixtures')
+parser.add_argument('--latency', type=float, default=0., help='seconds added to every response')
+parser.add_argument('--jitter', type=float, default=0., help='random seconds added to the latency, up to')
+parser.add_argument('--error-rate', type=float, default=0., help='probability of an injected error')
+parser.add_argument('--errors', default=','.join(ERRORS), help='kinds of injected errors, comma separated')
+parser.add_argument('--timeout', type=float, default=120.,
+                    help='seconds without response of the timeout errors')
+parser.add_argument('--seed', type=int, default=None, help='seed of the latency and the errors')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+faults = Faults(args.latency, args.jitter, args.error_rate, args.errors.split(','), args.timeout, args.seed)
+upstream = {'subgraph': args.upstream_subgraph, 'index_node': args.upstream_index_node,
+            'coingecko': args.upstream_coingecko} if args.record else {}
+standin = StandIn(args.fixtures, faults, upstream)
+server = StandInServer((args.host, args.port), standin)
+stopped = threading.Event()
+
+
+def saveEvery() -> None:
+    while not stopped.wait(args.save_interval):
+        standin.save()
+
+
+if args.record:
+    threading.Thread(target=saveEvery, daemon=True).start()
+signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+logging.getLogger('tools.standin').info('Serving %s on %s%s', args.fixtures, server.url,
+                                        ' (recording)' if args.record else '')
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    stopped.set()
+    standin.save()
+    server.server_close()
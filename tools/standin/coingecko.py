@@ -0,0 +1,105 @@
+"""
+The CoinGecko endpoints used by app/utils/oracles.py, answered from the
+prices of a fixture <fixtures>/coingecko.json:
+
+    {"coins": {"kleros": {"prices": [[<timestamp ms>, <usd>], ...],
+                          "market_caps": [...], "total_volumes": [...],
+                          "market_data": {"current_price": {"usd": 0.02}, ...}}},
+     "recordings": {"<path and query>": {<response>}}}
+
+The market_data of a coin defaults to the one of its last price.
+"""
+from typing import Dict, List, Tuple, Union
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+import json
+import os
+import threading
+
+
+class CoinGeckoFixture():
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self._lock = threading.Lock()
+        data: Dict = {}
+        if os.path.isfile(path):
+            with open(path) as fixture_file:
+                data = json.load(fixture_file)
+        self.coins: Dict[str, Dict] = data.get('coins', {})
+        self.recordings: Dict[str, Dict] = data.get('recordings', {})
+        self.dirty: bool = False
+
+    def save(self) -> None:
+        with self._lock:
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as fixture_file:
+                json.dump({'coins': self.coins, 'recordings': self.recordings}, fixture_file)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    @staticmethod
+    def _key(url: str) -> str:
+        "path and sorted query of the url, the key of the recordings"
+        parts = urlsplit(url)
+        query = sorted((key, values[-1]) for key, values in parse_qs(parts.query).items())
+        return parts.path.split('/api/v3', 1)[-1] + '?' + '&'.join(f'{key}={value}' for key, value in query)
+
+    def get(self, url: str) -> Tuple[int, Dict]:
+        "status and body of the response"
+        recorded = self.recordings.get(self._key(url))
+        if recorded is not None:
+            return 200, recorded
+        parts = urlsplit(url)
+        path = parts.path.split('/api/v3', 1)[-1].strip('/').split('/')
+        args = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        if len(path) < 2 or path[0] != 'coins':
+            return 404, {'error': 'Not found'}
+        coin = self.coins.get(path[1])
+        if coin is None:
+            return 404, {'error': 'coin not found'}
+        if len(path) == 2:
+            return 200, {'id': path[1], 'market_data': self._marketData(coin)}
+        if path[2] == 'market_chart':
+            return 200, self._marketChart(coin, args.get('days', '1'))
+        if path[2] == 'history':
+            return self._history(coin, args.get('date'))
+        return 404, {'error': 'Not found'}
+
+    @staticmethod
+    def _marketData(coin: Dict) -> Dict:
+        if 'market_data' in coin:
+            return coin['market_data']
+        last = {serie: coin[serie][-1][1] if len(coin.get(serie) or []) > 0 else None
+                for serie in ('prices', 'market_caps', 'total_volumes')}
+        return {'current_price': {'usd': last['prices']}, 'price_change_24h': 0.,
+                'total_volume': {'usd': last['total_volumes']}, 'market_cap': {'usd': last['market_caps']}}
+
+    @staticmethod
+    def _marketChart(coin: Dict, days: str) -> Dict:
+        "the points of the last days, before the last price (the 'now' of the fixture)"
+        prices: List[List[float]] = coin.get('prices', [])
+        if days == 'max' or len(prices) == 0:
+            since = float('-inf')
+        else:
+            since = prices[-1][0] - float(days) * 86400000
+        return {serie: [point for point in coin.get(serie, []) if point[0] >= since]
+                for serie in ('prices', 'market_caps', 'total_volumes')}
+
+    @staticmethod
+    def _history(coin: Dict, date: Union[str, None]) -> Tuple[int, Dict]:
+        "the price of the day (dd-mm-yyyy, UTC), no market_data without one"
+        try:
+            day = datetime.strptime(date or '', '%d-%m-%Y').replace(tzinfo=timezone.utc)
+        except ValueError:
+            return 400, {'error': 'invalid date'}
+        start = day.timestamp() * 1000
+        prices = [price for timestamp, price in coin.get('prices', [])
+                  if start <= timestamp < start + 86400000]
+        if len(prices) == 0:
+            return 200, {}
+        return 200, {'market_data': {'current_price': {'usd': prices[0]}}}
+
+    def record(self, url: str, body: Dict) -> None:
+        with self._lock:
+            self.recordings[self._key(url)] = body
+            self.dirty = True
@@ -0,0 +1,383 @@
+"""
+The entities of a subgraph stand-in and the evaluation of the queries on
+them: where (with the _not, _gt, _gte, _lt, _lte, _in, _not_in, _contains,
+_not_contains, _starts_with, _ends_with suffixes, nested filters `field_`
+and `and`/`or`), first, skip, orderBy, orderDirection and block, with the
+limits of the hosted subgraphs.
+
+A fixture is a json file <fixtures>/<subgraph>.json:
+
+    {"_meta": {"block": {"number": 123}, "deployment": "Qm..."},
+     "refs": {"address": "jurors", "dispute": "disputes"},
+     "derived": {"jurors.stakes": ["stakeSets", "address"]},
+     "entities": {"stakeSets": [{"id": "0x1-0", "address": "0xabc", "_block": 100, ...}]},
+     "recordings": {"<query>": {<data>}}}
+
+Nested objects are stored inline or as the id of an entity of the
+collection of `refs` (by field name), the lists derived from another
+collection (@derivedFrom) are declared in `derived`. An entity can have
+several versions with the same id, the `_block` where each one starts: the
+queries with block:{number} see the last version at that block, the others
+the last one. A version without `_block` is the current one, and the one of
+the blocks without an earlier version. The fields starting with _ are never
+returned.
+"""
+from typing import Any, Dict, List, Tuple, Union
+import bisect
+import collections
+import json
+import os
+import re
+import threading
+
+from tools.standin.graphql import Field, GraphQLError, parse
+
+# the limits of the hosted subgraphs
+MAX_FIRST = 1000
+MAX_SKIP = 5000
+DEFAULT_FIRST = 100
+
+_MAX_ID = '\U0010ffff'
+# longest first, e.g. _not_in before _in
+_OPERATORS = ('not_contains', 'not_starts_with', 'not_ends_with', 'starts_with', 'ends_with',
+              'contains', 'not_in', 'not', 'gte', 'lte', 'gt', 'lt', 'in')
+_NUMBER = re.compile(r'^-?\d+(\.\d+)?([eE][+-]?\d+)?$')
+
+
+def _number(value: Any) -> Union[int, float]:
+    text = str(value)
+    return int(text) if text.lstrip('-').isdigit() else float(text)
+
+
+def _normalize(query: str) -> str:
+    "the query with its whitespace collapsed, the key of the recordings"
+    return ' '.join(query.split())
+
+
+class SubgraphFixture():
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.name: str = os.path.splitext(os.path.basename(path))[0]
+        self._lock = threading.RLock()
+        data: Dict = {}
+        if os.path.isfile(path):
+            with open(path) as fixture_file:
+                data = json.load(fixture_file)
+        self.meta: Dict = data.get('_meta', {'block': {'number': 0}, 'deployment': self.name})
+        self.refs: Dict[str, str] = data.get('refs', {})
+        self.derived: Dict[str, List[str]] = data.get('derived', {})
+        self.recordings: Dict[str, Dict] = data.get('recordings', {})
+        # collection: id: versions sorted by _block
+        self.versions: Dict[str, Dict[str, List[Dict]]] = {}
+        for collection, records in data.get('entities', {}).items():
+            self._load(collection, records)
+        self._numeric: Dict[Tuple[str, str], bool] = {}
+        # (collection, field, block): (records, keys), the last ones used
+        self._ordered_cache: 'collections.OrderedDict' = collections.OrderedDict()
+        self.dirty: bool = False
+
+    def _load(self, collection: str, records: List[Dict]) -> None:
+        by_id = self.versions.setdefault(collection, {})
+        for record in records:
+            by_id.setdefault(str(record['id']), []).append(record)
+        for versions in by_id.values():
+            versions.sort(key=self._start)
+
+    @staticmethod
+    def _start(record: Dict) -> float:
+        "the versions are sorted by their block, the current one last"
+        return record.get('_block', float('inf'))
+
+    @property
+    def block(self) -> int:
+        return int(self.meta.get('block', {}).get('number', 0))
+
+    def save(self) -> None:
+        with self._lock:
+            data = {'_meta': self.meta, 'refs': self.refs, 'derived': self.derived,
+                    'entities': {collection: [record for versions in by_id.values() for record in versions]
+                                 for collection, by_id in self.versions.items()},
+                    'recordings': self.recordings}
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as fixture_file:
+                json.dump(data, fixture_file)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    # queries
+
+    def execute(self, query: str) -> Dict:
+        "the response of the query, with data or errors"
+        recorded = self.recordings.get(_normalize(query))
+        if recorded is not None:
+            return {'data': recorded}
+        try:
+            fields = parse(query)
+            with self._lock:
+                return {'data': {field.alias: self._resolve(field) for field in fields}}
+        except GraphQLError as error:
+            return {'errors': [{'message': str(error)}]}
+
+    def _resolve(self, field: Field) -> Any:
+        block = field.args.get('block', {}).get('number')
+        if field.name == '_meta':
+            meta = dict(self.meta, block={'number': block if block is not None else self.block})
+            return self._project(meta, field.selections, block)
+        if field.name in self.versions:
+            return self._collection(field.name, field.args, field.selections, block)
+        if field.name + 's' in self.versions and 'id' in field.args:
+            # the single entity queries, e.g. court(id:"1")
+            record = self._get(field.name + 's', str(field.args['id']), block)
+            return None if record is None else self._project(record, field.selections, block)
+        raise GraphQLError(f'Type `Query` has no field `{field.name}`')
+
+    def _get(self, collection: str, id: str, block: Union[int, None]) -> Union[Dict, None]:
+        versions = self.versions.get(collection, {}).get(id)
+        return None if versions is None else self._version(versions, block)
+
+    @staticmethod
+    def _version(versions: List[Dict], block: Union[int, None]) -> Union[Dict, None]:
+        if block is None:
+            return versions[-1]
+        for record in reversed(versions):
+            if record.get('_block', float('inf')) <= block:
+                return record
+        return versions[-1] if '_block' not in versions[-1] else None
+
+    def _collection(self, collection: str, args: Dict, selections: List[Field],
+                    block: Union[int, None]) -> List[Dict]:
+        first, skip = args.get('first', DEFAULT_FIRST), args.get('skip', 0)
+        if not 0 <= first <= MAX_FIRST:
+            raise GraphQLError(f'The `first` argument must be between 0 and {MAX_FIRST}, but is {first}')
+        if not 0 <= skip <= MAX_SKIP:
+            raise GraphQLError(f'The `skip` argument must be between 0 and {MAX_SKIP}, but is {skip}')
+        order_by = str(args.get('orderBy', 'id'))
+        descending = args.get('orderDirection') == 'desc'
+        where = args.get('where', {})
+        records, keys = self._ordered(collection, order_by, block)
+
+        # the cursor conditions on the ordered field are found by bisection
+        start, end = 0, len(records)
+        for operator, side in (('gt', 'right'), ('gte', 'left'), ('lt', 'left'), ('lte', 'right')):
+            value = where.get(f'{order_by}_{operator}')
+            if value is None:
+                continue
+            probe = (0, self._value(collection, order_by, value)) + ((_MAX_ID,) if side == 'right' else ())
+            index = (bisect.bisect_right if side == 'right' else bisect.bisect_left)(keys, probe)
+            if operator in ('gt', 'gte'):
+                start = max(start, index)
+            else:
+                end = min(end, index)
+        indexes = range(end - 1, start - 1, -1) if descending else range(start, end)
+
+        selected = []
+        for index in indexes:
+            record = records[index]
+            if not self._matches(collection, record, where, block):
+                continue
+            if skip > 0:
+                skip -= 1
+                continue
+            if len(selected) == first:
+                break
+            selected.append(self._project(record, selections, block, collection))
+        return selected
+
+    def _ordered(self, collection: str, field: str, block: Union[int, None]) -> Tuple[List[Dict], List[Tuple]]:
+        "the records at the block sorted by the field and by id, and their sort keys"
+        cache_key = (collection, field, block)
+        cached = self._ordered_cache.get(cache_key)
+        if cached is not None:
+            self._ordered_cache.move_to_end(cache_key)
+            return cached
+        records = [record for record in (self._version(versions, block)
+                                         for versions in self.versions.get(collection, {}).values())
+                   if record is not None]
+        keyed = sorted(((self._sortKey(collection, field, record), record) for record in records),
+                       key=lambda pair: pair[0])
+        cached = [record for _, record in keyed], [key for key, _ in keyed]
+        self._ordered_cache[cache_key] = cached
+        while len(self._ordered_cache) > 16:
+            self._ordered_cache.popitem(last=False)
+        return cached
+
+    def _sortKey(self, collection: str, field: str, record: Dict) -> Tuple:
+        value = self._recordValue(record, field)
+        if value is None:
+            # nulls first
+            return (-1, 0 if self._isNumeric(collection, field) else '', str(record['id']))
+        return (0, self._value(collection, field, value), str(record['id']))
+
+    def _isNumeric(self, collection: str, field: str) -> bool:
+        "the ids are ordered as strings, the numeric strings (BigInt, BigDecimal) as numbers"
+        key = (collection, field)
+        if key not in self._numeric:
+            self._numeric[key] = field != 'id' and self._numericValues(
+                [self._recordValue(versions[-1], field) for versions in self.versions.get(collection, {}).values()])
+        return self._numeric[key]
+
+    @staticmethod
+    def _numericValues(values: List[Any]) -> bool:
+        values = [value for value in values if value is not None and not isinstance(value, list)]
+        return len(values) > 0 and all(
+            not isinstance(value, bool) and _NUMBER.match(str(value)) for value in values)
+
+    def _value(self, collection: str, field: str, value: Any) -> Any:
+        if isinstance(value, dict):
+            value = value.get('id')
+        if isinstance(value, bool) or value is None:
+            return value
+        return _number(value) if self._isNumeric(collection, field) else str(value)
+
+    @staticmethod
+    def _recordValue(record: Dict, field: str) -> Any:
+        "the value of the field, the id of a nested object"
+        value = record.get(field)
+        if isinstance(value, dict):
+            return value.get('id')
+        if isinstance(value, list):
+            return [item.get('id') if isinstance(item, dict) else item for item in value]
+        return value
+
+    def _matches(self, collection: str, record: Dict, where: Dict, block: Union[int, None]) -> bool:
+        for key, expected in where.items():
+            if key in ('and', 'or'):
+                results = [self._matches(collection, record, condition, block) for condition in expected]
+                if not (all(results) if key == 'and' else any(results)):
+                    return False
+                continue
+            if key.endswith('_') and isinstance(expected, dict):
+                # nested filter on the referenced entity
+                field = key[:-1]
+                nested = self._reference(field, record.get(field), block)
+                if nested is None or not self._matches(self.refs.get(field, field), nested, expected, block):
+                    return False
+                continue
+            field, operator = key, 'eq'
+            for candidate in _OPERATORS:
+                if key.endswith('_' + candidate):
+                    field, operator = key[:-len(candidate) - 1], candidate
+                    break
+            if not self._compare(collection, field, self._recordValue(record, field), operator, expected):
+                return False
+        return True
+
+    def _compare(self, collection: str, field: str, actual: Any, operator: str, expected: Any) -> bool:
+        if operator in ('contains', 'not_contains') and isinstance(actual, list):
+            found = all(item in actual for item in expected) if isinstance(expected, list) else expected in actual
+            return found == (operator == 'contains')
+        if operator in ('contains', 'not_contains', 'starts_with', 'not_starts_with', 'ends_with', 'not_ends_with'):
+            actual, expected = str(actual or ''), str(expected)
+            result = {'contains': expected in actual, 'starts_with': actual.startswith(expected),
+                      'ends_with': actual.endswith(expected)}[operator.replace('not_', '')]
+            return result != operator.startswith('not_')
+        actual = self._value(collection, field, actual)
+        if operator in ('in', 'not_in'):
+            found = actual in [self._value(collection, field, value) for value in expected]
+            return found == (operator == 'in')
+        expected = self._value(collection, field, expected)
+        if operator == 'eq':
+            return actual == expected
+        if operator == 'not':
+            return actual != expected
+        if actual is None or expected is None:
+            return False
+        try:
+            return {'gt': actual > expected, 'gte': actual >= expected,
+                    'lt': actual < expected, 'lte': actual <= expected}[operator]
+        except TypeError:
+            raise GraphQLError(f'Invalid value for {field}_{operator}: {expected!r}')
+
+    def _reference(self, field: str, value: Any, block: Union[int, None]) -> Union[Dict, None]:
+        "the nested object of the field, stored inline or by id"
+        if isinstance(value, dict):
+            return value
+        if value is None:
+            return None
+        if field in self.refs:
+            record = self._get(self.refs[field], str(value), block)
+            if record is not None:
+                return record
+        return {'id': value}
+
+    def _project(self, record: Dict, selections: List[Field], block: Union[int, None],
+                 collection: Union[str, None] = None) -> Dict:
+        projected = {}
+        for field in selections:
+            if field.name == '__typename':
+                projected[field.alias] = collection
+                continue
+            value = record.get(field.name)
+            derived = self.derived.get(f'{collection}.{field.name}')
+            if value is None and derived is not None:
+                # @derivedFrom: the entities of the collection that point to this one
+                target, target_field = derived
+                value = [item for item in (self._version(versions, block)
+                                           for versions in self.versions.get(target, {}).values())
+                         if item is not None and self._recordValue(item, target_field) == record['id']]
+            if field.name.startswith('_') or not field.selections:
+                projected[field.alias] = self._recordValue({field.name: value}, field.name) \
+                    if not field.name.startswith('_') else None
+                continue
+            if isinstance(value, list):
+                target = (derived or [self.refs.get(field.name, field.name)])[0]
+                items = [self._reference(field.name, item, block) for item in value]
+                projected[field.alias] = self._nested(target, items, field, block)
+            else:
+                nested = self._reference(field.name, value, block)
+                projected[field.alias] = None if nested is None else \
+                    self._project(nested, field.selections, block, self.refs.get(field.name))
+        return projected
+
+    def _nested(self, collection: str, items: List[Dict], field: Field, block: Union[int, None]) -> List[Dict]:
+        "a list field, with its own where, orderBy, first and skip"
+        where = field.args.get('where', {})
+        order_by = str(field.args.get('orderBy', 'id'))
+        items = [item for item in items if self._matches(collection, item, where, block)]
+        # ordered by the values of the items, they can be inline objects of a recording
+        numeric = order_by != 'id' and self._numericValues([self._recordValue(item, order_by) for item in items])
+
+        def sortKey(item: Dict) -> Tuple:
+            value = self._recordValue(item, order_by)
+            if value is None:
+                return (-1, 0 if numeric else '', str(item.get('id')))
+            return (0, _number(value) if numeric else str(value), str(item.get('id')))
+        items.sort(key=sortKey, reverse=field.args.get('orderDirection') == 'desc')
+        skip, first = field.args.get('skip', 0), field.args.get('first', DEFAULT_FIRST)
+        return [self._project(item, field.selections, block, collection) for item in items[skip:skip + first]]
+
+    # record mode
+
+    def record(self, query: str, data: Dict) -> None:
+        """save a response of the real subgraph: as a recording of the query
+        and, the entities of the collections, merged into the fixture"""
+        with self._lock:
+            self.recordings[_normalize(query)] = data
+            try:
+                fields = parse(query)
+            except GraphQLError:
+                fields = []
+            for field in fields:
+                value = data.get(field.alias)
+                if field.name == '_meta' and isinstance(value, dict):
+                    self.meta.update({key: item for key, item in value.items() if key != 'block'})
+                    if 'block' in value and 'block' not in field.args:
+                        self.meta['block'] = value['block']
+                elif isinstance(value, list) and all(isinstance(item, dict) and 'id' in item for item in value):
+                    block = field.args.get('block', {}).get('number')
+                    self._merge(field.name, value, block)
+            self._ordered_cache.clear()
+            self._numeric.clear()
+            self.dirty = True
+
+    def _merge(self, collection: str, records: List[Dict], block: Union[int, None]) -> None:
+        by_id = self.versions.setdefault(collection, {})
+        for record in records:
+            versions = by_id.setdefault(str(record['id']), [])
+            # the fields of the version, current or at the block, updated with the queried ones
+            existing = [version for version in versions if version.get('_block') == block]
+            if existing:
+                existing[0].update(record)
+            else:
+                versions.append(dict(record) if block is None else dict(record, _block=block))
+                versions.sort(key=self._start)
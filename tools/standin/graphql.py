@@ -0,0 +1,128 @@
+"""
+Parser of the subset of GraphQL used by the subgraph queries of the app:
+selections with aliases, arguments and nested selections, and the literal
+values (strings, numbers, booleans, null, enums, lists and objects). No
+variables, fragments or directives.
+"""
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple, Union
+import re
+
+_TOKEN = re.compile(r'''
+    (?P<skip>[\s,]+|\#[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<name>[_A-Za-z][_0-9A-Za-z]*)
+  | (?P<punct>[{}()\[\]:])
+''', re.VERBOSE)
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class Enum(str):
+    "an enum value, e.g. asc in orderDirection:asc"
+
+
+class Field(NamedTuple):
+    name: str
+    alias: str
+    args: Dict[str, Any]
+    selections: List['Field']
+
+
+def _tokens(query: str) -> Iterator[Tuple[str, str]]:
+    position = 0
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if match is None:
+            raise GraphQLError(f'Syntax Error: unexpected character {query[position]!r} at {position}')
+        position = match.end()
+        if match.lastgroup != 'skip':
+            yield match.lastgroup, match.group()
+
+
+class _Parser():
+    def __init__(self, query: str) -> None:
+        self.tokens: List[Tuple[str, str]] = list(_tokens(query))
+        self.position: int = 0
+
+    def peek(self) -> Union[Tuple[str, str], Tuple[None, None]]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None, None
+
+    def take(self, value: Union[str, None] = None) -> Tuple[str, str]:
+        kind, text = self.peek()
+        if kind is None or (value is not None and text != value):
+            raise GraphQLError(f'Syntax Error: expected {value or "a token"}, found {text or "the end"}')
+        self.position += 1
+        return kind, text
+
+    def document(self) -> List[Field]:
+        kind, text = self.peek()
+        if kind == 'name' and text in ('query', 'subscription'):
+            # operation type and optional name
+            self.take()
+            if self.peek()[0] == 'name':
+                self.take()
+        selections = self.selections()
+        if self.peek()[0] is not None:
+            raise GraphQLError(f'Syntax Error: unexpected {self.peek()[1]}')
+        return selections
+
+    def selections(self) -> List[Field]:
+        self.take('{')
+        fields = []
+        while self.peek()[1] != '}':
+            fields.append(self.field())
+        self.take('}')
+        return fields
+
+    def field(self) -> Field:
+        kind, name = self.take()
+        if kind != 'name':
+            raise GraphQLError(f'Syntax Error: expected a field name, found {name}')
+        alias = name
+        if self.peek()[1] == ':':
+            self.take(':')
+            name = self.take()[1]
+        args: Dict[str, Any] = {}
+        if self.peek()[1] == '(':
+            self.take('(')
+            while self.peek()[1] != ')':
+                arg = self.take()[1]
+                self.take(':')
+                args[arg] = self.value()
+            self.take(')')
+        selections = self.selections() if self.peek()[1] == '{' else []
+        return Field(name, alias, args, selections)
+
+    def value(self) -> Any:
+        kind, text = self.take()
+        if kind == 'string':
+            return re.sub(r'\\(.)', r'\1', text[1:-1])
+        if kind == 'number':
+            return float(text) if any(c in text for c in '.eE') else int(text)
+        if kind == 'name':
+            return {'true': True, 'false': False, 'null': None}.get(text, Enum(text))
+        if text == '[':
+            values = []
+            while self.peek()[1] != ']':
+                values.append(self.value())
+            self.take(']')
+            return values
+        if text == '{':
+            values = {}
+            while self.peek()[1] != '}':
+                key = self.take()[1]
+                self.take(':')
+                values[key] = self.value()
+            self.take('}')
+            return values
+        raise GraphQLError(f'Syntax Error: unexpected {text}')
+
+
+def parse(query: str) -> List[Field]:
+    "the top level fields of the query"
+    return _Parser(query).document()
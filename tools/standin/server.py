@@ -0,0 +1,202 @@
+"""
+The http server of the stand-in: the subgraphs (POST /query/<id>/<name>/...),
+the index node (POST /index-node/graphql) and CoinGecko (GET /api/v3/...).
+"""
+from typing import Dict, List, Tuple, Union
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+
+from tools.standin.coingecko import CoinGeckoFixture
+from tools.standin.entities import SubgraphFixture
+from tools.standin.graphql import GraphQLError, parse
+
+logger = logging.getLogger(__name__)
+
+ERRORS: List[str] = ['http500', 'graphql', '429', 'timeout']
+
+
+def subgraphName(path: str) -> str:
+    "e.g. klerosboard-mainnet of /query/66145/klerosboard-mainnet/version/latest"
+    return path.split('/version/')[0].rstrip('/').split('/')[-1]
+
+
+class Faults():
+    """
+    Latency and errors injected in the responses: every request waits the
+    latency plus a random jitter, and fails with probability error_rate with
+    one of the kinds of errors, chosen at random:
+        http500: a 500 response without json
+        graphql: a 200 response with errors and without data (500 in CoinGecko)
+        429: the rate limit response
+        timeout: no response until timeout seconds, then the connection is closed
+    """
+
+    def __init__(self, latency: float = 0., jitter: float = 0., error_rate: float = 0.,
+                 errors: Union[List[str], None] = None, timeout: float = 120.,
+                 seed: Union[int, None] = None) -> None:
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.errors: List[str] = errors or list(ERRORS)
+        unknown = set(self.errors) - set(ERRORS)
+        if unknown:
+            raise ValueError(f'Unknown errors {sorted(unknown)}, expected some of {ERRORS}')
+        self.timeout: float = timeout
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> Tuple[float, Union[str, None]]:
+        "delay and error of a request"
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            error = self._random.choice(self.errors) if self._random.random() < self.error_rate else None
+        return delay, error
+
+
+class StandIn():
+    """
+    The fixtures of the subgraphs and CoinGecko in a directory. With the
+    upstream urls (record mode) the requests are proxied and the responses
+    saved into the fixtures, as recordings of the exact requests, replayed
+    before anything else, and merged into the entities.
+    """
+
+    def __init__(self, fixtures_dir: str, faults: Union[Faults, None] = None,
+                 upstream: Union[Dict[str, str], None] = None) -> None:
+        self.fixtures_dir: str = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+        self.faults: Faults = faults or Faults()
+        # subgraph, index_node and coingecko: base url
+        self.upstream: Dict[str, str] = upstream or {}
+        self.subgraphs: Dict[str, SubgraphFixture] = {}
+        self.coingecko: CoinGeckoFixture = CoinGeckoFixture(os.path.join(fixtures_dir, 'coingecko.json'))
+        self._lock = threading.Lock()
+
+    def subgraph(self, name: str) -> SubgraphFixture:
+        with self._lock:
+            if name not in self.subgraphs:
+                self.subgraphs[name] = SubgraphFixture(os.path.join(self.fixtures_dir, f'{name}.json'))
+            return self.subgraphs[name]
+
+    def save(self) -> None:
+        "the fixtures changed by the recordings"
+        for fixture in list(self.subgraphs.values()) + [self.coingecko]:
+            if fixture.dirty:
+                fixture.save()
+
+    def query(self, path: str, query: str) -> Tuple[int, Dict]:
+        fixture = self.subgraph(subgraphName(path))
+        if 'subgraph' in self.upstream:
+            response = requests.post(self.upstream['subgraph'] + path, json={'query': query})
+            body = response.json()
+            if response.status_code == 200 and 'data' in body and 'errors' not in body:
+                fixture.record(query, body['data'])
+            return response.status_code, body
+        return 200, fixture.execute(query)
+
+    def indexNode(self, path: str, query: str) -> Tuple[int, Dict]:
+        "the indexing status, with the block of the fixture as chain head"
+        if 'index_node' in self.upstream:
+            response = requests.post(self.upstream['index_node'] + path, json={'query': query})
+            return response.status_code, response.json()
+        try:
+            fields = parse(query)
+        except GraphQLError as error:
+            return 200, {'errors': [{'message': str(error)}]}
+        data = {}
+        for field in fields:
+            if field.name != 'indexingStatusForCurrentVersion':
+                return 200, {'errors': [{'message': f'Type `Query` has no field `{field.name}`'}]}
+            block = {'number': str(self.subgraph(subgraphName(field.args.get('subgraphName', ''))).block)}
+            data[field.alias] = {'synced': True, 'health': 'healthy',
+                                 'chains': [{'chainHeadBlock': block, 'latestBlock': block}]}
+        return 200, {'data': data}
+
+    def coinGecko(self, url: str) -> Tuple[int, Dict]:
+        if 'coingecko' in self.upstream:
+            response = requests.get(self.upstream['coingecko'] + url)
+            body = response.json()
+            if response.status_code == 200:
+                self.coingecko.record(url, body)
+            return response.status_code, body
+        return self.coingecko.get(url)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: 'StandInServer'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(format, *args)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self._fault(graphql=True):
+            return
+        try:
+            query = json.loads(body)['query']
+        except (ValueError, KeyError, TypeError):
+            return self._send(400, {'errors': [{'message': 'The request has no query'}]})
+        standin = self.server.standin
+        if self.path.rstrip('/').endswith('/index-node/graphql'):
+            return self._send(*standin.indexNode(self.path, query))
+        self._send(*standin.query(self.path, query))
+
+    def do_GET(self) -> None:
+        if self._fault(graphql=False):
+            return
+        if not self.path.startswith('/api/v3/'):
+            return self._send(404, {'error': 'Not found'})
+        self._send(*self.server.standin.coinGecko(self.path))
+
+    def _fault(self, graphql: bool) -> bool:
+        "wait the latency and send the injected error, if any"
+        delay, error = self.server.standin.faults.draw()
+        if delay > 0:
+            time.sleep(delay)
+        if error is None:
+            return False
+        if error == 'timeout':
+            time.sleep(self.server.standin.faults.timeout)
+            self.close_connection = True
+        elif error == 'graphql' and graphql:
+            self._send(200, {'errors': [{'message': 'Injected error'}]})
+        elif error == '429':
+            self._send(429, {'status': {'error_code': 429, 'error_message': 'Injected rate limit'}})
+        else:
+            self._send(500, b'Internal Server Error')
+        return True
+
+    def _send(self, status: int, body: Union[Dict, bytes]) -> None:
+        content = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8' if isinstance(body, bytes) else 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], standin: StandIn) -> None:
+        super(StandInServer, self).__init__(address, Handler)
+        self.standin: StandIn = standin
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def serveInThread(self) -> threading.Thread:
+        "serve in a daemon thread, e.g. in a test or a benchmark"
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,13 @@
+"""
+Seeded generator of synthetic Kleros datasets, in the schema of the
+KlerosBoard subgraph, to test the app at scales far beyond the real history
+(10k to 50M events):
+
+    python -m tools.synthetic --events 1000000 --seed 1 --fixtures fixtures
+    python -m tools.synthetic --events 50000000 --store /tmp/store
+
+The fixtures are served by the local stand-in (tools/standin), the store is
+mapped by the app with STORE_DIR. See generator.py for the model.
+"""
+from tools.synthetic.generator import Config, SyntheticDataset, generate
+from tools.synthetic.writers import frames, writeFixtures, writeStore
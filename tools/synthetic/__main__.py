@@ -0,0 +1,42 @@
+import argparse
+import json
+import logging
+import time
+
+from tools.synthetic.generator import Config, generate
+from tools.synthetic.writers import writeFixtures, writeStore
+
+defaults = Config()
+parser = argparse.ArgumentParser(prog='python -m tools.synthetic',
+                                 description='Generate a synthetic Kleros dataset')
+parser.add_argument('--events', type=int, default=defaults.events,
+                    help='stake sets, disputes, draws, votes and transfers, approximately')
+parser.add_argument('--seed', type=int, default=defaults.seed)
+parser.add_argument('--network', choices=['mainnet', 'gnosis'], default=defaults.network)
+parser.add_argument('--start', type=int, default=defaults.start, help='first timestamp of the history')
+parser.add_argument('--days', type=int, default=defaults.days, help='days of history')
+parser.add_argument('--courts', type=int, default=defaults.courts)
+parser.add_argument('--growth', type=float, default=defaults.growth,
+                    help='e-folds of the activity growth over the history')
+parser.add_argument('--appeal-rate', type=float, default=defaults.appeal_rate)
+parser.add_argument('--fixtures', default=None, help='directory of the stand-in fixtures to write')
+parser.add_argument('--store', default=None, help='root of the columnar store to write (STORE_DIR)')
+args = parser.parse_args()
+if args.fixtures is None and args.store is None:
+    parser.error('nothing to write, give --fixtures and/or --store')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('tools.synthetic')
+config = Config(events=args.events, seed=args.seed, network=args.network, start=args.start,
+                days=args.days, courts=args.courts, growth=args.growth, appeal_rate=args.appeal_rate)
+start = time.perf_counter()
+dataset = generate(config)
+logger.info('Generated %s in %.1fs', json.dumps(dataset.counts()), time.perf_counter() - start)
+if args.fixtures is not None:
+    start = time.perf_counter()
+    paths = writeFixtures(dataset, args.fixtures)
+    logger.info('Wrote %s in %.1fs', ', '.join(paths), time.perf_counter() - start)
+if args.store is not None:
+    start = time.perf_counter()
+    generation = writeStore(dataset, args.store)
+    logger.info('Published %s/%s/%s in %.1fs', args.store, config.network, generation, time.perf_counter() - start)
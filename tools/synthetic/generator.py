@@ -0,0 +1,381 @@
+"""
+Seeded model of the activity of a Kleros court, generated in columns (numpy
+arrays) so it scales to tens of millions of events:
+
+- a court tree, with the time periods, min stakes, alphas and fees of each
+  court;
+- jurors arriving at a growing rate, staking in one to three courts, changing
+  their stakes and leaving (a final stake of 0 in each court) after a random
+  life;
+- disputes created at a growing rate, with their rounds (appeals double the
+  jurors), the draws of jurors staked in the court at the time, weighted by
+  their stake, and the votes, mostly coherent;
+- the token and ETH shifts of the ruled disputes: the penalties of the
+  incoherent jurors and the fees shared by the coherent ones;
+- the daily prices of PNK and ETH.
+
+The amounts are in gwei (int64) and wei below the gwei (the _lo arrays), as
+the limbs of WeiArray, and the times are unix timestamps (unit s).
+"""
+from typing import Dict, NamedTuple
+import math
+
+import numpy as np
+
+DAY = 86400
+periods = ['evidence', 'commit', 'vote', 'appeal', 'execution']
+# first block of the synthetic history and seconds between blocks
+blocks: Dict[str, Dict[str, int]] = {
+    'mainnet': {'genesis': 7_000_000, 'time': 13},
+    'gnosis': {'genesis': 16_000_000, 'time': 5}}
+GWEI = 10**9
+
+
+class Config(NamedTuple):
+    "the shape of a synthetic dataset, the same config and seed give the same dataset"
+    # stake sets, disputes, draws, votes and transfers, approximately
+    events: int = 100_000
+    seed: int = 0
+    network: str = 'mainnet'
+    # 2019-01-01 and days of history
+    start: int = 1546300800
+    days: int = 1461
+    courts: int = 24
+    # share of the events that are stake sets
+    stake_share: float = 0.4
+    # e-folds of the arrival rate of jurors and disputes over the history
+    growth: float = 1.5
+    # mean days a juror stays staked and mean changes of stake per court
+    juror_life: float = 400.
+    stake_updates: float = 2.
+    appeal_rate: float = 0.15
+    max_rounds: int = 4
+    # probability that a drawn juror votes, and votes coherently
+    turnout: float = 0.93
+    coherence: float = 0.8
+
+
+def jurorsInRound(round_number: np.ndarray) -> np.ndarray:
+    "3 jurors in the first round, 2n+1 in each appeal"
+    return 3 * 2**round_number + 2**round_number - 1
+
+
+class SyntheticDataset():
+    """
+    The entities of a synthetic chain, as dicts of columns:
+        courts: parent (-1 for the general court), timePeriods (courts x 4),
+            minStake, alpha, feeForJuror (gwei), jurorsForCourtJump, hiddenVotes
+        jurors: address, arrival, exit
+        stake_sets: key, juror, court, stake, newTotalStake (gwei), timestamp
+        disputes: court, arbitrable, choices, rounds (planned), realized (the
+            ones started), ruling, startTime, duration (of a round), period
+            (index in periods), lastPeriodChange, ruled, currentRulling, executedAt
+        votes: dispute, round, voteId, juror, drawnAt, voted, choice (-1 if
+            not voted), timestamp, totalGasCost (wei)
+        transfers: vote (the row in votes), ETHAmount, tokenAmount, tokenAmount_lo
+            (gwei and wei below), timestamp
+        prices: timestamp (ms), pnk, eth, pnk_volume, eth_volume
+    The draws are the votes: one row per drawn juror.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.config: Config = config
+        self.start: int = config.start
+        self.end: int = config.start + config.days * DAY
+        self.courts: Dict[str, np.ndarray] = {}
+        self.jurors: Dict[str, np.ndarray] = {}
+        self.arbitrables: np.ndarray = np.array([], dtype=object)
+        self.stake_sets: Dict[str, np.ndarray] = {}
+        self.disputes: Dict[str, np.ndarray] = {}
+        self.votes: Dict[str, np.ndarray] = {}
+        self.transfers: Dict[str, np.ndarray] = {}
+        self.prices: Dict[str, np.ndarray] = {}
+
+    @property
+    def network(self) -> str:
+        return self.config.network
+
+    def blockNumber(self, timestamp):
+        "block of the timestamps, at the block time of the network"
+        chain = blocks.get(self.network, blocks['mainnet'])
+        return chain['genesis'] + (np.asarray(timestamp, dtype=np.int64) - self.start) // chain['time']
+
+    @property
+    def block(self) -> int:
+        "the last block of the history"
+        return int(self.blockNumber(self.end))
+
+    def counts(self) -> Dict[str, int]:
+        return {'stake_sets': len(self.stake_sets['timestamp']), 'disputes': len(self.disputes['startTime']),
+                'draws': len(self.votes['timestamp']), 'votes': len(self.votes['timestamp']),
+                'transfers': len(self.transfers['timestamp']), 'jurors': len(self.jurors['address'])}
+
+
+def _times(rng: np.random.Generator, n: int, growth: float, start: int, end: int) -> np.ndarray:
+    "n sorted timestamps at a rate growing exponentially from start to end"
+    u = rng.random(n)
+    x = np.log1p(u * math.expm1(growth)) / growth if growth > 0 else u
+    return np.sort(start + (x * (end - start - 1)).astype(np.int64))
+
+
+def _addresses(rng: np.random.Generator, n: int) -> np.ndarray:
+    raw = rng.integers(0, 256, size=(n, 20), dtype=np.uint8)
+    return np.array(['0x' + row.tobytes().hex() for row in raw], dtype=object)
+
+
+def _popularity(n: int) -> np.ndarray:
+    "the general court and the first ones get most of the activity"
+    weights = 1 / np.arange(1, n + 1)**0.8
+    return weights / weights.sum()
+
+
+def generate(config: Config) -> SyntheticDataset:
+    "the dataset of the config, the same one for the same config and seed"
+    rng = np.random.default_rng(config.seed)
+    dataset = SyntheticDataset(config)
+    _courts(rng, dataset)
+    _stakes(rng, dataset)
+    _disputes(rng, dataset)
+    _draws(rng, dataset)
+    _transfers(dataset)
+    _prices(rng, dataset)
+    return dataset
+
+
+def _courts(rng: np.random.Generator, dataset: SyntheticDataset) -> None:
+    n = max(dataset.config.courts, 1)
+    parent = np.full(n, -1, dtype=np.int64)
+    # the tree is shallow and wide, as the real one
+    for court in range(1, n):
+        parent[court] = int(court * rng.random()**2)
+    hidden = rng.random(n) < 0.3
+    time_periods = np.stack([
+        rng.choice([3, 4, 5, 7], n) * DAY,
+        np.where(hidden, rng.choice([1, 2], n) * DAY, 0),
+        rng.choice([3, 4, 5], n) * DAY,
+        rng.choice([3, 4, 5], n) * DAY], axis=1).astype(np.int64)
+    min_stake = rng.choice([500, 1000, 2000, 5000, 10000, 20000], n).astype(np.int64) * GWEI
+    for court in range(1, n):
+        # a subcourt requires at least the min stake of its parent
+        min_stake[court] = max(min_stake[court], min_stake[parent[court]])
+    fees = [0.02, 0.03, 0.05, 0.1] if dataset.network == 'mainnet' else [5, 10, 15, 25]
+    dataset.courts = {
+        'parent': parent, 'timePeriods': time_periods, 'minStake': min_stake,
+        'alpha': rng.choice([2000, 3100, 5000, 10000], n).astype(np.int64),
+        'feeForJuror': (rng.choice(fees, n) * GWEI).astype(np.int64),
+        'jurorsForCourtJump': rng.choice([31, 63, 127, 511], n).astype(np.int64),
+        'hiddenVotes': hidden}
+
+
+def _expectedJurors(config: Config) -> float:
+    "expected draws of a dispute"
+    rounds = np.arange(config.max_rounds)
+    return float((config.appeal_rate**rounds * jurorsInRound(rounds)).sum())
+
+
+def _stakes(rng: np.random.Generator, dataset: SyntheticDataset) -> None:
+    config, start, end = dataset.config, dataset.start, dataset.end
+    courts = dataset.courts
+    n_courts = len(courts['parent'])
+    stake_sets = max(int(config.events * config.stake_share), 1)
+    # ~1.7 courts a juror, each one with the first stake, the changes and the final 0 of most
+    n_jurors = max(int(stake_sets / (1.7 * (1.6 + config.stake_updates))), 1)
+
+    arrival = _times(rng, n_jurors, config.growth, start, end)
+    exit = arrival + rng.exponential(config.juror_life * DAY, n_jurors).astype(np.int64)
+    # stake scale of each juror in PNK, a few whales
+    size = rng.lognormal(math.log(20000), 1.6, n_jurors)
+    dataset.jurors = {'address': _addresses(rng, n_jurors), 'arrival': arrival, 'exit': exit, 'size': size}
+
+    # the (juror, court) pairs, up to 3 courts a juror
+    picks = rng.choice(n_courts, size=(n_jurors, 3), p=_popularity(n_courts))
+    wanted = 1 + rng.binomial(2, 0.35, n_jurors)
+    keys = np.unique((np.arange(n_jurors)[:, None] * n_courts + picks)[np.arange(3)[None, :] < wanted[:, None]])
+    pair_juror, pair_court = keys // n_courts, keys % n_courts
+
+    # events of each pair: the first stake, the changes and the final 0 if the juror left
+    updates = rng.poisson(config.stake_updates, len(keys))
+    left = exit[pair_juror] < end
+    counts = 1 + updates + left
+    pair = np.repeat(np.arange(len(keys)), counts)
+    position = np.arange(len(pair)) - np.repeat(np.cumsum(counts) - counts, counts)
+    juror, court = pair_juror[pair], pair_court[pair]
+    first = np.minimum(arrival[juror] + rng.integers(0, 2 * DAY, len(pair)), end - 1)
+    last = np.maximum(np.minimum(exit[juror], end - 1), first)
+    timestamp = np.where(position == 0, first,
+                         first + (rng.random(len(pair)) * np.maximum(last - first, 0)).astype(np.int64))
+    final = left[pair] & (position == counts[pair] - 1)
+    timestamp = np.where(final, last, timestamp)
+    # whole PNK, at least the min stake of the court
+    pnk = np.maximum(np.round(size[juror] * rng.lognormal(0, 0.5, len(pair))), courts['minStake'][court] // GWEI)
+    stake = np.where(final, 0, pnk.astype(np.int64) * GWEI)
+
+    # the changes of a pair in time order, the stake before each one and the
+    # total of the juror in all the courts after it
+    order = np.lexsort((position, timestamp, pair))
+    pair, juror, court, timestamp, stake = pair[order], juror[order], court[order], timestamp[order], stake[order]
+    previous = np.concatenate([[0], stake[:-1]])
+    previous[np.concatenate([[True], pair[1:] != pair[:-1]])] = 0
+    by_juror = np.lexsort((np.arange(len(pair)), timestamp, juror))
+    delta = (stake - previous)[by_juror]
+    total = np.cumsum(delta)
+    group_start = np.concatenate([[True], juror[by_juror][1:] != juror[by_juror][:-1]])
+    base = np.maximum.accumulate(np.where(group_start, np.arange(len(total)), 0))
+    total = total - (total[base] - delta[base])
+    new_total = np.empty_like(total)
+    new_total[by_juror] = total
+
+    dataset.stake_sets = {'key': np.arange(len(pair)), 'juror': juror, 'court': court,
+                          'stake': stake, 'newTotalStake': new_total, 'timestamp': timestamp}
+
+
+def _disputes(rng: np.random.Generator, dataset: SyntheticDataset) -> None:
+    config, start, end, courts = dataset.config, dataset.start, dataset.end, dataset.courts
+    n_courts = len(courts['parent'])
+    remaining = max(config.events - len(dataset.stake_sets['timestamp']), 0)
+    # a dispute is itself, its draws, its votes and its transfers
+    n = max(int(remaining / (1 + 3 * _expectedJurors(config))), 1)
+
+    start_time = _times(rng, n, config.growth, start, end)
+    court = rng.choice(n_courts, n, p=_popularity(n_courts))
+    n_arbitrables = max(n // 100, 3)
+    dataset.arbitrables = _addresses(rng, n_arbitrables)
+    arbitrable = rng.choice(n_arbitrables, n, p=_popularity(n_arbitrables))
+    choices = np.where(rng.random(n) < 0.85, 2, rng.integers(3, 6, n))
+    rounds = np.minimum(rng.geometric(1 - config.appeal_rate, n), config.max_rounds)
+    ruling = rng.integers(1, choices + 1)
+
+    # rounds one after the other, each one with all its periods
+    duration = courts['timePeriods'][court].sum(axis=1)
+    realized = np.minimum(rounds, (end - 1 - start_time) // duration + 1)
+    executed_at = start_time + rounds * duration
+    ruled = executed_at <= end
+    # the period of the last round at the end of the history
+    last_round_start = start_time + (realized - 1) * duration
+    boundaries = np.cumsum(courts['timePeriods'][court], axis=1)
+    elapsed = end - last_round_start
+    period = np.where(ruled, 4, (boundaries <= elapsed[:, None]).sum(axis=1))
+    changed = np.where(period > 0, boundaries[np.arange(n), np.clip(period - 1, 0, 3)], 0)
+    last_period_change = np.where(ruled, executed_at, last_round_start + changed)
+    # the ruling is known once the votes of a round are counted
+    current_ruling = np.where(ruled | (realized > 1) | (period >= 3), ruling, 0)
+
+    dataset.disputes = {'court': court, 'arbitrable': arbitrable, 'choices': choices,
+                        'rounds': rounds, 'realized': realized, 'ruling': ruling,
+                        'startTime': start_time, 'duration': duration, 'period': period,
+                        'lastPeriodChange': last_period_change, 'ruled': ruled,
+                        'currentRulling': current_ruling, 'executedAt': executed_at}
+
+
+def _pools(dataset: SyntheticDataset, epochs: int):
+    """
+    the jurors staked in each court in each epoch, weighted by their stake
+    size, as (keys, jurors, cumulative weights) sorted by key = court x epoch.
+    The pseudo court n_courts has all the staked jurors.
+    """
+    start, end = dataset.start, dataset.end
+    n_courts = len(dataset.courts['parent'])
+    stakes, jurors = dataset.stake_sets, dataset.jurors
+    pairs = np.unique(stakes['juror'] * n_courts + stakes['court'])
+    juror, court = pairs // n_courts, pairs % n_courts
+    juror = np.concatenate([juror, np.unique(juror)])
+    court = np.concatenate([court, np.full(len(juror) - len(court), n_courts)])
+    first = (jurors['arrival'][juror] - start) * epochs // (end - start)
+    last = (np.minimum(jurors['exit'][juror], end - 1) - start) * epochs // (end - start)
+    counts = last - first + 1
+    row = np.repeat(np.arange(len(juror)), counts)
+    epoch = first[row] + np.arange(len(row)) - np.repeat(np.cumsum(counts) - counts, counts)
+    keys = court[row] * epochs + epoch
+    order = np.argsort(keys, kind='stable')
+    members = juror[row][order]
+    return keys[order], members, np.cumsum(jurors['size'][members])
+
+
+def _draws(rng: np.random.Generator, dataset: SyntheticDataset) -> None:
+    config, start, end = dataset.config, dataset.start, dataset.end
+    courts, disputes = dataset.courts, dataset.disputes
+    n_courts = len(courts['parent'])
+
+    # one row per drawn juror of the realized rounds
+    round_counts = disputes['realized']
+    dispute = np.repeat(np.arange(len(round_counts)), round_counts)
+    round_number = np.arange(len(dispute)) - np.repeat(np.cumsum(round_counts) - round_counts, round_counts)
+    jurors_counts = jurorsInRound(round_number)
+    row_dispute = np.repeat(dispute, jurors_counts)
+    row_round = np.repeat(round_number, jurors_counts)
+    vote_id = np.arange(len(row_dispute)) - np.repeat(np.cumsum(jurors_counts) - jurors_counts, jurors_counts)
+    court = disputes['court'][row_dispute]
+    round_start = disputes['startTime'][row_dispute] + row_round * disputes['duration'][row_dispute]
+    drawn_at = np.minimum(round_start + rng.integers(60, 3600, len(row_dispute)), end - 1)
+
+    # the jurors staked in the court at the time, else in any court
+    epochs = int(min(48, max(dataset.config.days // 30, 1)))
+    keys, members, weights = _pools(dataset, epochs)
+    epoch = (drawn_at - start) * epochs // (end - start)
+    juror = np.full(len(row_dispute), -1, dtype=np.int64)
+    for pool_court in (court, np.zeros_like(court), np.full_like(court, n_courts)):
+        missing = juror == -1
+        wanted = pool_court[missing] * epochs + epoch[missing]
+        low, high = np.searchsorted(keys, wanted, 'left'), np.searchsorted(keys, wanted, 'right')
+        found = high > low
+        below = np.where(low > 0, weights[np.maximum(low - 1, 0)], 0.)
+        target = below + rng.random(len(wanted)) * (weights[np.maximum(high - 1, 0)] - below)
+        picked = np.clip(np.searchsorted(weights, target, 'right'), low, np.maximum(high - 1, low))
+        juror[np.flatnonzero(missing)[found]] = members[np.minimum(picked, len(members) - 1)][found]
+    still = juror == -1
+    juror[still] = rng.integers(0, len(dataset.jurors['address']), still.sum())
+
+    # the votes, cast in the vote period if it started
+    periods_of = courts['timePeriods'][court]
+    vote_start = round_start + periods_of[:, 0] + periods_of[:, 1]
+    cast_at = vote_start + (rng.random(len(row_dispute)) * periods_of[:, 2]).astype(np.int64)
+    voted = (cast_at < end) & (rng.random(len(row_dispute)) < config.turnout)
+    ruling, choices = disputes['ruling'][row_dispute], disputes['choices'][row_dispute]
+    other = (ruling - 1 + rng.integers(1, choices)) % choices + 1
+    choice = np.where(rng.random(len(row_dispute)) < config.coherence, ruling, other)
+    gas_scale = 3e14 if dataset.network == 'mainnet' else 2e12
+    dataset.votes = {
+        'dispute': row_dispute, 'round': row_round, 'voteId': vote_id, 'juror': juror,
+        'drawnAt': drawn_at, 'voted': voted, 'choice': np.where(voted, choice, -1),
+        'timestamp': np.where(voted, cast_at, drawn_at),
+        'totalGasCost': np.where(voted, rng.lognormal(math.log(gas_scale), 0.6, len(row_dispute)), 0).astype(np.int64)}
+
+
+def _transfers(dataset: SyntheticDataset) -> None:
+    """
+    the shifts of the votes of the ruled disputes: the incoherent jurors lose
+    alpha x min stake, shared by the coherent ones with the fees. Without
+    coherent jurors in a round the fees are shared by all and nothing is
+    redistributed.
+    """
+    courts, disputes, votes = dataset.courts, dataset.disputes, dataset.votes
+    row = np.flatnonzero(disputes['ruled'][votes['dispute']])
+    dispute = votes['dispute'][row]
+    court = disputes['court'][dispute]
+    coherent = votes['voted'][row] & (votes['choice'][row] == disputes['ruling'][dispute])
+    penalty = courts['alpha'][court] * courts['minStake'][court] // 10**4
+
+    # the rounds of the votes, numbered in order
+    round_key = dispute * dataset.config.max_rounds + votes['round'][row]
+    _, round_index = np.unique(round_key, return_inverse=True)
+    n_coherent = np.bincount(round_index, weights=coherent)[round_index].astype(np.int64)
+    pot = np.bincount(round_index, weights=np.where(coherent, 0, penalty))[round_index].astype(np.int64)
+    nobody = n_coherent == 0
+    share, rest = np.divmod(pot, np.maximum(n_coherent, 1))
+    token = np.where(nobody, 0, np.where(coherent, share, -penalty))
+    # the wei below the gwei of the shares of the pot
+    token_lo = np.where(coherent & ~nobody, rest * 10**9 // np.maximum(n_coherent, 1), 0)
+    eth = np.where(coherent | nobody, courts['feeForJuror'][court], 0)
+    dataset.transfers = {'vote': row, 'ETHAmount': eth, 'tokenAmount': token, 'tokenAmount_lo': token_lo,
+                         'timestamp': disputes['executedAt'][dispute] - 1}
+
+
+def _prices(rng: np.random.Generator, dataset: SyntheticDataset) -> None:
+    "daily prices, geometric random walks"
+    days = dataset.config.days + 1
+    timestamp = (dataset.start + np.arange(days) * DAY) * 1000
+    pnk = 0.03 * np.exp(np.cumsum(rng.normal(0, 0.06, days)))
+    eth = 140 * np.exp(np.cumsum(rng.normal(0.0005, 0.04, days)))
+    dataset.prices = {'timestamp': timestamp, 'pnk': pnk, 'eth': eth,
+                      'pnk_volume': pnk * rng.lognormal(math.log(3e7), 0.7, days),
+                      'eth_volume': eth * rng.lognormal(math.log(1e7), 0.5, days)}
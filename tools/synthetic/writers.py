@@ -0,0 +1,328 @@
+"""
+Outputs of a synthetic dataset: the fixtures of the local stand-in
+(tools/standin), to run the app against it, or the columnar store of the
+chain (STORE_DIR), with the frames the app would fetch and parse.
+
+The json fixtures hold every entity in memory, they are meant for up to a few
+million events; the store is written from the columns directly.
+"""
+from typing import Dict, List
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from tools.synthetic.generator import GWEI, SyntheticDataset, periods
+
+
+def _hashes(values: np.ndarray, salt: int) -> np.ndarray:
+    "distinct pseudo random 64 bits of distinct values, e.g. for the transaction hashes"
+    x = (values.astype(np.uint64) + np.uint64(salt)) * np.uint64(0x9E3779B97F4A7C15)
+    return x ^ (x >> np.uint64(29))
+
+
+def _wei(hi: np.ndarray, lo=None) -> List[str]:
+    "decimal strings of the amounts in gwei and wei below"
+    if lo is None:
+        return [str(int(value) * GWEI) for value in hi]
+    return [str(int(high) * GWEI + int(low)) for high, low in zip(hi, lo)]
+
+
+def _sumBy(keys: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+    "exact int64 sums of the values of each key"
+    sums = np.zeros(n, dtype=np.int64)
+    np.add.at(sums, keys, values.astype(np.int64))
+    return sums
+
+
+def stakeSetIds(dataset: SyntheticDataset) -> np.ndarray:
+    stakes = dataset.stake_sets
+    hashes = _hashes(stakes['key'], 1)
+    return np.array([f'0x{hash:016x}-{court}' for hash, court in zip(hashes, stakes['court'])], dtype=object)
+
+
+def voteIds(dataset: SyntheticDataset) -> np.ndarray:
+    "the ids of the votes and of the draws, dispute-round-voteId"
+    votes = dataset.votes
+    return np.array([f'{dispute}-{round}-{vote}' for dispute, round, vote
+                     in zip(votes['dispute'], votes['round'], votes['voteId'])], dtype=object)
+
+
+def transferIds(dataset: SyntheticDataset) -> np.ndarray:
+    hashes = _hashes(dataset.transfers['vote'], 2)
+    return np.array([f'0x{hash:016x}-0' for hash in hashes], dtype=object)
+
+
+def _currentStakes(dataset: SyntheticDataset):
+    "the last stake of each (juror, court) and the last total of each juror"
+    stakes = dataset.stake_sets
+    n_courts = len(dataset.courts['parent'])
+    pair = stakes['juror'] * n_courts + stakes['court']
+    order = np.lexsort((stakes['timestamp'], pair))
+    last = order[np.concatenate([pair[order][1:] != pair[order][:-1], [True]])]
+    by_juror = np.lexsort((stakes['timestamp'], stakes['juror']))
+    last_total = by_juror[np.concatenate([stakes['juror'][by_juror][1:] != stakes['juror'][by_juror][:-1], [True]])]
+    total = np.zeros(len(dataset.jurors['address']), dtype=np.int64)
+    total[stakes['juror'][last_total]] = stakes['newTotalStake'][last_total]
+    return last, total
+
+
+def fixtures(dataset: SyntheticDataset) -> Dict:
+    "the fixture of the KlerosBoard subgraph of the chain, see tools/standin/entities.py"
+    courts, jurors, disputes = dataset.courts, dataset.jurors, dataset.disputes
+    stakes, votes, transfers = dataset.stake_sets, dataset.votes, dataset.transfers
+    address = jurors['address']
+    n_courts, n_jurors = len(courts['parent']), len(address)
+    block = dataset.blockNumber
+    last_stakes, total_staked = _currentStakes(dataset)
+
+    vote_ids = voteIds(dataset)
+    transfer_vote = transfers['vote']
+    transfer_juror = votes['juror'][transfer_vote]
+    transfer_dispute = votes['dispute'][transfer_vote]
+    transfer_court = disputes['court'][transfer_dispute]
+    rewards = np.where(transfers['tokenAmount'] > 0, transfers['tokenAmount'], 0)
+    rewards_lo = np.where(transfers['tokenAmount'] > 0, transfers['tokenAmount_lo'], 0)
+
+    drawn = np.unique(votes['juror'] * len(disputes['court']) + votes['dispute'])
+    disputes_as_juror = np.bincount(drawn // len(disputes['court']), minlength=n_jurors)
+    current_court = stakes['court'][last_stakes]
+    current_stake = stakes['stake'][last_stakes]
+
+    entities = {
+        'courts': [{
+            'id': str(court), 'subcourtID': str(court),
+            'parent': str(courts['parent'][court]) if courts['parent'][court] >= 0 else None,
+            'policy': {'id': str(court), 'policy': f'/ipfs/QmSynthetic{court}/policy.json'},
+            'timePeriods': [str(length) for length in courts['timePeriods'][court]],
+            'minStake': str(int(courts['minStake'][court]) * GWEI), 'alpha': str(courts['alpha'][court]),
+            'feeForJuror': str(int(courts['feeForJuror'][court]) * GWEI),
+            'jurorsForCourtJump': str(courts['jurorsForCourtJump'][court]),
+            'hiddenVotes': bool(courts['hiddenVotes'][court]),
+            'disputesNum': str(disputes_num), 'disputesClosed': str(closed),
+            'disputesOngoing': str(disputes_num - closed), 'activeJurors': str(active),
+            'tokenStaked': str(int(staked) * GWEI), 'totalETHFees': str(int(fees) * GWEI),
+            'totalTokenRedistributed': str(int(redistributed) * GWEI)}
+            for court, disputes_num, closed, active, staked, fees, redistributed in zip(
+                range(n_courts),
+                np.bincount(disputes['court'], minlength=n_courts),
+                np.bincount(disputes['court'], weights=disputes['ruled'], minlength=n_courts).astype(np.int64),
+                np.bincount(current_court, weights=current_stake > 0, minlength=n_courts).astype(np.int64),
+                _sumBy(current_court, current_stake, n_courts),
+                _sumBy(transfer_court, transfers['ETHAmount'], n_courts),
+                _sumBy(transfer_court, rewards, n_courts))],
+        'jurors': [{
+            'id': address[juror], 'totalStaked': str(int(total_staked[juror]) * GWEI),
+            'numberOfDisputesAsJuror': str(disputes_as_juror[juror]), 'numberOfDisputesCreated': '0',
+            'ethRewards': str(int(eth) * GWEI), 'tokenRewards': str(int(token) * GWEI + int(token_lo))}
+            for juror, eth, token, token_lo in zip(
+                range(n_jurors), _sumBy(transfer_juror, transfers['ETHAmount'], n_jurors),
+                _sumBy(transfer_juror, transfers['tokenAmount'], n_jurors),
+                _sumBy(transfer_juror, transfers['tokenAmount_lo'], n_jurors))],
+        'courtStakes': [{
+            'id': f'{address[juror]}-{court}', 'juror': address[juror], 'court': str(court),
+            'stake': str(int(stake) * GWEI), 'timestamp': str(timestamp),
+            'txid': f'0x{hash:016x}'}
+            for juror, court, stake, timestamp, hash in zip(
+                stakes['juror'][last_stakes], current_court, current_stake,
+                stakes['timestamp'][last_stakes], _hashes(stakes['key'][last_stakes], 1))],
+        'arbitrables': [{
+            'id': arbitrable, 'disputesCount': str(count), 'openDisputes': str(count - closed),
+            'closedDisputes': str(closed)}
+            for arbitrable, count, closed in zip(
+                dataset.arbitrables,
+                np.bincount(disputes['arbitrable'], minlength=len(dataset.arbitrables)),
+                np.bincount(disputes['arbitrable'], weights=disputes['ruled'],
+                            minlength=len(dataset.arbitrables)).astype(np.int64))],
+        'stakeSets': [{
+            'id': id, 'address': address[juror], 'subcourtID': str(court), 'stake': stake,
+            'newTotalStake': new_total, 'timestamp': str(timestamp), 'blockNumber': str(block_number)}
+            for id, juror, court, stake, new_total, timestamp, block_number in zip(
+                stakeSetIds(dataset), stakes['juror'], stakes['court'], _wei(stakes['stake']),
+                _wei(stakes['newTotalStake']), stakes['timestamp'], block(stakes['timestamp']))],
+        'disputes': [{
+            'id': str(dispute), 'disputeID': str(dispute), 'subcourtID': str(court),
+            'currentRulling': str(ruling), 'ruled': bool(ruled), 'startTime': str(start_time),
+            'period': periods[period], 'lastPeriodChange': str(last_change),
+            'arbitrable': dataset.arbitrables[arbitrable], 'numberOfChoices': str(choices),
+            'txid': f'0x{hash:016x}'}
+            for dispute, court, ruling, ruled, start_time, period, last_change, arbitrable, choices, hash in zip(
+                range(len(disputes['court'])), disputes['court'], disputes['currentRulling'],
+                disputes['ruled'], disputes['startTime'], disputes['period'], disputes['lastPeriodChange'],
+                disputes['arbitrable'], disputes['choices'], _hashes(np.arange(len(disputes['court'])), 3))],
+        'votes': [{
+            'id': id, 'dispute': str(dispute), 'address': address[juror],
+            'choice': str(choice) if choice >= 0 else None, 'voted': bool(voted),
+            'round': f'{dispute}-{round}', 'timestamp': str(timestamp), 'totalGasCost': str(gas)}
+            for id, dispute, round, juror, choice, voted, timestamp, gas in zip(
+                vote_ids, votes['dispute'], votes['round'], votes['juror'], votes['choice'],
+                votes['voted'], votes['timestamp'], votes['totalGasCost'])],
+        'draws': [{
+            'id': id, 'address': address[juror], 'disputeId': str(dispute),
+            'roundNumber': str(round), 'voteId': str(vote), 'timestamp': str(timestamp)}
+            for id, juror, dispute, round, vote, timestamp in zip(
+                vote_ids, votes['juror'], votes['dispute'], votes['round'], votes['voteId'],
+                votes['drawnAt'])],
+        'tokenAndETHShifts': [{
+            'id': id, 'address': address[juror], 'disputeId': str(dispute), 'ETHAmount': eth,
+            'tokenAmount': token, 'blockNumber': str(block_number), 'timestamp': str(timestamp)}
+            for id, juror, dispute, eth, token, block_number, timestamp in zip(
+                transferIds(dataset), transfer_juror, transfer_dispute, _wei(transfers['ETHAmount']),
+                _wei(transfers['tokenAmount'], transfers['tokenAmount_lo']),
+                block(transfers['timestamp']), transfers['timestamp'])],
+        'klerosCounters': [counters(dataset, total_staked)],
+    }
+    return {
+        '_meta': {'block': {'number': dataset.block}, 'deployment': f'QmSynthetic{dataset.config.seed}',
+                  'hasIndexingErrors': False},
+        'refs': {'address': 'jurors', 'juror': 'jurors', 'dispute': 'disputes', 'disputeId': 'disputes',
+                 'subcourtID': 'courts', 'court': 'courts', 'parent': 'courts', 'arbitrable': 'arbitrables'},
+        'derived': {'courts.childs': ['courts', 'parent'],
+                    'jurors.allStakes': ['stakeSets', 'address'],
+                    'jurors.currentStakes': ['courtStakes', 'juror'],
+                    'jurors.tokenAndETHShifts': ['tokenAndETHShifts', 'address'],
+                    'jurors.votes': ['votes', 'address'],
+                    'arbitrables.disputes': ['disputes', 'arbitrable']},
+        'entities': entities}
+
+
+def counters(dataset: SyntheticDataset, total_staked: np.ndarray) -> Dict:
+    "the klerosCounters entity at the end of the history"
+    disputes, transfers = dataset.disputes, dataset.transfers
+    ruled, period = disputes['ruled'], disputes['period']
+    rewards = np.where(transfers['tokenAmount'] > 0, transfers['tokenAmount'], 0)
+    # the fees in USD at the ETH price of the day they were paid
+    day = (transfers['timestamp'] - dataset.start) // 86400
+    usd = float((transfers['ETHAmount'] / GWEI * dataset.prices['eth'][day]).sum()) \
+        if dataset.network == 'mainnet' else float(transfers['ETHAmount'].sum() / GWEI)
+    return {
+        'id': 'ID', 'disputesCount': str(len(ruled)), 'openDisputes': str(int((~ruled).sum())),
+        'closedDisputes': str(int(ruled.sum())),
+        'appealPhaseDisputes': str(int((period == periods.index('appeal')).sum())),
+        'votingPhaseDisputes': str(int((period == periods.index('vote')).sum())),
+        'evidencePhaseDisputes': str(int((period == periods.index('evidence')).sum())),
+        'courtsCount': str(len(dataset.courts['parent'])), 'numberOfArbitrables': str(len(dataset.arbitrables)),
+        'activeJurors': str(int((total_staked > 0).sum())), 'inactiveJurors': str(int((total_staked == 0).sum())),
+        'drawnJurors': str(len(np.unique(dataset.votes['juror']))),
+        'tokenStaked': str(int(total_staked.sum()) * GWEI),
+        'totalTokenRedistributed': str(int(rewards.sum()) * GWEI + int(transfers['tokenAmount_lo'].sum())),
+        'totalETHFees': str(int(transfers['ETHAmount'].sum()) * GWEI),
+        'totalUSDthroughContract': str(int(usd))}
+
+
+def coingecko(dataset: SyntheticDataset) -> Dict:
+    "the fixture of the CoinGecko stand-in, see tools/standin/coingecko.py"
+    prices = dataset.prices
+    timestamp = prices['timestamp'].tolist()
+
+    def coin(price: np.ndarray, volume: np.ndarray, supply: float) -> Dict:
+        return {'prices': [list(point) for point in zip(timestamp, price.tolist())],
+                'market_caps': [list(point) for point in zip(timestamp, (price * supply).tolist())],
+                'total_volumes': [list(point) for point in zip(timestamp, volume.tolist())]}
+    return {'coins': {'kleros': coin(prices['pnk'], prices['pnk_volume'], 7.5e8),
+                      'ethereum': coin(prices['eth'], prices['eth_volume'], 1.2e8)}}
+
+
+def writeFixtures(dataset: SyntheticDataset, directory: str) -> List[str]:
+    "write the fixtures of the stand-in, return their paths"
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, data in ((f'klerosboard-{dataset.network}', fixtures(dataset)), ('coingecko', coingecko(dataset))):
+        path = os.path.join(directory, f'{name}.json')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as fixture_file:
+            json.dump(data, fixture_file)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def frames(dataset: SyntheticDataset) -> Dict[str, pd.DataFrame]:
+    """
+    the frames of the dataset of the chain, as the getAll*Frame methods parse
+    them, with the address ids of the address book of the chain
+    """
+    # imported here, the stand-in fixtures don't need the app
+    from app.utils.addresses import internAddresses
+    from app.utils.subgraph import KlerosBoardSubgraph
+    from app.utils.wei import WeiArray
+
+    courts, jurors, disputes = dataset.courts, dataset.jurors, dataset.disputes
+    stakes, votes, transfers = dataset.stake_sets, dataset.votes, dataset.transfers
+    address = jurors['address']
+
+    time_periods = {str(court): [str(length) for length in lengths]
+                    for court, lengths in enumerate(courts['timePeriods'])}
+    df_disputes = KlerosBoardSubgraph._parseDisputesFrame([{
+        'id': str(dispute), 'subcourtID': {'id': str(court)}, 'currentRulling': str(ruling),
+        'ruled': bool(ruled), 'startTime': str(start_time), 'period': periods[period],
+        'lastPeriodChange': str(last_change), 'arbitrable': {'id': dataset.arbitrables[arbitrable]}}
+        for dispute, court, ruling, ruled, start_time, period, last_change, arbitrable in zip(
+            range(len(disputes['court'])), disputes['court'], disputes['currentRulling'], disputes['ruled'],
+            disputes['startTime'], disputes['period'], disputes['lastPeriodChange'], disputes['arbitrable'])],
+        time_periods)
+
+    # the stake sets and the transfers are fetched by id, the votes and draws by timestamp
+    order = np.argsort(_hashes(stakes['key'], 1), kind='stable')
+    stake = WeiArray(stakes['stake'][order], np.zeros(len(order), dtype=np.int64))
+    new_total = WeiArray(stakes['newTotalStake'][order], np.zeros(len(order), dtype=np.int64))
+    df_stakes = pd.DataFrame({
+        'id': stakeSetIds(dataset)[order], 'address': address[stakes['juror'][order]],
+        'subcourtID': stakes['court'][order].astype('int32'),
+        'stake': stake.toEth(), 'newTotalStake': new_total.toEth(),
+        'timestamp': pd.to_datetime(stakes['timestamp'][order], unit='s')})
+    stake.toColumns(df_stakes, 'stake')
+    new_total.toColumns(df_stakes, 'newTotalStake')
+
+    vote_ids = voteIds(dataset)
+    dispute = votes['dispute']
+    choice = pd.array(np.where(votes['choice'] >= 0, votes['choice'], 0), dtype='Int64')
+    choice[votes['choice'] < 0] = pd.NA
+    gas = WeiArray(*np.divmod(votes['totalGasCost'], GWEI))
+    df_votes = pd.DataFrame({
+        'id': vote_ids, 'address': address[votes['juror']], 'choice': choice,
+        'voted': votes['voted'].astype(bool), 'timestamp': pd.to_datetime(votes['timestamp'], unit='s'),
+        'roundNumber': votes['round'].astype('int32'), 'disputeID': dispute.astype('int64'),
+        'subcourtID': disputes['court'][dispute].astype('int32'),
+        'currentRulling': pd.array(disputes['currentRulling'][dispute], dtype='Int64'),
+        'ruled': disputes['ruled'][dispute].astype(bool),
+        'startTime': pd.to_datetime(disputes['startTime'][dispute], unit='s'),
+        'totalGasCost': gas.toEth()})
+    df_votes = df_votes.sort_values(by=['timestamp', 'id'], kind='stable', ignore_index=True)
+
+    transfer_dispute = dispute[transfers['vote']]
+    order = np.argsort(_hashes(transfers['vote'], 2), kind='stable')
+    token = WeiArray(transfers['tokenAmount'], transfers['tokenAmount_lo'])
+    df_transfers = pd.DataFrame({
+        'id': transferIds(dataset), 'address': address[votes['juror'][transfers['vote']]],
+        'disputeID': transfer_dispute.astype('int64'),
+        'subcourtID': disputes['court'][transfer_dispute].astype('int32'),
+        'arbitrable': dataset.arbitrables[disputes['arbitrable'][transfer_dispute]],
+        'ETHAmount': WeiArray(transfers['ETHAmount'], np.zeros(len(order), dtype=np.int64)).toEth(),
+        'tokenAmount': token.toEth(),
+        'blockNumber': dataset.blockNumber(transfers['timestamp']).astype('int64'),
+        'timestamp': pd.to_datetime(transfers['timestamp'], unit='s')}).iloc[order].reset_index(drop=True)
+
+    df_draws = pd.DataFrame({
+        'id': vote_ids, 'address': address[votes['juror']], 'disputeId': dispute.astype('int64'),
+        'roundNumber': votes['round'].astype('int32'), 'voteId': votes['voteId'].astype('int32'),
+        'timestamp': pd.to_datetime(votes['drawnAt'], unit='s')})
+    df_draws = df_draws.sort_values(by=['timestamp', 'id'], kind='stable', ignore_index=True)
+
+    # interned in the order the dataset fetches them
+    result = {'disputes': df_disputes}
+    for name, df in (('stake_sets', df_stakes), ('votes', df_votes),
+                     ('transfers', df_transfers), ('draws', df_draws)):
+        result[name] = internAddresses(df, dataset.network)
+    return result
+
+
+def writeStore(dataset: SyntheticDataset, root: str) -> str:
+    "publish the frames as a generation of the columnar store of the chain, return its name"
+    from app.utils.addresses import getAddressBook
+    from app.utils.store import ColumnarStore
+
+    data = frames(dataset)
+    return ColumnarStore(root, dataset.network).write(
+        data, getAddressBook(dataset.network).addresses, {'block': dataset.block})